@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the PRD's non-functional requirements.
+
+Generates synthetic Workday-like clients (see synthetic.py) at each size,
+runs the full pipeline once per size in a fresh interpreter, and reports
+the time spent per phase (load, tiers 1-7, taxonomy lookup, export) and
+the peak resident memory. Exits non-zero when any NFR is breached:
+
+    NFR-01  classification < 15 s per 600K rows
+    NFR-02  total runtime (incl. Excel I/O) < 5 min per 600K rows
+    NFR-03  peak memory < 4 GB
+
+Time budgets scale linearly with the row count; the memory budget does
+not, so runs larger than ``--chunk-size`` rows are streamed in chunks.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 100000 600000 --json bench.json
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / 'src'))
+
+DEFAULT_SIZES = [100_000, 600_000, 5_000_000]
+NFR_ROWS = 600_000
+NFRS = [
+    # (id, measurement, budget, scales with rows, description)
+    ('NFR-01', 'classification_seconds', 15.0, True, 'Classification speed'),
+    ('NFR-02', 'total_seconds', 300.0, True, 'Total runtime (incl. output I/O)'),
+    ('NFR-03', 'peak_memory', 4 * 2**30, False, 'Peak memory'),
+]
+PHASES = [
+    ('load', 'Load input'),
+    ('tier1', 'Tier 1 SC code mapping'),
+    ('tier2', 'Tier 2 supplier refinement'),
+    ('tier3', 'Tier 3 keyword rules'),
+    ('tier4', 'Tier 4 context refinement'),
+    ('tier5', 'Tier 5 cost center refinement'),
+    ('tier6', 'Tier 6 ambiguous fallback'),
+    ('levels', 'Taxonomy lookup'),
+    ('tier7', 'Tier 7 supplier override'),
+    ('review', 'Review tier assignment'),
+    ('export', 'Export'),
+    ('other', 'Other (references, dedup, summary)'),
+]
+
+
+def peak_memory() -> int:
+    """Peak resident memory of this process in bytes."""
+    import categorize
+    return categorize.peak_memory()
+
+
+def run_once(config_path: str, output_format: str, chunk_size: int = None) -> dict:
+    """Run the CLI pipeline on one config in this process and return its measurements."""
+    import contextlib
+    import io
+    import categorize
+
+    config = categorize.load_config(config_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = categorize.main(config, chunk_size=chunk_size, output_format=output_format, tier_timings=True)
+
+    phases = {'load': stats['load_seconds'], 'export': stats['export_seconds']}
+    phases.update({tier['tier']: tier['seconds'] for tier in stats['tiers']})
+    phases['other'] = stats['total_seconds'] - sum(phases.values())
+    return {
+        'rows': stats['rows'],
+        'unique_keys': stats['unique_keys'],
+        'classification_seconds': stats['classification_seconds'],
+        'total_seconds': stats['total_seconds'],
+        'peak_memory': peak_memory(),
+        'phases': phases,
+    }
+
+
+def run_isolated(config_path: Path, output_format: str, chunk_size: int = None) -> dict:
+    """``run_once`` in a fresh interpreter, so peak memory belongs to this run alone."""
+    cmd = [sys.executable, __file__, '--run', str(config_path), '--format', output_format]
+    if chunk_size:
+        cmd += ['--chunk-size', str(chunk_size)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Benchmark run failed for {config_path}:\n{proc.stdout}{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check_nfrs(result: dict) -> list[dict]:
+    """Each NFR's budget for this run's row count, the measured value and whether it passed."""
+    checks = []
+    for nfr_id, measure, budget, scales, description in NFRS:
+        limit = budget * result['rows'] / NFR_ROWS if scales else budget
+        checks.append({'nfr': nfr_id, 'description': description, 'measured': result[measure],
+                       'limit': limit, 'passed': result[measure] < limit})
+    return checks
+
+
+def _format_measure(nfr_id: str, value: float) -> str:
+    return f"{value / 2**20:,.0f} MiB" if nfr_id == 'NFR-03' else f"{value:.1f}s"
+
+
+def print_report(results: list[dict]):
+    header = f"  {'Phase':38s}" + ''.join(f"{r['rows']:>14,}" for r in results)
+    print(f"\nPhase timings (seconds) by input rows:")
+    print(header)
+    for phase, label in PHASES:
+        print(f"  {label:38s}" + ''.join(f"{r['phases'].get(phase, 0.0):>14.2f}" for r in results))
+    print(f"  {'Classification':38s}" + ''.join(f"{r['classification_seconds']:>14.2f}" for r in results))
+    print(f"  {'Total':38s}" + ''.join(f"{r['total_seconds']:>14.2f}" for r in results))
+    print(f"  {'Peak memory (MiB)':38s}" + ''.join(f"{r['peak_memory'] / 2**20:>14,.0f}" for r in results))
+    print(f"  {'Unique classification keys':38s}" + ''.join(f"{r['unique_keys']:>14,}" for r in results))
+
+    print(f"\nNon-functional requirements:")
+    for r in results:
+        for check in r['checks']:
+            status = 'PASS' if check['passed'] else 'FAIL'
+            print(f"  {status}  {check['nfr']} {check['description']:32s} {r['rows']:>10,} rows: "
+                  f"{_format_measure(check['nfr'], check['measured']):>10s} "
+                  f"(limit {_format_measure(check['nfr'], check['limit'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the categorization pipeline against the PRD NFRs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Input sizes in rows (default: 100000 600000 5000000)')
+    parser.add_argument('--work-dir', default=None,
+                        help='Where synthetic clients and outputs go; generated inputs are reused '
+                             '(default: a temporary directory)')
+    parser.add_argument('--client-dir', default=None,
+                        help='Client whose reference files the data is drawn from (default: clients/cchmc)')
+    parser.add_argument('--format', default='xlsx', choices=['xlsx', 'parquet', 'feather', 'csv'],
+                        help='Output format to benchmark (default: xlsx, as in NFR-02)')
+    parser.add_argument('--chunk-size', type=int, default=NFR_ROWS,
+                        help=f'Stream inputs larger than this in chunks (default {NFR_ROWS:,}; 0 disables)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generator (default 0)')
+    parser.add_argument('--json', default=None, help='Also write the results to this JSON file')
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_once(args.run, args.format, args.chunk_size or None)))
+        return 0
+
+    import synthetic
+    client_dir = Path(args.client_dir) if args.client_dir else synthetic.DEFAULT_CLIENT
+    with tempfile.TemporaryDirectory(prefix='categorize_bench_') as tmp:
+        work_dir = Path(args.work_dir or tmp)
+        results = []
+        for rows in args.sizes:
+            print(f"Generating {rows:,}-row synthetic client...", flush=True)
+            config_path = synthetic.make_client(work_dir, rows, client_dir, args.seed)
+            print(f"Running {rows:,} rows ({args.format})...", flush=True)
+            chunk_size = args.chunk_size if args.chunk_size and rows > args.chunk_size else None
+            result = run_isolated(config_path, args.format, chunk_size)
+            result['format'] = args.format
+            result['chunk_size'] = chunk_size
+            result['checks'] = check_nfrs(result)
+            results.append(result)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    failed = [c['nfr'] for r in results for c in r['checks'] if not c['passed']]
+    if failed:
+        print(f"\nFAILED: {', '.join(sorted(set(failed)))}")
+        return 1
+    print("\nAll NFRs met.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
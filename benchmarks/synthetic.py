@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Synthetic Workday-like transaction generator for benchmarks.
+
+Builds a throwaway client directory around a real client's reference files:
+SC codes are drawn from its sc_code_mapping.yaml, and supplier, line memo,
+line of service and cost center strings are derived from its keyword and
+refinement patterns so that every tier of the waterfall has work to do.
+Invoice lines recur with a Zipf-like skew, as they do in AP extracts, so
+the dedup ratio is realistic. When the client's taxonomy workbook is not
+available, a taxonomy covering every referenced key is generated.
+
+Usage:
+    python benchmarks/synthetic.py --rows 600000 --out /tmp/bench
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CLIENT = ROOT / 'clients' / 'cchmc'
+
+# Share of distinct invoice lines that fall on ambiguous SC codes, and the
+# Zipf exponent of how often each distinct line recurs.
+AMBIGUOUS_SHARE = 0.35
+SKEW = 1.1
+
+GENERIC_SUPPLIERS = [
+    'Midwest Medical Supply', 'Tri-State Services', 'Queen City Office Products', 'Ohio Valley Electric',
+    'Buckeye Industrial', 'Great Lakes Scientific', 'Riverfront Consulting', 'Summit Healthcare Partners',
+    'Northstar Logistics', 'Keystone Facilities Group', 'Allied Distribution', 'Pioneer Technologies',
+]
+SUPPLIER_SUFFIXES = ['', '', ' Inc', ' LLC', ' Corp', ' Co']
+GENERIC_MEMOS = [
+    '', 'monthly service', 'misc', 'see attached', 'per contract', 'freight', 'net 30', 'reimbursement',
+    'annual renewal', 'credit memo', 'replacement parts', 'invoice adjustment',
+]
+MEMO_FILLER = ['qty', 'ea', 'per quote', 'dept', 'ship to', 'main campus', 'bldg', 'room', 'order', 'ref']
+SERVICES = ['LS01 Research', 'LS02 Cardiology', 'LS03 Surgery', 'LS04 Patient Care', 'LS05 Administration', '']
+CENTERS = ['CC1000 Pharmacy', 'CC2000 Radiology', 'CC3000 Information Services', 'CC4000 Finance',
+           'CC5000 Food Services', '']
+FUNDS = ['FD10 Operating', 'FD20 Grants', 'FD30 Capital', 'FD40 Endowment']
+COMPANIES = ['CO01 Medical Center', 'CO02 Research Foundation']
+
+# Columns a Workday extract carries that classification never reads
+UNUSED_COLUMNS = {
+    'Supplier ID': lambda rng, n: 'S' + pd.Series(rng.integers(10000, 99999, n)).astype(str),
+    'Currency': lambda rng, n: np.full(n, 'USD'),
+    'Requester': lambda rng, n: rng.choice(['J. Smith', 'A. Patel', 'M. Garcia', 'L. Chen', 'R. Jones'], n),
+    'Approver': lambda rng, n: rng.choice(['K. Brown', 'D. Wilson', 'S. Nguyen'], n),
+    'Ledger Account': lambda rng, n: rng.choice(['6100:Supplies', '6200:Services', '6300:Equipment'], n),
+    'Location': lambda rng, n: rng.choice(['Main Campus', 'Liberty Campus', 'Offsite'], n),
+    'Region': lambda rng, n: rng.choice(['RG01', 'RG02', 'RG03'], n),
+    'Project': lambda rng, n: rng.choice(['', 'PR1001', 'PR1002', 'PR2001'], n),
+    'Gift': lambda rng, n: rng.choice(['', 'GF100'], n),
+    'Tax Amount': lambda rng, n: np.round(rng.uniform(0, 50, n), 2),
+    'Due Date': lambda rng, n: (pd.Timestamp('2024-02-01') + pd.to_timedelta(rng.integers(0, 365, n), 'D'))
+                               .strftime('%m/%d/%Y'),
+    'Created By': lambda rng, n: rng.choice(['integration', 'ap_clerk1', 'ap_clerk2'], n),
+}
+
+
+def sample_strings(pattern: str) -> list[str]:
+    """Plain strings that a (simple) rule pattern matches, one per alternative."""
+    samples = []
+    for alt in pattern.split('|'):
+        if re.search(r'[\[\](){}?]|\\[dwsDWS]', alt):
+            continue
+        text = re.sub(r'\.[*+]', ' ', alt)
+        text = re.sub(r'\\b|[\^$]', '', text).replace('.', ' ')
+        text = re.sub(r'\\(.)', r'\1', text).replace('*', '').replace('+', '')
+        text = re.sub(r'\s+', ' ', text).strip()
+        if text:
+            samples.append(text)
+    return samples
+
+
+def load_reference(client_dir: Path) -> dict:
+    """The client's config and parsed reference YAML files."""
+    with open(client_dir / 'config.yaml', 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    reference = {'config': config}
+    for key in ('sc_mapping', 'keyword_rules', 'refinement_rules'):
+        path = (client_dir / config['paths'][key]).resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            reference[key] = yaml.safe_load(f)
+        reference[f'{key}_path'] = path
+    reference['taxonomy_path'] = (client_dir / config['paths']['taxonomy']).resolve()
+    return reference
+
+
+def taxonomy_keys(reference: dict) -> list[str]:
+    """Every taxonomy key the mapping and rule files point at."""
+    keys = {info['taxonomy_key'] for info in reference['sc_mapping']['mappings'].values()}
+    keys |= {rule['category'] for rule in reference['keyword_rules']['rules']}
+    for section, rules in reference['refinement_rules'].items():
+        keys |= {rule['taxonomy_key'] for rule in rules}
+    return sorted(keys)
+
+
+def write_taxonomy(reference: dict, path: Path):
+    keys = taxonomy_keys(reference)
+    levels = [(key.split(' > ') + [''] * 5)[:5] for key in keys]
+    pd.DataFrame({
+        'Key': keys,
+        **{f'CategoryLevel{i + 1}': [lv[i] for lv in levels] for i in range(5)},
+    }).to_excel(path, index=False)
+
+
+def _line_pool(reference: dict, size: int, rng: np.random.Generator) -> pd.DataFrame:
+    """``size`` distinct invoice lines: spend category, supplier, memo, line of service, cost center."""
+    mappings = reference['sc_mapping']['mappings']
+    refinement = reference['refinement_rules']
+    codes = sorted(str(code) for code in mappings)
+    ambiguous = sorted(str(code) for code, info in mappings.items() if info.get('ambiguous')) or codes
+
+    suppliers_by_sc = {}
+    for rule in refinement.get('supplier_rules', []):
+        for sc in rule['sc_codes']:
+            suppliers_by_sc.setdefault(str(sc), []).extend(sample_strings(rule['supplier_pattern']))
+    override_suppliers = [s for r in refinement.get('supplier_override_rules', [])
+                          for s in sample_strings(r['supplier_pattern'])]
+    keywords = [s for r in reference['keyword_rules']['rules'] for s in sample_strings(r['pattern'])]
+    services = SERVICES + [s for r in refinement.get('context_rules', [])
+                           for s in sample_strings(r['line_of_service_pattern'])]
+    centers = CENTERS + [f'CC{6000 + i} {s}' for i, s in enumerate(
+        s for r in refinement.get('cost_center_rules', []) for s in sample_strings(r['cost_center_pattern']))]
+
+    def pick(values):
+        return values[rng.integers(len(values))]
+
+    rows = []
+    for _ in range(size):
+        sc = pick(ambiguous) if rng.random() < AMBIGUOUS_SHARE else pick(codes)
+        name = mappings.get(sc, {}).get('name', 'Purchased Services')
+        form = rng.random()
+        spend_category = (f'{sc} {name}' if form < 0.9 else f'DNU {sc} {name}' if form < 0.95
+                          else 'Uncoded Spend')
+
+        draw = rng.random()
+        if sc in suppliers_by_sc and draw < 0.5:
+            supplier = pick(suppliers_by_sc[sc])
+        elif override_suppliers and draw < 0.6:
+            supplier = pick(override_suppliers)
+        elif draw < 0.75:
+            supplier = pick(keywords)
+        else:
+            supplier = pick(GENERIC_SUPPLIERS)
+        supplier = supplier.title() + pick(SUPPLIER_SUFFIXES)
+
+        draw = rng.random()
+        if draw < 0.45:
+            memo = pick(keywords)
+        elif draw < 0.55:
+            # Long memos keep unanchored ``.*`` patterns honest
+            filler = ' '.join(pick(MEMO_FILLER) for _ in range(rng.integers(10, 40)))
+            memo = f'{filler} {pick(keywords)} {rng.integers(1, 999)}'
+        else:
+            memo = pick(GENERIC_MEMOS)
+        if memo and rng.random() < 0.5:
+            memo = f'PO{rng.integers(4500000, 4599999)} {memo} qty {rng.integers(1, 50)}'
+
+        rows.append((spend_category, supplier, memo, pick(services), pick(centers)))
+    return pd.DataFrame(rows, columns=['Spend Category', 'Supplier', 'Line Memo', 'Line of Service',
+                                       'Cost Center'])
+
+
+def generate_transactions(reference: dict, n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """``n_rows`` synthetic invoice lines in the column layout of a Workday AP extract."""
+    rng = np.random.default_rng(seed)
+    pool = _line_pool(reference, int(min(max(n_rows // 8, 1000), 200_000)), rng)
+    weights = 1.0 / np.arange(1, len(pool) + 1) ** SKEW
+    lines = pool.take(rng.choice(len(pool), size=n_rows, p=weights / weights.sum())).reset_index(drop=True)
+
+    row = np.arange(n_rows)
+    line_amount = np.round(rng.lognormal(6.0, 1.6, n_rows) * np.where(rng.random(n_rows) < 0.03, -1, 1), 2)
+    invoice_date = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n_rows), 'D')
+    df = pd.DataFrame({
+        'Invoice Number': 'INV' + pd.Series(row // 3).astype(str).str.zfill(8),
+        'Invoice Line': row % 3 + 1,
+        'Invoice Date': invoice_date.strftime('%m/%d/%Y'),
+        'Invoice Status': rng.choice(['Approved', 'Approved', 'Approved', 'In Progress', 'Canceled'], n_rows),
+        'Invoice Amount': np.round(line_amount * rng.uniform(1, 3, n_rows), 2),
+        **{col: lines[col] for col in lines.columns},
+        'Invoice Line Amount': line_amount,
+        'Payment Status': rng.choice(['Paid', 'Paid', 'Unpaid', 'Partially Paid'], n_rows),
+        'Payment Type': rng.choice(['ACH', 'Check', 'Wire', 'PCard'], n_rows),
+        'Fund': rng.choice(FUNDS, n_rows),
+        'Program': rng.choice(['', 'PG100 Clinical', 'PG200 Research', 'PG300 Education'], n_rows),
+        'Grant': np.where(rng.random(n_rows) < 0.2, 'GR' + pd.Series(rng.integers(1000, 1200, n_rows))
+                          .astype(str), ''),
+        'Funding Source': rng.choice(['Internal', 'Federal', 'State', 'Philanthropy'], n_rows),
+        'PO Type': rng.choice(['Goods', 'Services', 'Non-PO'], n_rows),
+        'Spend Type': rng.choice(['Capital', 'Operating'], n_rows),
+        'Company': rng.choice(COMPANIES, n_rows),
+    })
+    for col, make in UNUSED_COLUMNS.items():
+        df[col] = make(rng, n_rows)
+    return df
+
+
+def make_client(root: Path, n_rows: int, client_dir: Path = DEFAULT_CLIENT, seed: int = 0) -> Path:
+    """Write a synthetic client (config, taxonomy if needed, input CSV) under ``root``; return its config path.
+
+    The input CSV is reused when one with the same size and seed already exists.
+    """
+    client_dir = Path(client_dir).resolve()
+    root = Path(root).resolve()
+    reference = load_reference(client_dir)
+    (root / 'data' / 'input').mkdir(parents=True, exist_ok=True)
+
+    taxonomy = reference['taxonomy_path']
+    if not taxonomy.exists():
+        taxonomy = root / 'data' / 'reference' / 'taxonomy.xlsx'
+        if not taxonomy.exists():
+            taxonomy.parent.mkdir(parents=True, exist_ok=True)
+            write_taxonomy(reference, taxonomy)
+
+    input_path = root / 'data' / 'input' / f'transactions_{n_rows}_seed{seed}.csv'
+    if not input_path.exists():
+        partial = input_path.with_suffix('.partial')
+        generate_transactions(reference, n_rows, seed).to_csv(partial, index=False)
+        partial.replace(input_path)
+
+    source = reference['config']
+    config = {
+        'client': {'name': 'BENCH', 'description': f'Synthetic {n_rows:,}-row extract based on {client_dir.name}'},
+        'paths': {
+            'input': str(input_path),
+            'sc_mapping': str(reference['sc_mapping_path']),
+            'taxonomy': str(taxonomy),
+            'keyword_rules': str(reference['keyword_rules_path']),
+            'refinement_rules': str(reference['refinement_rules_path']),
+            'output_dir': 'output',
+            'output_prefix': f'bench_{n_rows}',
+        },
+        'columns': source['columns'],
+        'classification': source['classification'],
+        'aggregations': source.get('aggregations', []),
+    }
+    config_path = root / f'config_{n_rows}.yaml'
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return config_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Workday-like client for benchmarking')
+    parser.add_argument('--rows', type=int, required=True, help='Number of invoice lines to generate')
+    parser.add_argument('--out', required=True, help='Directory for the synthetic client')
+    parser.add_argument('--client-dir', default=str(DEFAULT_CLIENT),
+                        help='Client whose reference files the data is drawn from (default: clients/cchmc)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default 0)')
+    args = parser.parse_args()
+    config_path = make_client(Path(args.out), args.rows, Path(args.client_dir), args.seed)
+    print(f"Synthetic client config: {config_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,33 +8,89 @@ Usage:
     python src/categorize.py --config clients/cchmc/config.yaml
     python src/categorize.py --config clients/cchmc/config.yaml --input override.csv
     python src/categorize.py --config clients/cchmc/config.yaml --output-dir /tmp
+    python src/categorize.py --config clients/cchmc/config.yaml --chunk-size 100000
+    python src/categorize.py --config clients/cchmc/config.yaml --workers 8
+    python src/categorize.py --config clients/cchmc/config.yaml --format parquet
+    python src/categorize.py --config clients/cchmc/config.yaml --profile
+    python src/categorize.py --config clients/cchmc/config.yaml --incremental
+    python src/categorize.py diff --config clients/cchmc/config.yaml --previous results.xlsx --old-rules old_rules.yaml
+    python src/categorize.py serve --config clients/cchmc/config.yaml --port 8765
+    python src/categorize.py batch "clients/*/config.yaml" --workers 4
+    python src/categorize.py --config clients/cchmc/config.yaml --validate-only
 """
 
+from __future__ import annotations
+
+import importlib
+import os
 import sys
 import re
+import json
+import pickle
+import hashlib
+import math
 import time
 import argparse
+import contextlib
+import glob
+import io
+import queue
+import threading
 import yaml
-import pandas as pd
-import numpy as np
 from pathlib import Path
-from collections import Counter
+from collections import Counter, OrderedDict, deque
 from datetime import datetime
 
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
 sys.stdout.reconfigure(encoding='utf-8')
 
 
+class _LazyModule:
+    """Stands in for a heavy module until first use, then replaces itself with it.
+
+    pandas and numpy are most of this script's startup time; ``--help`` and
+    ``--validate-only`` never touch them.
+    """
+
+    def __init__(self, name: str, alias: str):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+
+pd = _LazyModule('pandas', 'pd')
+np = _LazyModule('numpy', 'np')
+
+
 class ConfigError(Exception):
     pass
 
 
-def load_config(config_path: str, input_override: str = None, output_dir_override: str = None) -> dict:
+# libyaml's loader parses the rule files several times faster than the pure-Python one
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _safe_load_yaml(stream):
+    return yaml.load(stream, Loader=_YAML_LOADER)
+
+
+def load_config(config_path: str, input_override: str = None, output_dir_override: str = None,
+                require_input: bool = True) -> dict:
     config_path = Path(config_path).resolve()
     if not config_path.exists():
         raise ConfigError(f"Config file not found: {config_path}")
 
     with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f)
+        config = _safe_load_yaml(f)
 
     base_dir = config_path.parent
 
@@ -63,15 +119,42 @@ def load_config(config_path: str, input_override: str = None, output_dir_overrid
         resolved[key] = (base_dir / config['paths'][key]).resolve()
     resolved['output_dir'] = (base_dir / config['paths']['output_dir']).resolve()
     resolved['output_prefix'] = config['paths']['output_prefix']
+    resolved['cache_dir'] = base_dir / '.cache'
 
     if input_override:
         resolved['input'] = Path(input_override).resolve()
     if output_dir_override:
         resolved['output_dir'] = Path(output_dir_override).resolve()
+    metrics_history = config.get('output', {}).get('metrics_history')
+    resolved['metrics_history'] = ((base_dir / metrics_history).resolve() if metrics_history
+                                   else resolved['output_dir'] / 'metrics_history.jsonl')
 
     config['_resolved_paths'] = resolved
 
+    csv_engine = config.get('input', {}).get('engine', 'c')
+    if csv_engine not in CSV_ENGINES:
+        raise ConfigError(f"Invalid input.engine '{csv_engine}' (expected one of: {', '.join(CSV_ENGINES)})")
+    cache_max_mb = config.get('input', {}).get('cache_max_mb', INPUT_CACHE_MAX_MB)
+    if isinstance(cache_max_mb, bool) or not isinstance(cache_max_mb, (int, float)) or cache_max_mb <= 0:
+        raise ConfigError(f"Invalid input.cache_max_mb '{cache_max_mb}' (expected a positive number of MiB)")
+
+    regex_engine = config['classification'].get('regex_engine', 're')
+    if regex_engine not in REGEX_ENGINES:
+        raise ConfigError(f"Invalid classification.regex_engine '{regex_engine}' "
+                          f"(expected one of: {', '.join(REGEX_ENGINES)})")
+
+    cache_size = config['classification'].get('supplier_cache_size', SUPPLIER_CACHE_SIZE)
+    if not isinstance(cache_size, int) or isinstance(cache_size, bool) or cache_size < 0:
+        raise ConfigError(f"Invalid classification.supplier_cache_size '{cache_size}' "
+                          f"(expected a whole number of suppliers, 0 to disable)")
+
+    output_format = config.get('output', {}).get('format', 'xlsx')
+    if output_format not in OUTPUT_FORMATS:
+        raise ConfigError(f"Invalid output.format '{output_format}' (expected one of: {', '.join(OUTPUT_FORMATS)})")
+
     for key in ['input', 'sc_mapping', 'taxonomy', 'keyword_rules', 'refinement_rules']:
+        if key == 'input' and not require_input:
+            continue
         if not resolved[key].exists():
             raise ConfigError(f"File not found: {resolved[key]} (from paths.{key})")
 
@@ -80,7 +163,7 @@ def load_config(config_path: str, input_override: str = None, output_dir_overrid
 
 def load_sc_mapping(path: Path) -> dict[str, dict]:
     with open(path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f) or {}
+        data = _safe_load_yaml(f) or {}
 
     mapping = {}
     for sc_code, info in data.get('mappings', {}).items():
@@ -116,16 +199,9 @@ def build_taxonomy_lookup(taxonomy_df: pd.DataFrame) -> dict[str, dict]:
 
 def load_keyword_rules(path: Path) -> list[dict]:
     with open(path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f) or {}
+        data = _safe_load_yaml(f) or {}
     rules = data.get('rules', [])
-    for i, rule in enumerate(rules):
-        for key in ('pattern', 'category'):
-            if key not in rule:
-                raise ConfigError(f"keyword_rules[{i}] missing required key '{key}'")
-        try:
-            rule['_compiled'] = re.compile(rule['pattern'], re.IGNORECASE)
-        except re.error as e:
-            raise ConfigError(f"keyword_rules[{i}] invalid regex '{rule['pattern']}': {e}")
+    _validate_and_compile_rules(rules, 'keyword_rules', ('pattern', 'category'), 'pattern')
     return rules
 
 
@@ -138,377 +214,2016 @@ def _validate_and_compile_rules(rules, section_name, required_keys, pattern_key)
             rule['_compiled'] = re.compile(rule[pattern_key], re.IGNORECASE)
         except re.error as e:
             raise ConfigError(f"{section_name}[{i}] invalid regex '{rule[pattern_key]}': {e}")
+        if _REPEATED_GROUP.search(rule[pattern_key]) and _repeat_shape(rule[pattern_key])[1]:
+            hazard = regex_hazard(rule[pattern_key])
+            if hazard and hazard['kind'] == 'exponential':
+                raise ConfigError(f"{section_name}[{i}] regex '{rule[pattern_key]}' backtracks catastrophically: "
+                                  f"{_describe_hazard(hazard)}")
+
+
+def index_by_sc_code(scopes: list) -> dict[str, list[int]]:
+    """Inverted index from SC code to the positions of the rules scoped to it, in file order."""
+    index = {}
+    for i, codes in enumerate(scopes):
+        for sc in codes:
+            positions = index.setdefault(str(sc), [])
+            if not positions or positions[-1] != i:
+                positions.append(i)
+    return index
+
+
+REFINEMENT_SECTIONS = [
+    # (section, required keys, pattern key)
+    ('supplier_rules', ('sc_codes', 'supplier_pattern', 'taxonomy_key', 'confidence'), 'supplier_pattern'),
+    ('context_rules', ('sc_codes', 'line_of_service_pattern', 'taxonomy_key', 'confidence'), 'line_of_service_pattern'),
+    ('cost_center_rules', ('sc_codes', 'cost_center_pattern', 'taxonomy_key', 'confidence'), 'cost_center_pattern'),
+    ('supplier_override_rules', ('supplier_pattern', 'override_from_l1', 'taxonomy_key', 'confidence'),
+     'supplier_pattern'),
+]
 
 
 def load_refinement_rules(path: Path) -> dict:
     with open(path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f) or {}
+        data = _safe_load_yaml(f) or {}
 
-    supplier_rules = data.get('supplier_rules', [])
-    _validate_and_compile_rules(
-        supplier_rules, 'supplier_rules',
-        ('sc_codes', 'supplier_pattern', 'taxonomy_key', 'confidence'),
-        'supplier_pattern',
-    )
+    refinement = {}
+    for section, required_keys, pattern_key in REFINEMENT_SECTIONS:
+        refinement[section] = data.get(section, [])
+        _validate_and_compile_rules(refinement[section], section, required_keys, pattern_key)
 
-    context_rules = data.get('context_rules', [])
-    _validate_and_compile_rules(
-        context_rules, 'context_rules',
-        ('sc_codes', 'line_of_service_pattern', 'taxonomy_key', 'confidence'),
-        'line_of_service_pattern',
-    )
+    refinement['sc_index'] = {
+        section: index_by_sc_code([r['sc_codes'] for r in refinement[section]])
+        for section in ('supplier_rules', 'context_rules', 'cost_center_rules')
+    }
+    return refinement
+
+
+# Regex hazard lint. Every rule pattern is searched in every distinct
+# supplier, memo, line of service or cost center text, so a pattern whose
+# backtracking grows faster than the text turns one long memo into seconds.
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+_REPEATED_GROUP = re.compile(r'\)[*+{]')
+LINT_LENGTHS = (25, 50, 100, 200, 400, 800)
+LINT_EXPONENTIAL_LENGTHS = (12, 16, 20, 24)
+LINT_SLOW_SECONDS = 0.005
+LINT_DEADLINE_SECONDS = 10.0
+_LINT_CLASS_SAMPLES = {'d': '1', 'w': 'a', 's': ' '}
+
+
+def _repeat_shape(pattern: str) -> tuple[bool, bool]:
+    """Whether ``pattern`` can backtrack super-linearly, and whether it has nested unbounded repeats.
+
+    The first is an unbounded repeat followed by more pattern: a failing
+    search backtracks through it at every offset of the text.
+    """
+    backtracks = nested = False
+
+    def walk(items, inside: bool, followed: bool):
+        nonlocal backtracks, nested
+        items = list(items)
+        for k, (op, av) in enumerate(items):
+            tail = followed or k < len(items) - 1
+            if op in _REPEATS:
+                unbounded = av[1] == sre_constants.MAXREPEAT
+                if unbounded:
+                    nested = nested or inside
+                    backtracks = backtracks or tail
+                walk(av[2], inside or unbounded, tail)
+            elif op == sre_constants.SUBPATTERN:
+                walk(av[-1], inside, tail)
+            elif op == sre_constants.BRANCH:
+                for branch in av[1]:
+                    walk(branch, inside, tail)
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                walk(av[1], inside, tail)
+
+    walk(sre_parse.parse(pattern), False, False)
+    return backtracks, nested
+
+
+def _pump_units(pattern: str) -> list[str]:
+    """Units of text to repeat into adversarial samples for ``pattern``.
+
+    For each alternative with an unbounded repeat, its literal text up to the
+    last repeat, so the search keeps entering the repeat and never completes;
+    plus runs of letters and of digits.
+    """
+    units = []
+    for alternative in pattern.split('|'):
+        last = max(alternative.rfind('*'), alternative.rfind('+'), alternative.rfind(',}'))
+        if last < 0:
+            continue
+        prefix = re.sub(r'\\([dws])', lambda m: _LINT_CLASS_SAMPLES[m.group(1)], alternative[:last])
+        prefix = re.sub(r'\\(.)', r'\1', prefix)
+        prefix = re.sub(r'[.^$*+?()\[\]{}]', '', prefix)
+        if prefix:
+            units.append(prefix)
+    return list(dict.fromkeys(units + ['a', '1']))
+
+
+def _search_seconds(compiled, unit: str, length: int) -> float:
+    """Best of two searches of ``unit`` repeated to ``length`` chars, plus a NUL nothing matches.
+
+    A first search slower than ``LINT_SLOW_SECONDS`` is not repeated.
+    """
+    text = (unit * (length // len(unit) + 1))[:length] + '\0'
+    best = math.inf
+    for _ in range(2):
+        start = time.perf_counter()
+        compiled.search(text)
+        best = min(best, time.perf_counter() - start)
+        if best > LINT_SLOW_SECONDS:
+            break
+    return best
+
+
+def regex_hazard(pattern: str, deadline: float = None) -> dict:
+    """How badly ``pattern`` backtracks on adversarial text, or None when it stays fast.
+
+    Only patterns with an unbounded repeat that a failing search can
+    backtrack into are timed, on texts that repeat the pattern's own prefix
+    (see ``_pump_units``). Nested unbounded repeats are first timed on short
+    texts, where exponential backtracking already shows and cannot run away.
+    Otherwise each sample is timed at doubling ``LINT_LENGTHS``, stopping at
+    the first search slower than ``LINT_SLOW_SECONDS``, so one search costs
+    at most ``2**degree`` times the budget; the last two lengths give the
+    polynomial ``degree``. Quadratic patterns are common (``door.*install``)
+    and reported only when that budget is hit; cubic and worse always.
+    Timing stops at ``deadline`` (a ``time.perf_counter`` value), and the
+    pattern then counts as safe. Returns ``kind`` (``exponential`` or
+    ``polynomial``), ``degree``, the ``seconds`` and text ``length`` of the
+    slowest search, and the repeated ``sample``.
+    """
+    backtracks, nested = _repeat_shape(pattern)
+    if not backtracks:
+        return None
+    deadline = deadline or math.inf
+    compiled = re.compile(pattern, re.IGNORECASE)
+    units = _pump_units(pattern)
+    if nested:
+        for unit in units:
+            times = []
+            for length in LINT_EXPONENTIAL_LENGTHS:
+                times.append(_search_seconds(compiled, unit, length))
+                if times[-1] > 5 * LINT_SLOW_SECONDS or time.perf_counter() > deadline:
+                    break
+            if len(times) > 1 and times[-1] >= 0.001 and times[-1] >= 8 * times[-2]:
+                return {'kind': 'exponential', 'degree': math.inf, 'seconds': times[-1],
+                        'length': LINT_EXPONENTIAL_LENGTHS[len(times) - 1], 'sample': unit}
+
+    worst = None
+    for unit in units:
+        times = []
+        for length in LINT_LENGTHS:
+            times.append(_search_seconds(compiled, unit, length))
+            if times[-1] > LINT_SLOW_SECONDS or time.perf_counter() > deadline:
+                break
+        seconds, length = times[-1], LINT_LENGTHS[len(times) - 1]
+        if len(times) < 2:
+            degree = math.inf
+        else:
+            before, shorter = times[-2], LINT_LENGTHS[len(times) - 2]
+            degree = math.log(seconds / before) / math.log(length / shorter) if before > 0 else 1.0
+        if seconds > LINT_SLOW_SECONDS:
+            # Over budget on a short text: super-linear whatever the (noisy) estimate says
+            degree = max(degree, 2.0)
+        elif len(times) < 2 or seconds < 0.0005 or degree < 2.5:
+            continue
+        if worst is None or seconds > worst['seconds']:
+            worst = {'kind': 'polynomial', 'degree': degree, 'seconds': seconds, 'length': length, 'sample': unit}
+    return worst
 
-    cost_center_rules = data.get('cost_center_rules', [])
-    _validate_and_compile_rules(
-        cost_center_rules, 'cost_center_rules',
-        ('sc_codes', 'cost_center_pattern', 'taxonomy_key', 'confidence'),
-        'cost_center_pattern',
-    )
 
-    override_rules = data.get('supplier_override_rules', [])
-    _validate_and_compile_rules(
-        override_rules, 'supplier_override_rules',
-        ('supplier_pattern', 'override_from_l1', 'taxonomy_key', 'confidence'),
-        'supplier_pattern',
-    )
+_DEGREE_NAMES = {2: 'quadratic', 3: 'cubic'}
+
+
+def _describe_hazard(hazard: dict) -> str:
+    if hazard['kind'] == 'exponential':
+        growth = 'exponential'
+    elif hazard['degree'] == math.inf:
+        growth = 'super-linear'
+    else:
+        degree = round(hazard['degree'])
+        growth = _DEGREE_NAMES.get(degree, f"degree {degree}")
+    return (f"{growth} backtracking, {hazard['seconds'] * 1000:,.1f} ms to search "
+            f"{hazard['length']:,} chars of repeated '{hazard['sample']}'")
+
+
+# Backreferences, named groups and inline flags break once patterns are
+# renumbered inside one alternation.
+_UNCOMBINABLE = re.compile(r'\\[1-9]|\(\?(?![:=!]|<[=!])')
+
+
+def _foldable(pattern: str) -> bool:
+    """True when IGNORECASE matching equals plain matching on lowercased ASCII text."""
+    return pattern.isascii() and pattern == pattern.lower()
 
+
+REGEX_ENGINES = ['re', 're2']
+RE2_MAX_MEM = 256 * 2**20
+
+# Valid in both engines but read differently: x{,n} is a repeat in re and
+# literal text in RE2; [[:alpha:]] is a POSIX class only in RE2.
+_RE2_DIVERGENT = re.compile(r'\{,|\[:')
+
+
+def _require_re2():
+    try:
+        import re2  # noqa: F401
+    except ImportError:
+        raise ConfigError("classification.regex_engine 're2' requires google-re2 (pip install google-re2)")
+
+
+def _re2_options():
+    import re2
+    options = re2.Options()
+    options.case_sensitive = False
+    options.max_mem = RE2_MAX_MEM
+    options.log_errors = False
+    return options
+
+
+def re2_compatible(pattern: str) -> bool:
+    """True when RE2 accepts ``pattern`` and matches printable ASCII text with it exactly as ``re`` does."""
+    import re2
+    if not pattern.isascii() or _RE2_DIVERGENT.search(pattern):
+        return False
+    try:
+        re2.compile(pattern, _re2_options())
+    except re2.error:
+        return False
+    return True
+
+
+def _re2_safe(text: str) -> bool:
+    """True for printable ASCII, where ``re`` and RE2 agree on case folding, ``$`` and ``\\s``."""
+    return text.isascii() and text.isprintable()
+
+
+class _RE2Run:
+    """Consecutive RE2-compatible rule patterns searched as one ``re2.Set``, in time linear in the text."""
+
+    def __init__(self, run: list[tuple[int, str]]):
+        import re2
+        self.rule_ids = [i for i, _ in run]
+        self._set = re2.Set.SearchSet(_re2_options())
+        for _, pattern in run:
+            self._set.Add(pattern)
+        self._set.Compile()
+
+    def hits(self, text: str) -> list[int]:
+        """Positions in ``rule_ids`` of every pattern that occurs in ``text``."""
+        return self._set.Match(text) or []
+
+
+class RuleMatcher:
+    """First-match-wins matcher for an ordered list of rule patterns.
+
+    Consecutive patterns are folded into one alternation of lookaheads, one
+    named group per rule, so a single ``match`` call per row finds the lowest
+    rule index whose pattern occurs anywhere in the text — exactly what the
+    rule-by-rule ``str.contains(case=False)`` loop produced.
+
+    Scoped rules (``sc_codes``) are looked up through ``index``, the SC code
+    -> rule positions map built by ``load_refinement_rules`` (derived from
+    ``scopes`` when not given). Rows are grouped by SC code and each group
+    runs only against the rules scoped to its code, in priority order; SC
+    codes with the same rule list share one sub-matcher.
+
+    Segments whose patterns are lowercase ASCII also get a case-sensitive twin
+    that runs on ``text.lower()`` for ASCII text, which is equivalent and
+    several times faster than IGNORECASE matching. Patterns that cannot be
+    combined run on their own, in their original position.
+
+    With ``engine='re2'``, consecutive patterns that ``re2_compatible``
+    accepts are searched as one ``re2.Set`` instead, in linear time however
+    the pattern backtracks under ``re``; the rest keep their ``re`` segments,
+    in their original position. Texts that are not printable ASCII always
+    use the ``re`` segments, so both engines give the same results.
+    """
+
+    def __init__(self, patterns: list[str], scopes: list = None, index: dict = None, engine: str = 're'):
+        self.size = len(patterns)
+        self.patterns = list(patterns)
+        self.engine = engine
+        if index is None and scopes is not None:
+            index = index_by_sc_code(scopes)
+        self.scoped = index is not None
+        self._segments = []
+        self._re2_segments = None
+        self._every = None
+        self._every_re2 = None
+        self._groups = {}
+        if self.scoped:
+            shared = {}
+            for sc, positions in index.items():
+                key = tuple(positions)
+                if key not in shared:
+                    shared[key] = (np.array(key, dtype=np.int64),
+                                   RuleMatcher([patterns[i] for i in key], engine=engine))
+                self._groups[sc] = shared[key]
+            return
+
+        self._segments = self._first_segments(list(enumerate(self.patterns)))
+        if engine == 're2':
+            self._re2_segments = self._with_re2(self._first_segments)
+
+    def _first_segments(self, indexed: list[tuple[int, str]]) -> list:
+        segments = []
+        for run in self._runs(indexed):
+            if len(run) == 1 and _UNCOMBINABLE.search(run[0][1]):
+                i, pattern = run[0]
+                segments.append((None, re.compile(pattern, re.IGNORECASE), i))
+                continue
+            combined = '|'.join(f'(?P<r{i}>(?=(?s:.*?)(?:{pattern})))' for i, pattern in run)
+            segments.append(self._compile_run(run, combined))
+        return segments
+
+    def _every_segments(self, indexed: list[tuple[int, str]]) -> list:
+        segments = []
+        for run in self._runs(indexed):
+            if len(run) == 1 and _UNCOMBINABLE.search(run[0][1]):
+                i, pattern = run[0]
+                segments.append((None, re.compile(pattern, re.IGNORECASE), i))
+                continue
+            combined = ''.join(f'(?:(?=(?s:.*?)(?P<r{i}>{pattern})))?' for i, pattern in run)
+            folded, compiled, _ = self._compile_run(run, combined)
+            groups = [(compiled.groupindex[f'r{i}'], i) for i, _ in run]
+            segments.append((folded, compiled, groups))
+        return segments
+
+    def _with_re2(self, build_segments) -> list:
+        """Each run of RE2-compatible patterns as one ``_RE2Run``, the patterns between them by ``build_segments``."""
+        segments, compatible, other = [], [], []
+        for i, pattern in enumerate(self.patterns):
+            if re2_compatible(pattern):
+                if other:
+                    segments += build_segments(other)
+                    other = []
+                compatible.append((i, pattern))
+            else:
+                if compatible:
+                    segments.append(_RE2Run(compatible))
+                    compatible = []
+                other.append((i, pattern))
+        if compatible:
+            segments.append(_RE2Run(compatible))
+        if other:
+            segments += build_segments(other)
+        return segments
+
+    @staticmethod
+    def _runs(indexed: list[tuple[int, str]]):
+        """Consecutive combinable patterns of the same foldability; uncombinable patterns alone."""
+        pending = []
+        for i, pattern in indexed:
+            if _UNCOMBINABLE.search(pattern):
+                if pending:
+                    yield pending
+                pending = []
+                yield [(i, pattern)]
+                continue
+            if pending and _foldable(pattern) != _foldable(pending[-1][1]):
+                yield pending
+                pending = []
+            pending.append((i, pattern))
+        if pending:
+            yield pending
+
+    @staticmethod
+    def _compile_run(run, combined):
+        folded = re.compile(combined) if _foldable(run[0][1]) else None
+        return folded, re.compile(combined, re.IGNORECASE), None
+
+    @property
+    def sc_codes(self) -> set[str]:
+        """Every SC code that at least one rule is scoped to."""
+        return set(self._groups)
+
+    def _first(self, text: str) -> int:
+        segments = self._segments
+        if self._re2_segments is not None and _re2_safe(text):
+            segments = self._re2_segments
+        lowered = None
+        for segment in segments:
+            if isinstance(segment, _RE2Run):
+                hits = segment.hits(text)
+                if hits:
+                    return segment.rule_ids[min(hits)]
+                continue
+            folded, compiled, i = segment
+            if i is not None:
+                if compiled.search(text):
+                    return i
+                continue
+            if folded is not None and text.isascii():
+                if lowered is None:
+                    lowered = text.lower()
+                m = folded.match(lowered)
+            else:
+                m = compiled.match(text)
+            if m:
+                return int(m.lastgroup[1:])
+        return -1
+
+    def _rows_by_sc(self, sc_codes) -> dict:
+        """Positions of the rows per SC code, for SC codes that have rules."""
+        groups = pd.Series(np.arange(len(sc_codes))).groupby(np.asarray(sc_codes, dtype=object)).indices
+        return {sc: rows for sc, rows in groups.items() if sc in self._groups}
+
+    def first_match(self, texts, sc_codes=None) -> np.ndarray:
+        """Index of the first matching rule per text, or -1 when none match."""
+        if not self.scoped:
+            return np.fromiter((self._first(t) for t in texts), dtype=np.int64, count=len(texts))
+        positions = np.full(len(texts), -1, dtype=np.int64)
+        for sc, rows in self._rows_by_sc(sc_codes).items():
+            rule_ids, matcher = self._groups[sc]
+            local = matcher.first_match([texts[j] for j in rows])
+            hit = local >= 0
+            positions[rows[hit]] = rule_ids[local[hit]]
+        return positions
+
+    def first_matched(self, matched: np.ndarray, sc_codes=None) -> np.ndarray:
+        """``first_match`` from a precomputed ``matching_rules`` matrix of the same texts."""
+        if not self.scoped:
+            return np.where(matched.any(axis=1), matched.argmax(axis=1), -1)
+        positions = np.full(len(matched), -1, dtype=np.int64)
+        for sc, rows in self._rows_by_sc(sc_codes).items():
+            rule_ids, _ = self._groups[sc]
+            local = matched[np.ix_(rows, rule_ids)]
+            hit = local.any(axis=1)
+            positions[rows[hit]] = rule_ids[local[hit].argmax(axis=1)]
+        return positions
+
+    def matching_rules(self, texts) -> np.ndarray:
+        """Every rule that matches each text, as a ``(len(texts), size)`` boolean matrix.
+
+        Each run of combinable patterns is one regex of optional lookaheads,
+        one named group per rule, so a single ``match`` call per text reports
+        all rules whose pattern occurs in it.
+        """
+        if self._every is None:
+            self._every = self._every_segments(list(enumerate(self.patterns)))
+            if self.engine == 're2':
+                self._every_re2 = self._with_re2(self._every_segments)
+
+        matched = np.zeros((len(texts), self.size), dtype=bool)
+        for j, text in enumerate(texts):
+            segments = self._every
+            if self._every_re2 is not None and _re2_safe(text):
+                segments = self._every_re2
+            lowered = None
+            for segment in segments:
+                if isinstance(segment, _RE2Run):
+                    for k in segment.hits(text):
+                        matched[j, segment.rule_ids[k]] = True
+                    continue
+                folded, compiled, groups = segment
+                if isinstance(groups, int):
+                    matched[j, groups] = compiled.search(text) is not None
+                    continue
+                if folded is not None and text.isascii():
+                    if lowered is None:
+                        lowered = text.lower()
+                    m = folded.match(lowered)
+                else:
+                    m = compiled.match(text)
+                for group, i in groups:
+                    if m.start(group) >= 0:
+                        matched[j, i] = True
+        return matched
+
+    def profile_match(self, texts, sc_codes=None, weights=None) -> tuple[np.ndarray, list[dict]]:
+        """``first_match`` evaluated one rule at a time, with statistics per rule.
+
+        Each rule only scans the texts no earlier rule matched (and, when
+        scoped, whose SC code it applies to), so the positions equal
+        ``first_match``. Per rule this reports the wall time, the texts
+        scanned (``evaluations``), their total weight (``candidates``) and the
+        weight of the texts it matched (``hits``).
+        """
+        texts = list(texts)
+        weights = np.ones(len(texts), dtype=np.int64) if weights is None else np.asarray(weights)
+        positions = np.full(len(texts), -1, dtype=np.int64)
+        remaining = list(range(len(texts)))
+        scopes = [set() for _ in self.patterns]
+        for sc, (rule_ids, _) in self._groups.items():
+            for i in rule_ids:
+                scopes[i].add(sc)
+        stats = []
+        for i, pattern in enumerate(self.patterns):
+            compiled = re.compile(pattern, re.IGNORECASE)
+            start = time.perf_counter()
+            if self.scoped:
+                scanned = [j for j in remaining if sc_codes[j] in scopes[i]]
+            else:
+                scanned = remaining
+            hits = [j for j in scanned if compiled.search(texts[j])]
+            seconds = time.perf_counter() - start
+            if hits:
+                positions[hits] = i
+                remaining = [j for j in remaining if positions[j] < 0]
+            stats.append({
+                'seconds': seconds,
+                'evaluations': len(scanned),
+                'candidates': int(weights[scanned].sum()),
+                'hits': int(weights[hits].sum()),
+            })
+        return positions, stats
+
+    def profile_matching_rules(self, texts, weights=None) -> tuple[np.ndarray, list[dict]]:
+        """``matching_rules`` evaluated one rule at a time, timing each rule.
+
+        ``hits`` is left at zero: which matches take effect is up to the caller.
+        """
+        texts = list(texts)
+        weights = np.ones(len(texts), dtype=np.int64) if weights is None else np.asarray(weights)
+        matched = np.zeros((len(texts), self.size), dtype=bool)
+        stats = []
+        for i, pattern in enumerate(self.patterns):
+            compiled = re.compile(pattern, re.IGNORECASE)
+            start = time.perf_counter()
+            matched[:, i] = [compiled.search(t) is not None for t in texts]
+            stats.append({
+                'seconds': time.perf_counter() - start,
+                'evaluations': len(texts),
+                'candidates': int(weights.sum()),
+                'hits': 0,
+            })
+        return matched, stats
+
+
+class ClassificationProfile:
+    """Wall time, candidate rows and hits per tier and per rule (``--profile``).
+
+    Rows are counted in input rows, like the tier counts; ``evaluations`` is
+    the number of distinct classification keys a rule's regex actually ran on.
+    Totals accumulate over chunks. With ``rules=False`` only whole tiers are
+    timed, and the matchers run at full speed.
+    """
+
+    def __init__(self, rules: bool = True):
+        self.per_rule = rules
+        self.tiers = {}
+        self.rules = {}
+
+    def record_tier(self, tier: str, seconds: float, candidates: int, hits: int):
+        entry = self.tiers.setdefault(tier, {'tier': tier, 'label': TIER_LABELS[tier],
+                                             'seconds': 0.0, 'candidates': 0, 'hits': 0})
+        entry['seconds'] += seconds
+        entry['candidates'] += candidates
+        entry['hits'] += hits
+
+    def record_rules(self, tier: str, rules: list[dict], patterns: list[str], key_field: str, stats: list[dict]):
+        for i, (rule, pattern, rule_stats) in enumerate(zip(rules, patterns, stats)):
+            entry = self.rules.setdefault((tier, i), {
+                'tier': tier, 'index': i, 'pattern': pattern, 'target': rule[key_field],
+                'seconds': 0.0, 'evaluations': 0, 'candidates': 0, 'hits': 0,
+            })
+            for key, value in rule_stats.items():
+                entry[key] += value
+
+    def slowest_rules(self, n: int = None) -> list[dict]:
+        ranked = sorted(self.rules.values(), key=lambda r: r['seconds'], reverse=True)
+        return ranked[:n] if n else ranked
+
+    def dead_rules(self) -> list[dict]:
+        """Rules that never classified a row."""
+        return [r for r in self.rules.values() if r['hits'] == 0]
+
+    def report(self) -> dict:
+        return {
+            'tiers': [self.tiers[t] for t in TIER_LABELS if t in self.tiers],
+            'rules': self.slowest_rules(),
+            'dead_rules': len(self.dead_rules()),
+        }
+
+
+def build_matchers(rules: list[dict], refinement: dict, engine: str = 're') -> dict:
+    sc_index = refinement['sc_index']
     return {
-        'supplier_rules': supplier_rules,
-        'context_rules': context_rules,
-        'cost_center_rules': cost_center_rules,
-        'supplier_override_rules': override_rules,
+        'supplier': RuleMatcher(
+            [r['supplier_pattern'] for r in refinement['supplier_rules']],
+            index=sc_index['supplier_rules'], engine=engine,
+        ),
+        'keyword': RuleMatcher([r['pattern'] for r in rules], engine=engine),
+        'override': RuleMatcher([r['supplier_pattern'] for r in refinement['supplier_override_rules']],
+                                engine=engine),
+        'context': RuleMatcher(
+            [r['line_of_service_pattern'] for r in refinement['context_rules']],
+            index=sc_index['context_rules'], engine=engine,
+        ),
+        'cost_center': RuleMatcher(
+            [r['cost_center_pattern'] for r in refinement['cost_center_rules']],
+            index=sc_index['cost_center_rules'], engine=engine,
+        ),
     }
 
 
-def main(config: dict):
-    paths = config['_resolved_paths']
-    cols = config['columns']
-    classif = config['classification']
-    client_name = config['client']['name']
+TIER_LABELS = {
+    'tier1': 'SC code mapping',
+    'tier2': 'Supplier refinement',
+    'tier3': 'Keyword rules',
+    'tier4': 'Context refinement',
+    'tier5': 'Cost center refinement',
+    'tier6': 'Ambiguous fallback',
+    'levels': 'Taxonomy level lookup',
+    'tier7': 'Supplier override',
+    'review': 'Review tier assignment',
+}
 
-    paths['output_dir'].mkdir(parents=True, exist_ok=True)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    output_xlsx = paths['output_dir'] / f"{paths['output_prefix']}_{timestamp}.xlsx"
+REFERENCE_BUNDLE_VERSION = 5
+REFERENCE_SOURCES = ['sc_mapping', 'taxonomy', 'keyword_rules', 'refinement_rules']
 
-    t_start = time.perf_counter()
 
-    print("=" * 70)
-    print(f"{client_name} TRANSACTION CATEGORIZATION")
-    print("=" * 70)
+def reference_hashes(paths: dict) -> dict[str, str]:
+    """SHA-256 of each reference file, by source key."""
+    return {key: hashlib.sha256(Path(paths[key]).read_bytes()).hexdigest() for key in REFERENCE_SOURCES}
 
-    print("\nLoading resources...")
-    sc_mapping = load_sc_mapping(paths['sc_mapping'])
-    print(f"  SC code mappings: {len(sc_mapping)}")
 
-    taxonomy_df = load_taxonomy(paths['taxonomy'])
-    taxonomy_keys_set = set(taxonomy_df['Key'].tolist())
-    taxonomy_lookup = build_taxonomy_lookup(taxonomy_df)
-    print(f"  Taxonomy categories: {len(taxonomy_keys_set)}")
+def reference_fingerprint(paths: dict) -> str:
+    """Content hash of the reference files (and the bundle layout version)."""
+    digest = hashlib.sha256(f"reference-bundle-v{REFERENCE_BUNDLE_VERSION}".encode())
+    for key, file_hash in reference_hashes(paths).items():
+        digest.update(key.encode())
+        digest.update(bytes.fromhex(file_hash))
+    return digest.hexdigest()
 
-    rules = load_keyword_rules(paths['keyword_rules'])
-    print(f"  Keyword rules: {len(rules)}")
 
-    refinement = load_refinement_rules(paths['refinement_rules'])
-    print(f"  Supplier refinement rules: {len(refinement['supplier_rules'])}")
-    print(f"  Context refinement rules: {len(refinement['context_rules'])}")
-    print(f"  Cost center rules: {len(refinement['cost_center_rules'])}")
-    print(f"  Supplier override rules: {len(refinement['supplier_override_rules'])}")
-    ambiguous_codes = {sc for sc, info in sc_mapping.items() if info.get('ambiguous')}
-    print(f"  Ambiguous SC codes: {len(ambiguous_codes)}")
+# Parsed reference files by (loader, path, mtime, size), so clients in one
+# process that share a file (typically the taxonomy workbook) parse it once.
+_PARSED_REFERENCES = {}
 
-    invalid_mappings = []
-    for sc_code, info in sc_mapping.items():
-        if info['taxonomy_key'] not in taxonomy_keys_set:
-            invalid_mappings.append((sc_code, info['taxonomy_key']))
-    if invalid_mappings:
-        print(f"\n  WARNING: {len(invalid_mappings)} SC mappings point to invalid taxonomy keys:")
-        for sc, key in invalid_mappings[:10]:
-            print(f"    {sc} -> {key}")
-        print("  These will still be used but won't resolve to L1-L5 breakdown.")
 
-    print(f"\nLoading {client_name} dataset...")
-    df = pd.read_csv(paths['input'], low_memory=False)
-    total_rows = len(df)
-    print(f"  Loaded {total_rows:,} rows, {len(df.columns)} columns")
+def parsed_reference(loader, path: Path):
+    """``loader(path)``, reused while the file's path, mtime and size are unchanged."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = (loader.__name__, str(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _PARSED_REFERENCES:
+        _PARSED_REFERENCES[key] = loader(path)
+    return _PARSED_REFERENCES[key]
 
-    if total_rows == 0:
-        raise ConfigError(f"Input CSV has 0 data rows: {paths['input']}")
 
-    required_csv_cols = {
-        'spend_category': cols['spend_category'],
-        'supplier': cols['supplier'],
-        'line_memo': cols['line_memo'],
-        'line_of_service': cols['line_of_service'],
-        'cost_center': cols['cost_center'],
-        'amount': cols['amount'],
+def build_reference_bundle(paths: dict) -> dict:
+    sc_mapping = parsed_reference(load_sc_mapping, paths['sc_mapping'])
+    taxonomy_df = parsed_reference(load_taxonomy, paths['taxonomy'])
+    rules = parsed_reference(load_keyword_rules, paths['keyword_rules'])
+    refinement = parsed_reference(load_refinement_rules, paths['refinement_rules'])
+    return {
+        'sc_mapping': sc_mapping,
+        'taxonomy_keys': set(taxonomy_df['Key'].tolist()),
+        'taxonomy_lookup': build_taxonomy_lookup(taxonomy_df),
+        'rules': rules,
+        'refinement': refinement,
+        'matchers': build_matchers(rules, refinement),
     }
-    missing_csv_cols = [
-        f"'{v}' (from columns.{k})"
-        for k, v in required_csv_cols.items()
-        if v not in df.columns
-    ]
-    if missing_csv_cols:
-        raise ConfigError(f"Columns not found in input CSV: {', '.join(missing_csv_cols)}")
 
-    # ── Vectorized classification ───────────────────────────────────────
-    print("\nClassifying transactions (vectorized)...")
-    t_classify = time.perf_counter()
 
-    sc_pattern = classif['sc_code_pattern']
-    conf_high = classif['confidence_high']
-    conf_medium = classif['confidence_medium']
+def load_reference_bundle(paths: dict, cache_dir: Path = None) -> dict:
+    """Parsed reference data and compiled matchers, cached under ``cache_dir``.
 
-    spend_cat_str = df[cols['spend_category']].astype(str).str.strip()
-    sc_extracted = spend_cat_str.str.extract(f'({sc_pattern})', expand=False)
-    if isinstance(sc_extracted, pd.DataFrame):
-        sc_extracted = sc_extracted.iloc[:, 0]
-    sc_code = sc_extracted.fillna(spend_cat_str)
+    The bundle file is named after the content hash of the source files, so
+    an edited mapping, taxonomy or rule file is picked up on the next run and
+    the stale bundle replaced. ``bundle['cached']`` tells whether it was reused.
+    Without ``cache_dir`` everything is parsed from the sources.
+    """
+    if cache_dir is None:
+        return {**build_reference_bundle(paths), 'cached': False}
 
-    supplier = df[cols['supplier']].fillna('').astype(str)
-    line_memo = df[cols['line_memo']].fillna('').astype(str)
-    line_of_service = df[cols['line_of_service']].fillna('').astype(str)
-    cost_center = df[cols['cost_center']].fillna('').astype(str)
-    combined_text = supplier + ' ' + line_memo
+    fingerprint = reference_fingerprint(paths)
+    bundle_path = cache_dir / f"reference_{fingerprint[:16]}.pkl"
+    if bundle_path.exists():
+        try:
+            with open(bundle_path, 'rb') as f:
+                bundle = pickle.load(f)
+            if bundle.get('fingerprint') == fingerprint:
+                return {**bundle, 'cached': True}
+        except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+            pass
+
+    bundle = {**build_reference_bundle(paths), 'fingerprint': fingerprint}
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for stale in cache_dir.glob('reference_*.pkl'):
+            stale.unlink()
+        tmp_path = bundle_path.with_name(f"{bundle_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, bundle_path)
+    except OSError as e:
+        print(f"  WARNING: Could not write reference cache to {cache_dir}: {e}")
+    return {**bundle, 'cached': False}
+
+
+SUPPLIER_CACHE_SIZE = 100_000
+
+
+def supplier_match_fingerprint(refinement: dict) -> str:
+    """Hash of the supplier refinement and override patterns, in order."""
+    patterns = {section: [r['supplier_pattern'] for r in refinement[section]]
+                for section in SupplierMatchCache.SECTIONS}
+    settings = {'cache_version': SupplierMatchCache.VERSION, 'patterns': patterns}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+class SupplierMatchCache:
+    """Which supplier and override patterns match each supplier name, kept across runs.
+
+    Tiers 2 and 7 only look at the supplier, and a client has a few thousand
+    distinct suppliers that barely change between runs. Each name is searched
+    against every supplier refinement and supplier override pattern once; the
+    matches are stored as a packed bit row, and the tiers gather rows from
+    the cache instead of running the regexes again. Names are keyed and
+    searched stripped and lowercased (every pattern is case-insensitive), so
+    ``'ACME Corp '`` and ``'acme corp'`` share one entry.
+
+    Entries are evicted least recently used first once there are more than
+    ``max_entries``. With a ``path`` the entries are loaded from and saved to
+    that file, and they are ignored when the fingerprint of the patterns
+    (``supplier_match_fingerprint``) differs from the one they were saved with.
+    """
+
+    VERSION = 2
+    SECTIONS = ('supplier_rules', 'supplier_override_rules')
+
+    def __init__(self, refinement: dict, path: Path = None, max_entries: int = SUPPLIER_CACHE_SIZE,
+                 engine: str = 're'):
+        self.path = path
+        self.max_entries = max_entries
+        self.engine = engine
+        self.fingerprint = supplier_match_fingerprint(refinement)
+        self.patterns = [r['supplier_pattern'] for section in self.SECTIONS for r in refinement[section]]
+        n_supplier = len(refinement['supplier_rules'])
+        self.columns = {'supplier_rules': slice(0, n_supplier),
+                        'supplier_override_rules': slice(n_supplier, len(self.patterns))}
+        self.entries = OrderedDict()
+        self.loaded = 0
+        self.stale = False
+        self.hits = 0
+        self.misses = 0
+        self._matcher = None
+        self._changed = False
+        if path is not None and path.exists():
+            try:
+                with open(path, 'rb') as f:
+                    saved = pickle.load(f)
+            except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+                saved = {}
+            if saved.get('fingerprint') == self.fingerprint:
+                self.entries = saved['entries']
+                self.loaded = len(self.entries)
+            else:
+                self.stale = True
+
+    def __getstate__(self):
+        return {**self.__dict__, '_matcher': None}
+
+    def matches(self, suppliers, section: str) -> np.ndarray:
+        """``matching_rules`` of ``section``'s patterns for distinct ``suppliers``."""
+        rows = self._rows(suppliers)
+        width = len(self.patterns)
+        packed = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(len(rows), (width + 7) // 8)
+        matched = np.unpackbits(packed, axis=1, count=width).view(bool)
+        return matched[:, self.columns[section]]
+
+    @staticmethod
+    def _key(supplier: str) -> str:
+        return supplier.strip().lower()
+
+    def _rows(self, suppliers) -> list[bytes]:
+        entries = self.entries
+        suppliers = [self._key(s) for s in suppliers]
+        missing = [s for s in dict.fromkeys(suppliers) if s not in entries]
+        if missing:
+            if self._matcher is None:
+                self._matcher = RuleMatcher(self.patterns, engine=self.engine)
+            packed = np.packbits(self._matcher.matching_rules(missing), axis=1)
+            entries.update(zip(missing, map(bytes, packed)))
+        self.misses += len(missing)
+        self.hits += len(suppliers) - len(missing)
+        rows = []
+        for supplier in suppliers:
+            entries.move_to_end(supplier)
+            rows.append(entries[supplier])
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self._changed = True
+        return rows
+
+    def subset(self, suppliers) -> SupplierMatchCache:
+        """An in-memory cache holding just ``suppliers``, small enough to ship to a worker."""
+        suppliers = list(dict.fromkeys(map(self._key, suppliers)))
+        part = object.__new__(SupplierMatchCache)
+        part.__dict__.update(self.__getstate__())
+        part.path = None
+        part.entries = OrderedDict(zip(suppliers, self._rows(suppliers)))
+        part.max_entries = max(len(suppliers), 1)
+        part.hits = part.misses = 0
+        return part
+
+    def save(self):
+        if self.path is None or not self._changed:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'version': self.VERSION, 'fingerprint': self.fingerprint, 'entries': self.entries},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._changed = False
+        except OSError as e:
+            print(f"  WARNING: Could not write supplier match cache to {self.path.parent}: {e}")
+
+
+TAXONOMY_LEVELS = ['CategoryLevel1', 'CategoryLevel2', 'CategoryLevel3', 'CategoryLevel4', 'CategoryLevel5']
+
+
+def taxonomy_table(taxonomy_lookup: dict, extra_keys=()) -> tuple[pd.Index, np.ndarray]:
+    """Taxonomy keys plus ``extra_keys`` not in the taxonomy, and a ``(len(keys), 5)`` array of their levels.
+
+    Extra keys (mapping or rule targets missing from the taxonomy,
+    ``Unclassified``) get blank levels.
+    """
+    extras = [k for k in dict.fromkeys(extra_keys) if k not in taxonomy_lookup]
+    keys = pd.Index(list(taxonomy_lookup) + extras, dtype=object)
+    levels = [[info[level] for level in TAXONOMY_LEVELS] for info in taxonomy_lookup.values()]
+    levels += [[''] * len(TAXONOMY_LEVELS)] * len(extras)
+    return keys, np.array(levels, dtype=object).reshape(len(keys), len(TAXONOMY_LEVELS))
+
+
+def _apply_rule_hits(matcher, texts, sc_codes, candidate, rules, key_codes, method_name,
+                     taxonomy_key, method, confidence, unclassified, weights, default_confidence=None,
+                     profile=None, tier=None, key_field=None, cache=None, cache_section=None):
+    """Run one tier's matcher over the candidate rows and write back its hits.
+
+    ``candidate`` and the result arrays are positional numpy arrays;
+    ``key_codes`` are the rules' taxonomy key ids. With a ``profile``, the
+    tier is timed under ``tier`` and (per-rule profiles) rules are evaluated
+    one by one. A ``SupplierMatchCache`` provides the matches of
+    ``cache_section``'s patterns per distinct text instead of the matcher.
+    """
+    start = time.perf_counter()
+    hit_count = 0
+    cand_pos = np.flatnonzero(candidate)
+    if len(cand_pos):
+        cand_sc = sc_codes.to_numpy()[cand_pos].tolist() if matcher.scoped else None
+        cand_texts = texts.to_numpy()[cand_pos].tolist()
+        if profile is None or not profile.per_rule:
+            if cache is not None:
+                text_codes, distinct = pd.factorize(np.asarray(cand_texts, dtype=object))
+                matched = cache.matches(list(distinct), cache_section)[text_codes]
+                rule_pos = matcher.first_matched(matched, cand_sc)
+            else:
+                rule_pos = matcher.first_match(cand_texts, cand_sc)
+        else:
+            rule_pos, stats = matcher.profile_match(cand_texts, cand_sc, weights[cand_pos])
+            profile.record_rules(tier, rules, matcher.patterns, key_field, stats)
+        hit = rule_pos >= 0
+        if hit.any():
+            hit_pos = cand_pos[hit]
+            hit_rules = rule_pos[hit]
+            if default_confidence is None:
+                confs = np.array([r['confidence'] for r in rules], dtype='float64')
+            else:
+                confs = np.array([r.get('confidence', default_confidence) for r in rules], dtype='float64')
+            taxonomy_key[hit_pos] = key_codes[hit_rules]
+            method[hit_pos] = ALL_METHODS.index(method_name)
+            confidence[hit_pos] = confs[hit_rules]
+            unclassified[hit_pos] = False
+            hit_count = int(weights[hit_pos].sum())
+    if profile is not None:
+        profile.record_tier(tier, time.perf_counter() - start, int(weights[cand_pos].sum()), hit_count)
+    return hit_count
+
+
+CLASSIFICATION_KEYS = ['sc_code', 'supplier', 'line_memo', 'line_of_service', 'cost_center']
+
+
+def factorize_rows(keys: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Code each row by its distinct key tuple.
+
+    Returns ``(codes, first_rows)``: ``codes[i]`` is the unique-key id of row
+    ``i`` (ids follow first appearance) and ``first_rows[k]`` is the position
+    of the first row carrying id ``k``.
+    """
+    codes = np.zeros(len(keys), dtype=np.int64)
+    for col in keys.columns:
+        col_codes, col_uniques = pd.factorize(keys[col])
+        codes, _ = pd.factorize(codes * len(col_uniques) + col_codes)
+    _, first_rows = np.unique(codes, return_index=True)
+    return codes, first_rows
+
+
+def classify_rows(keys: pd.DataFrame, sc_mapping: dict, taxonomy_lookup: dict, rules: list[dict],
+                  refinement: dict, matchers: dict, classif: dict, weights=None,
+                  profile: ClassificationProfile = None,
+                  supplier_cache: SupplierMatchCache = None) -> tuple[pd.DataFrame, dict]:
+    """Run the 7-tier waterfall over ``keys`` (columns: CLASSIFICATION_KEYS).
+
+    ``weights`` is the number of input rows each key row stands for; tier
+    counts are reported in input rows. Returns the per-row classification and
+    the tier counts. A ``profile`` collects per-tier and per-rule timings.
+    With a ``supplier_cache``, tiers 2 and 7 gather each supplier's matches
+    from it (except under a per-rule profile, which times every pattern).
+
+    The waterfall works on integer codes (taxonomy key ids, ``ALL_METHODS``
+    and ``REVIEW_TIERS`` positions); the text columns of the result are
+    Categoricals built from those codes at the end.
+    """
+    conf_high = classif['confidence_high']
+    conf_medium = classif['confidence_medium']
 
-    taxonomy_key = pd.Series('', index=df.index, dtype='object')
-    method = pd.Series('', index=df.index, dtype='object')
-    confidence = pd.Series(0.0, index=df.index, dtype='float64')
+    sc_code = keys['sc_code']
+    supplier = keys['supplier']
+    line_of_service = keys['line_of_service']
+    cost_center = keys['cost_center']
+    combined_text = supplier + ' ' + keys['line_memo']
+    n_rows = len(keys)
+    weights = np.ones(n_rows, dtype=np.int64) if weights is None else np.asarray(weights)
+    override_rules = refinement['supplier_override_rules']
+
+    # Every key the waterfall can assign, with its levels factorized per level
+    tax_keys, tax_levels = taxonomy_table(taxonomy_lookup, [
+        *(info['taxonomy_key'] for info in sc_mapping.values()),
+        *(r['category'] for r in rules),
+        *(r['taxonomy_key'] for section in ('supplier_rules', 'context_rules', 'cost_center_rules',
+                                            'supplier_override_rules') for r in refinement[section]),
+        'Unclassified',
+    ])
+    level_codes = np.empty(tax_levels.shape, dtype=np.int32)
+    level_values = []
+    for k in range(len(TAXONOMY_LEVELS)):
+        level_codes[:, k], uniques = pd.factorize(tax_levels[:, k])
+        level_values.append(uniques)
+
+    def key_codes(values) -> np.ndarray:
+        return tax_keys.get_indexer(list(values)).astype(np.int32)
+
+    taxonomy_key = np.full(n_rows, -1, dtype=np.int32)
+    method = np.full(n_rows, -1, dtype=np.int8)
+    confidence = np.zeros(n_rows, dtype='float64')
+    counts = {}
 
     # Tier 1: Non-ambiguous SC code mapping
-    non_amb_taxonomy = {sc: info['taxonomy_key'] for sc, info in sc_mapping.items() if not info.get('ambiguous')}
-    non_amb_confidence = {sc: info['confidence'] for sc, info in sc_mapping.items() if not info.get('ambiguous')}
-    tier1_mask = sc_code.isin(non_amb_taxonomy)
-    taxonomy_key[tier1_mask] = sc_code[tier1_mask].map(non_amb_taxonomy)
-    method[tier1_mask] = 'sc_code_mapping'
-    confidence[tier1_mask] = sc_code[tier1_mask].map(non_amb_confidence)
-    print(f"  Tier 1 (SC code mapping): {tier1_mask.sum():,} rows")
-
-    unclassified = (method == '').copy()
+    t_tier = time.perf_counter()
+    non_amb = {sc: info for sc, info in sc_mapping.items() if not info.get('ambiguous')}
+    tier1_mask = sc_code.isin(non_amb).to_numpy()
+    tier1_sc = sc_code.to_numpy()[tier1_mask]
+    taxonomy_key[tier1_mask] = key_codes(non_amb[sc]['taxonomy_key'] for sc in tier1_sc)
+    method[tier1_mask] = ALL_METHODS.index('sc_code_mapping')
+    confidence[tier1_mask] = [non_amb[sc]['confidence'] for sc in tier1_sc]
+    counts['tier1'] = int(weights[tier1_mask].sum())
+    if profile is not None:
+        profile.record_tier('tier1', time.perf_counter() - t_tier, int(weights.sum()), counts['tier1'])
+
+    unclassified = method < 0
 
     # Tier 2: Supplier refinement
-    tier2_count = 0
-    for rule in refinement['supplier_rules']:
-        if not unclassified.any():
-            break
-        sc_match = sc_code.isin(rule['sc_codes'])
-        candidate = unclassified & sc_match
-        if not candidate.any():
-            continue
-        cand_idx = candidate[candidate].index
-        supplier_match = supplier.loc[cand_idx].str.contains(
-            rule['supplier_pattern'], case=False, na=False, regex=True
-        )
-        hit_idx = cand_idx[supplier_match.values]
-        if len(hit_idx) > 0:
-            taxonomy_key[hit_idx] = rule['taxonomy_key']
-            method[hit_idx] = 'supplier_refinement'
-            confidence[hit_idx] = rule['confidence']
-            tier2_count += len(hit_idx)
-            unclassified[hit_idx] = False
-    print(f"  Tier 2 (supplier refinement): {tier2_count:,} rows")
+    counts['tier2'] = _apply_rule_hits(
+        matchers['supplier'], supplier, sc_code,
+        unclassified & sc_code.isin(matchers['supplier'].sc_codes).to_numpy(),
+        refinement['supplier_rules'], key_codes(r['taxonomy_key'] for r in refinement['supplier_rules']),
+        'supplier_refinement', taxonomy_key, method, confidence, unclassified, weights,
+        profile=profile, tier='tier2', key_field='taxonomy_key',
+        cache=supplier_cache, cache_section='supplier_rules',
+    )
 
     # Tier 3: Keyword rules
-    tier3_count = 0
-    for rule in rules:
-        if not unclassified.any():
-            break
-        uncl_idx = unclassified[unclassified].index
-        kw_match = combined_text.loc[uncl_idx].str.contains(
-            rule['pattern'], case=False, na=False, regex=True
-        )
-        hit_idx = uncl_idx[kw_match.values]
-        if len(hit_idx) > 0:
-            taxonomy_key[hit_idx] = rule['category']
-            method[hit_idx] = 'rule'
-            confidence[hit_idx] = rule.get('confidence', 0.95)
-            tier3_count += len(hit_idx)
-            unclassified[hit_idx] = False
-    print(f"  Tier 3 (keyword rules): {tier3_count:,} rows")
+    counts['tier3'] = _apply_rule_hits(
+        matchers['keyword'], combined_text, sc_code, unclassified.copy(),
+        rules, key_codes(r['category'] for r in rules), 'rule',
+        taxonomy_key, method, confidence, unclassified, weights, default_confidence=0.95,
+        profile=profile, tier='tier3', key_field='category',
+    )
 
     # Tier 4: Context refinement (Line of Service)
-    tier4_count = 0
-    for rule in refinement['context_rules']:
-        if not unclassified.any():
-            break
-        sc_match = sc_code.isin(rule['sc_codes'])
-        candidate = unclassified & sc_match
-        if not candidate.any():
-            continue
-        cand_idx = candidate[candidate].index
-        los_match = line_of_service.loc[cand_idx].str.contains(
-            rule['line_of_service_pattern'], case=False, na=False, regex=True
-        )
-        hit_idx = cand_idx[los_match.values]
-        if len(hit_idx) > 0:
-            taxonomy_key[hit_idx] = rule['taxonomy_key']
-            method[hit_idx] = 'context_refinement'
-            confidence[hit_idx] = rule['confidence']
-            tier4_count += len(hit_idx)
-            unclassified[hit_idx] = False
-    print(f"  Tier 4 (context refinement): {tier4_count:,} rows")
+    counts['tier4'] = _apply_rule_hits(
+        matchers['context'], line_of_service, sc_code,
+        unclassified & sc_code.isin(matchers['context'].sc_codes).to_numpy(),
+        refinement['context_rules'], key_codes(r['taxonomy_key'] for r in refinement['context_rules']),
+        'context_refinement', taxonomy_key, method, confidence, unclassified, weights,
+        profile=profile, tier='tier4', key_field='taxonomy_key',
+    )
 
     # Tier 5: Cost center refinement
-    tier5_count = 0
-    for rule in refinement['cost_center_rules']:
-        if not unclassified.any():
-            break
-        sc_match = sc_code.isin(rule['sc_codes'])
-        candidate = unclassified & sc_match
-        if not candidate.any():
-            continue
-        cand_idx = candidate[candidate].index
-        cc_match = cost_center.loc[cand_idx].str.contains(
-            rule['cost_center_pattern'], case=False, na=False, regex=True
-        )
-        hit_idx = cand_idx[cc_match.values]
-        if len(hit_idx) > 0:
-            taxonomy_key[hit_idx] = rule['taxonomy_key']
-            method[hit_idx] = 'cost_center_refinement'
-            confidence[hit_idx] = rule['confidence']
-            tier5_count += len(hit_idx)
-            unclassified[hit_idx] = False
-    print(f"  Tier 5 (cost center refinement): {tier5_count:,} rows")
+    counts['tier5'] = _apply_rule_hits(
+        matchers['cost_center'], cost_center, sc_code,
+        unclassified & sc_code.isin(matchers['cost_center'].sc_codes).to_numpy(),
+        refinement['cost_center_rules'], key_codes(r['taxonomy_key'] for r in refinement['cost_center_rules']),
+        'cost_center_refinement', taxonomy_key, method, confidence, unclassified, weights,
+        profile=profile, tier='tier5', key_field='taxonomy_key',
+    )
 
     # Tier 6: Ambiguous SC fallback
-    amb_taxonomy = {sc: info['taxonomy_key'] for sc, info in sc_mapping.items() if info.get('ambiguous')}
-    amb_confidence = {sc: info['confidence'] for sc, info in sc_mapping.items() if info.get('ambiguous')}
-    tier6_mask = unclassified & sc_code.isin(amb_taxonomy)
-    taxonomy_key[tier6_mask] = sc_code[tier6_mask].map(amb_taxonomy)
-    method[tier6_mask] = 'sc_code_mapping_ambiguous'
-    confidence[tier6_mask] = sc_code[tier6_mask].map(amb_confidence)
-    print(f"  Tier 6 (ambiguous fallback): {tier6_mask.sum():,} rows")
+    t_tier = time.perf_counter()
+    amb = {sc: info for sc, info in sc_mapping.items() if info.get('ambiguous')}
+    tier6_mask = unclassified & sc_code.isin(amb).to_numpy()
+    tier6_sc = sc_code.to_numpy()[tier6_mask]
+    taxonomy_key[tier6_mask] = key_codes(amb[sc]['taxonomy_key'] for sc in tier6_sc)
+    method[tier6_mask] = ALL_METHODS.index('sc_code_mapping_ambiguous')
+    confidence[tier6_mask] = [amb[sc]['confidence'] for sc in tier6_sc]
+    counts['tier6'] = int(weights[tier6_mask].sum())
+    if profile is not None:
+        profile.record_tier('tier6', time.perf_counter() - t_tier, int(weights[unclassified].sum()), counts['tier6'])
 
     # Unmapped
-    still_unclassified = method == ''
-    if still_unclassified.any():
-        taxonomy_key[still_unclassified] = 'Unclassified'
-        method[still_unclassified] = 'unmapped'
-        confidence[still_unclassified] = 0.0
-        print(f"  Unmapped: {still_unclassified.sum():,} rows")
-
-    # Taxonomy level lookup
-    tax_l1 = pd.Series({k: v['CategoryLevel1'] for k, v in taxonomy_lookup.items()})
-    tax_l2 = pd.Series({k: v['CategoryLevel2'] for k, v in taxonomy_lookup.items()})
-    tax_l3 = pd.Series({k: v['CategoryLevel3'] for k, v in taxonomy_lookup.items()})
-    tax_l4 = pd.Series({k: v['CategoryLevel4'] for k, v in taxonomy_lookup.items()})
-    tax_l5 = pd.Series({k: v['CategoryLevel5'] for k, v in taxonomy_lookup.items()})
-
-    cat_l1 = taxonomy_key.map(tax_l1).fillna('')
-    cat_l2 = taxonomy_key.map(tax_l2).fillna('')
-    cat_l3 = taxonomy_key.map(tax_l3).fillna('')
-    cat_l4 = taxonomy_key.map(tax_l4).fillna('')
-    cat_l5 = taxonomy_key.map(tax_l5).fillna('')
+    still_unclassified = method < 0
+    counts['unmapped'] = int(weights[still_unclassified].sum())
+    taxonomy_key[still_unclassified] = tax_keys.get_loc('Unclassified')
+    method[still_unclassified] = ALL_METHODS.index('unmapped')
+    confidence[still_unclassified] = 0.0
+
+    # Taxonomy level lookup: one gather of level codes per row
+    t_tier = time.perf_counter()
+    levels = level_codes[taxonomy_key]
+    if profile is not None:
+        profile.record_tier('levels', time.perf_counter() - t_tier, int(weights.sum()), int(weights.sum()))
 
     # Tier 7: Supplier override (post-classification)
-    tier7_count = 0
-    for rule in refinement['supplier_override_rules']:
-        supplier_hit = supplier.str.contains(
-            rule['supplier_pattern'], case=False, na=False, regex=True
-        )
-        l1_hit = cat_l1.isin(rule['override_from_l1'])
-        hit = supplier_hit & l1_hit
-        if hit.any():
-            cat_info = taxonomy_lookup.get(rule['taxonomy_key'], {})
-            taxonomy_key[hit] = rule['taxonomy_key']
-            method[hit] = 'supplier_override'
-            confidence[hit] = rule['confidence']
-            cat_l1[hit] = cat_info.get('CategoryLevel1', '')
-            cat_l2[hit] = cat_info.get('CategoryLevel2', '')
-            cat_l3[hit] = cat_info.get('CategoryLevel3', '')
-            cat_l4[hit] = cat_info.get('CategoryLevel4', '')
-            cat_l5[hit] = cat_info.get('CategoryLevel5', '')
-            tier7_count += hit.sum()
-    print(f"  Tier 7 (supplier override): {tier7_count:,} rows")
+    t_tier = time.perf_counter()
+    override_stats = [{'seconds': 0.0, 'evaluations': 0, 'candidates': 0, 'hits': 0} for _ in override_rules]
+    l1_index = pd.Index(level_values[0])
+    allowed = np.array([l1_index.isin(r['override_from_l1']) for r in override_rules],
+                       dtype=bool).reshape(len(override_rules), len(l1_index))
+    candidate = np.flatnonzero(allowed.any(axis=0)[levels[:, 0]])
+    if len(candidate):
+        supplier_codes, suppliers = pd.factorize(supplier.to_numpy()[candidate])
+        if (profile is None or not profile.per_rule) and supplier_cache is not None:
+            matched = supplier_cache.matches(list(suppliers), 'supplier_override_rules')
+        elif profile is None or not profile.per_rule:
+            matched = matchers['override'].matching_rules(list(suppliers))
+        else:
+            supplier_weights = np.bincount(supplier_codes, weights=weights[candidate]).astype(np.int64)
+            matched, override_stats = matchers['override'].profile_matching_rules(list(suppliers), supplier_weights)
+        matched = matched[supplier_codes]
+        live = matched.any(axis=1)
+        rows, matched = candidate[live], matched[live]
+
+        # Rules apply in file order: each sees the L1 left by earlier
+        # overrides and the last one that fires wins.
+        targets = key_codes(r['taxonomy_key'] for r in override_rules)
+        target_l1 = level_codes[targets, 0]
+        l1 = levels[rows, 0]
+        winner = np.full(len(rows), -1, dtype=np.int64)
+        for i in np.flatnonzero(matched.any(axis=0)):
+            hit = matched[:, i] & allowed[i, l1]
+            l1[hit] = target_l1[i]
+            winner[hit] = i
+            override_stats[i]['hits'] += int(weights[rows[hit]].sum())
+
+        won = winner >= 0
+        rows, winner = rows[won], winner[won]
+        taxonomy_key[rows] = targets[winner]
+        method[rows] = ALL_METHODS.index('supplier_override')
+        confidence[rows] = np.array([r['confidence'] for r in override_rules], dtype='float64')[winner]
+        levels[rows] = level_codes[targets[winner]]
+    counts['tier7'] = sum(stat['hits'] for stat in override_stats)
+    if profile is not None and profile.per_rule:
+        profile.record_rules('tier7', override_rules, [r['supplier_pattern'] for r in override_rules],
+                             'taxonomy_key', override_stats)
+    if profile is not None:
+        profile.record_tier('tier7', time.perf_counter() - t_tier, int(weights[candidate].sum()),
+                            counts['tier7'])
 
     # Review tier assignment (vectorized)
-    high_conf_methods = method.isin(['sc_code_mapping', 'rule'])
+    t_tier = time.perf_counter()
+    high_conf_methods = np.isin(method, [ALL_METHODS.index('sc_code_mapping'), ALL_METHODS.index('rule')])
     review_tier = np.where(
         (high_conf_methods & (confidence >= 0.9)) | (confidence >= conf_high),
-        'Auto-Accept',
-        np.where(confidence >= conf_medium, 'Quick Review', 'Manual Review')
+        REVIEW_TIERS.index('Auto-Accept'),
+        np.where(confidence >= conf_medium, REVIEW_TIERS.index('Quick Review'), REVIEW_TIERS.index('Manual Review'))
+    )
+    if profile is not None:
+        profile.record_tier('review', time.perf_counter() - t_tier, int(weights.sum()), int(weights.sum()))
+
+    result = pd.DataFrame({
+        **{f'cat_l{k + 1}': pd.Categorical.from_codes(levels[:, k], level_values[k])
+           for k in range(len(TAXONOMY_LEVELS))},
+        'taxonomy_key': pd.Categorical.from_codes(taxonomy_key, tax_keys),
+        'method': pd.Categorical.from_codes(method, ALL_METHODS),
+        'confidence': confidence,
+        'review_tier': pd.Categorical.from_codes(review_tier, REVIEW_TIERS),
+    }, index=keys.index)
+    return result, counts
+
+
+# Per-process state for --workers: reference data and compiled matchers are
+# set up once by the pool initializer instead of being shipped with each task.
+_WORKER_STATE = {}
+
+
+def _init_worker(sc_mapping: dict, taxonomy_lookup: dict, rules: list[dict], refinement: dict, classif: dict):
+    _WORKER_STATE.update(
+        sc_mapping=sc_mapping,
+        taxonomy_lookup=taxonomy_lookup,
+        rules=rules,
+        refinement=refinement,
+        matchers=build_matchers(rules, refinement, classif.get('regex_engine', 're')),
+        classif=classif,
     )
 
-    t_classify_end = time.perf_counter()
-    print(f"  Classification completed in {t_classify_end - t_classify:.1f}s")
 
-    # ── Build output DataFrame ──────────────────────────────────────────
-    print(f"\nBuilding output Excel ({total_rows:,} rows)...")
+def _classify_partition(keys: pd.DataFrame, weights: np.ndarray,
+                        supplier_cache: SupplierMatchCache = None) -> tuple[pd.DataFrame, dict]:
+    state = _WORKER_STATE
+    return classify_rows(
+        keys, state['sc_mapping'], state['taxonomy_lookup'], state['rules'],
+        state['refinement'], state['matchers'], state['classif'], weights=weights,
+        supplier_cache=supplier_cache,
+    )
+
 
+def classify_parallel(executor, workers: int, keys: pd.DataFrame, weights: np.ndarray,
+                      supplier_cache: SupplierMatchCache = None) -> tuple[pd.DataFrame, dict]:
+    """Split ``keys`` into contiguous partitions, classify them in the pool and
+    reassemble the results in the original row order.
+
+    With a ``supplier_cache``, each partition is sent the cached matches of
+    its own suppliers (new suppliers are matched here first).
+    """
+    n_parts = min(len(keys), workers * 4)
+    bounds = np.linspace(0, len(keys), n_parts + 1).astype(int)
+    futures = [
+        executor.submit(
+            _classify_partition, keys.iloc[start:stop], weights[start:stop],
+            None if supplier_cache is None else supplier_cache.subset(keys['supplier'].iloc[start:stop].unique()),
+        )
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+    parts = [future.result() for future in futures]
+    counts = Counter()
+    for _, part_counts in parts:
+        counts.update(part_counts)
+    return pd.concat([result for result, _ in parts]), dict(counts)
+
+
+ALL_METHODS = [
+    'sc_code_mapping', 'supplier_refinement', 'rule',
+    'context_refinement', 'cost_center_refinement',
+    'sc_code_mapping_ambiguous', 'supplier_override', 'unmapped',
+]
+METHOD_LABELS = {
+    'sc_code_mapping': 'SC Code Mapping (direct)',
+    'supplier_refinement': 'Supplier Refinement',
+    'rule': 'Keyword Rules',
+    'context_refinement': 'Context Refinement (LoS)',
+    'cost_center_refinement': 'Cost Center Refinement',
+    'sc_code_mapping_ambiguous': 'SC Code Mapping (ambiguous fallback)',
+    'supplier_override': 'Supplier Override (post-classification)',
+    'unmapped': 'Unmapped',
+}
+REVIEW_TIERS = ['Auto-Accept', 'Quick Review', 'Manual Review']
+OUTPUT_FORMATS = ['xlsx', 'parquet', 'feather', 'csv']
+OUTPUT_LABELS = {'xlsx': 'Excel', 'parquet': 'Parquet', 'feather': 'Feather', 'csv': 'CSV'}
+DICTIONARY_COLUMNS = [
+    'SC Code', 'CategoryLevel1', 'CategoryLevel2', 'CategoryLevel3', 'CategoryLevel4', 'CategoryLevel5',
+    'TaxonomyKey', 'ClassificationMethod', 'ReviewTier',
+]
+
+
+CSV_ENGINES = ['c', 'pyarrow']
+
+
+def input_columns(config: dict, incremental: bool = False) -> list[str]:
+    """Every input column the run uses: mapped, passthrough, aggregation and (incremental) key columns."""
+    cols = config['columns']
+    columns = [cols[k] for k in ('spend_category', 'supplier', 'line_memo', 'line_of_service', 'cost_center', 'amount')]
+    columns += cols.get('passthrough', [])
+    columns += [agg['column'] for agg in config.get('aggregations', [])]
+    if incremental:
+        columns += config.get('incremental', {}).get('key_columns', INCREMENTAL_KEY_COLUMNS)
+    return list(dict.fromkeys(columns))
+
+
+def input_dtypes(config: dict) -> dict:
+    """Declared dtypes for the input columns, overridable per column with ``input.dtypes``.
+
+    Spend category, supplier, line of service, cost center and aggregation
+    columns are low-cardinality text and are read as ``category``; the line
+    memo as string. The amount and passthrough-only columns keep inferred
+    types (``numeric_amounts`` converts the amount after reading). Categories
+    are always text, so a column that looks numeric in one chunk still
+    classifies and groups like the rest of the file.
+    """
+    cols = config['columns']
+    dtypes = {cols[k]: 'category' for k in ('spend_category', 'supplier', 'line_of_service', 'cost_center')}
+    for agg in config.get('aggregations', []):
+        if agg['column'] != cols['amount']:
+            dtypes[agg['column']] = 'category'
+    dtypes[cols['line_memo']] = str
+    dtypes.update(config.get('input', {}).get('dtypes', {}))
+    return dtypes
+
+
+INPUT_CACHE_MAX_MB = 2048
+
+
+class InputCache:
+    """Parsed input CSVs kept as uncompressed Arrow IPC files under ``directory`` (``input.cache``).
+
+    An entry is the CSV parsed once with the run's columns and dtypes, and is
+    keyed by the file's content hash together with that read spec, so the
+    same file under another name (``--input``) or another path is a hit.
+    The hash is recomputed only when the file's size or mtime differs from
+    the last time it was hashed. Later runs memory-map the entry and convert
+    only its columns, with no text parsing. Least recently used entries are
+    evicted once the directory holds more than ``max_bytes``.
+    """
+
+    VERSION = 1
+    BATCH_ROWS = 1_000_000
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.manifest_path = directory / 'manifest.json'
+        self.manifest = {'version': self.VERSION, 'files': {}, 'entries': {}}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == self.VERSION:
+                self.manifest = manifest
+        except (OSError, ValueError):
+            pass
+
+    def content_hash(self, path: Path) -> str:
+        """SHA-256 of the file, reused while its size and mtime are unchanged."""
+        stat = path.stat()
+        known = self.manifest['files'].get(str(path))
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                digest.update(block)
+        self.manifest['files'][str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                             'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def key(self, path: Path, usecols: list[str], dtypes: dict) -> str:
+        spec = {
+            'version': self.VERSION,
+            'content': self.content_hash(path),
+            'columns': usecols,
+            'dtypes': {c: str(t) for c, t in dtypes.items()},
+            'pandas': pd.__version__,
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:32]
+
+    def lookup(self, key: str) -> Path:
+        """The entry's file, or None when it is not cached."""
+        entry = self.manifest['entries'].get(key)
+        if entry is None or not (self.directory / entry['file']).exists():
+            return None
+        entry['used'] = time.time()
+        self._save_manifest()
+        return self.directory / entry['file']
+
+    def store(self, key: str, chunks, categorical: list[str], source: Path) -> Path:
+        """Write the parsed ``chunks`` as the entry for ``key``; None when they cannot be cached.
+
+        ``categorical`` columns are stored as text and made categorical again
+        on read, because each chunk has its own categories.
+        """
+        import pyarrow as pa
+        path = self.directory / f"input_{key}.arrow"
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        writer = None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for chunk in chunks:
+                for col in categorical:
+                    chunk[col] = chunk[col].astype(object)
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = pa.ipc.new_file(str(tmp_path), schema)
+                writer.write_table(table.cast(schema))
+            if writer is None:
+                return None
+            writer.close()
+            os.replace(tmp_path, path)
+        except (pa.ArrowException, OSError) as e:
+            if writer is not None:
+                writer.close()
+            tmp_path.unlink(missing_ok=True)
+            print(f"  WARNING: Input not cached ({e}); reading the CSV")
+            return None
+        self.manifest['entries'][key] = {'file': path.name, 'bytes': path.stat().st_size,
+                                         'source': str(source), 'used': time.time()}
+        self._evict()
+        self._save_manifest()
+        if key not in self.manifest['entries']:
+            print("  Input cache: the parsed input exceeds input.cache_max_mb; reading the CSV")
+            return None
+        return path
+
+    def _evict(self):
+        entries = self.manifest['entries']
+        total = sum(entry['bytes'] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['used']):
+            if total <= self.max_bytes:
+                break
+            try:
+                (self.directory / entries[key]['file']).unlink(missing_ok=True)
+            except OSError:
+                continue
+            total -= entries.pop(key)['bytes']
+
+    def _save_manifest(self):
+        try:
+            tmp_path = self.manifest_path.with_name(f"manifest.json.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            print(f"  WARNING: Could not write input cache manifest to {self.directory}: {e}")
+
+    @staticmethod
+    def read(path: Path, categorical: list[str], chunk_size: int = None):
+        """Yield the memory-mapped entry as one DataFrame, or one per ``chunk_size`` rows."""
+        import pyarrow as pa
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+        step = chunk_size or max(table.num_rows, 1)
+        for start in range(0, table.num_rows, step):
+            df = table.slice(start, step).to_pandas()
+            df.index = pd.RangeIndex(start, start + len(df))
+            for col in categorical:
+                df[col] = df[col].astype('category')
+            yield df
+
+
+def numeric_amounts(df: pd.DataFrame, amount_col: str) -> pd.DataFrame:
+    """``df`` with its amount column as float64; cells that are not numbers become blank, with a warning."""
+    if amount_col not in df.columns:
+        return df
+    amounts = df[amount_col]
+    if not pd.api.types.is_numeric_dtype(amounts):
+        numeric = pd.to_numeric(amounts, errors='coerce')
+        bad = int((numeric.isna() & amounts.notna()).sum())
+        if bad:
+            print(f"  WARNING: {bad:,} non-numeric values in '{amount_col}' read as blank")
+        amounts = numeric
+    df[amount_col] = amounts.astype('float64')
+    return df
+
+
+def open_input(config: dict, chunk_size: int = None, incremental: bool = False, engine: str = None,
+               use_cache: bool = True):
+    """Yield the input CSV as one DataFrame, or one per ``chunk_size`` rows.
+
+    Only the columns in ``input_columns`` are parsed, with ``input_dtypes``,
+    and the amount is made numeric with ``numeric_amounts``.
+    ``engine`` (default ``input.engine``, else ``c``) may be ``pyarrow`` for
+    multi-threaded parsing; it cannot stream, so chunked reads use ``c``.
+    With ``input.cache`` (and ``use_cache``) the parsed input is read from,
+    or first written to, an ``InputCache`` in the cache directory.
+    """
+    amount_col = config['columns']['amount']
+    for df in _read_input(config, chunk_size, incremental, engine, use_cache):
+        yield numeric_amounts(df, amount_col)
+
+
+def _read_input(config: dict, chunk_size: int, incremental: bool, engine: str, use_cache: bool):
+    paths = config['_resolved_paths']
+    path = paths['input']
+    input_settings = config.get('input', {})
+    engine = engine or input_settings.get('engine', 'c')
+    cache = None
+    if use_cache and input_settings.get('cache'):
+        _require_pyarrow(feature='input.cache')
+        cache = InputCache(paths['cache_dir'] / 'input',
+                           input_settings.get('cache_max_mb', INPUT_CACHE_MAX_MB) * 2**20)
+    if engine == 'pyarrow':
+        _require_pyarrow(feature="input.engine 'pyarrow'")
+        if chunk_size:
+            print("  The pyarrow CSV engine cannot stream chunks; using the default parser")
+            engine = 'c'
+    try:
+        header = pd.read_csv(path, nrows=0).columns
+        wanted = set(input_columns(config, incremental))
+        usecols = [c for c in header if c in wanted]
+        dtypes = {c: t for c, t in input_dtypes(config).items() if c in usecols}
+        if cache is not None:
+            key = cache.key(Path(path), usecols, dtypes)
+            categorical = [c for c, t in dtypes.items() if t == 'category']
+            cached = cache.lookup(key)
+            if cached is None:
+                print(f"  Input cache: parsing {len(usecols)} of {len(header)} columns into {cache.directory}")
+                cached = cache.store(key, pd.read_csv(path, usecols=usecols, dtype=dtypes, low_memory=False,
+                                                      chunksize=chunk_size or cache.BATCH_ROWS),
+                                     categorical, path)
+            else:
+                print(f"  Input cache: memory-mapping {cached.name} ({len(usecols)} of {len(header)} columns)")
+            if cached is not None:
+                yield from cache.read(cached, categorical, chunk_size)
+                return
+        print(f"  Reading {len(usecols)} of {len(header)} columns"
+              f"{' (pyarrow engine)' if engine == 'pyarrow' else ''}")
+        if chunk_size:
+            yield from pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunk_size)
+        elif engine == 'pyarrow':
+            yield pd.read_csv(path, usecols=usecols, dtype=dtypes, engine='pyarrow')
+        else:
+            yield pd.read_csv(path, usecols=usecols, dtype=dtypes, low_memory=False)
+    except ValueError as e:
+        raise ConfigError(f"Could not read {path} with the declared column types: {e}")
+
+
+def resident_memory() -> int:
+    """Resident set size of this process in bytes (peak size where only that is available), or None."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def peak_memory() -> int:
+    """Peak resident set size of this process in bytes (the current size where only that is available), or None."""
+    try:
+        import resource
+    except ImportError:
+        return resident_memory()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _by_category(values: pd.Series, transform) -> pd.Series:
+    """``transform`` (a function of a Series) applied once per distinct value.
+
+    A column read as ``category`` is transformed on its categories (plus one
+    missing value) and gathered back by code; any other column row by row.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return transform(values)
+    categories = values.cat.categories
+    domain = pd.Series(np.append(categories.to_numpy(dtype=object), np.nan), dtype=categories.dtype)
+    transformed = transform(domain)
+    result = transformed.take(values.cat.codes.to_numpy())
+    result.index = values.index
+    return result
+
+
+def check_input_columns(df: pd.DataFrame, cols: dict):
+    required_csv_cols = {
+        'spend_category': cols['spend_category'],
+        'supplier': cols['supplier'],
+        'line_memo': cols['line_memo'],
+        'line_of_service': cols['line_of_service'],
+        'cost_center': cols['cost_center'],
+        'amount': cols['amount'],
+    }
+    missing_csv_cols = [
+        f"'{v}' (from columns.{k})"
+        for k, v in required_csv_cols.items()
+        if v not in df.columns
+    ]
+    if missing_csv_cols:
+        raise ConfigError(f"Columns not found in input CSV: {', '.join(missing_csv_cols)}")
+
+
+def extract_keys(df: pd.DataFrame, cols: dict, sc_pattern: str) -> tuple[pd.DataFrame, pd.Series]:
+    """Build the classification key columns; also returns the stripped spend category text."""
+    def strip(values):
+        return values.astype(str).str.strip()
+
+    def sc_code(values):
+        stripped = strip(values)
+        extracted = stripped.str.extract(f'({sc_pattern})', expand=False)
+        if isinstance(extracted, pd.DataFrame):
+            extracted = extracted.iloc[:, 0]
+        return extracted.fillna(stripped)
+
+    def text(values):
+        return values.fillna('').astype(str)
+
+    spend_category = df[cols['spend_category']]
+    keys = pd.DataFrame({
+        'sc_code': _by_category(spend_category, sc_code),
+        'supplier': _by_category(df[cols['supplier']], text),
+        'line_memo': _by_category(df[cols['line_memo']], text),
+        'line_of_service': _by_category(df[cols['line_of_service']], text),
+        'cost_center': _by_category(df[cols['cost_center']], text),
+    })
+    return keys, _by_category(spend_category, strip)
+
+
+def build_results_frame(df: pd.DataFrame, cols: dict, keys: pd.DataFrame, spend_cat_str: pd.Series,
+                        classified: pd.DataFrame) -> pd.DataFrame:
     amount_col = cols['amount']
 
     output_columns = {
-        cols['supplier']: supplier,
+        cols['supplier']: keys['supplier'],
     }
     for col_name in cols.get('passthrough', []):
         if col_name not in output_columns:
             output_columns[col_name] = df.get(col_name, pd.Series('', index=df.index))
 
-    output_columns[cols['line_memo']] = line_memo
+    output_columns[cols['line_memo']] = keys['line_memo']
     output_columns['Spend Category (Source)'] = spend_cat_str
-    output_columns['SC Code'] = sc_code
+    output_columns['SC Code'] = keys['sc_code'].astype('category')
     output_columns[cols['cost_center']] = df.get(cols['cost_center'], pd.Series('', index=df.index))
     output_columns[cols['line_of_service']] = df.get(cols['line_of_service'], pd.Series('', index=df.index))
 
     if amount_col not in output_columns:
         output_columns[amount_col] = df[amount_col]
 
-    output_columns['CategoryLevel1'] = cat_l1
-    output_columns['CategoryLevel2'] = cat_l2
-    output_columns['CategoryLevel3'] = cat_l3
-    output_columns['CategoryLevel4'] = cat_l4
-    output_columns['CategoryLevel5'] = cat_l5
-    output_columns['TaxonomyKey'] = taxonomy_key
-    output_columns['ClassificationMethod'] = method
-    output_columns['Confidence'] = confidence.round(3)
-    output_columns['ReviewTier'] = review_tier
-
-    results_df = pd.DataFrame(output_columns)
-
-    method_counts = results_df['ClassificationMethod'].value_counts().to_dict()
-    tier_counts = results_df['ReviewTier'].value_counts().to_dict()
-    unmapped_sc = Counter()
-    if method_counts.get('unmapped', 0) > 0:
-        unmapped_rows = results_df[results_df['ClassificationMethod'] == 'unmapped']
-        unmapped_sc = Counter(unmapped_rows['Spend Category (Source)'].tolist())
-
-    with pd.ExcelWriter(output_xlsx, engine='openpyxl') as writer:
-        results_df.to_excel(writer, sheet_name='All Results', index=False)
-
-        manual_df = results_df[results_df['ReviewTier'] == 'Manual Review']
-        if not manual_df.empty:
-            manual_df.to_excel(writer, sheet_name='Manual Review', index=False)
-
-        quick_df = results_df[results_df['ReviewTier'] == 'Quick Review']
-        if not quick_df.empty:
-            quick_df.to_excel(writer, sheet_name='Quick Review', index=False)
-
-        all_methods = [
-            'sc_code_mapping', 'supplier_refinement', 'rule',
-            'context_refinement', 'cost_center_refinement',
-            'sc_code_mapping_ambiguous', 'supplier_override', 'unmapped',
-        ]
-        method_labels = {
-            'sc_code_mapping': 'SC Code Mapping (direct)',
-            'supplier_refinement': 'Supplier Refinement',
-            'rule': 'Keyword Rules',
-            'context_refinement': 'Context Refinement (LoS)',
-            'cost_center_refinement': 'Cost Center Refinement',
-            'sc_code_mapping_ambiguous': 'SC Code Mapping (ambiguous fallback)',
-            'supplier_override': 'Supplier Override (post-classification)',
-            'unmapped': 'Unmapped',
-        }
+    output_columns['CategoryLevel1'] = classified['cat_l1']
+    output_columns['CategoryLevel2'] = classified['cat_l2']
+    output_columns['CategoryLevel3'] = classified['cat_l3']
+    output_columns['CategoryLevel4'] = classified['cat_l4']
+    output_columns['CategoryLevel5'] = classified['cat_l5']
+    output_columns['TaxonomyKey'] = classified['taxonomy_key']
+    output_columns['ClassificationMethod'] = classified['method']
+    output_columns['Confidence'] = classified['confidence'].round(3)
+    output_columns['ReviewTier'] = classified['review_tier']
+
+    return pd.DataFrame(output_columns)
+
+
+class Categorizer:
+    """A client's reference data and compiled rules, loaded once and reused for every batch.
+
+    ``classify(df)`` returns the All Results rows for an input DataFrame and
+    ``classify_records`` does the same for an iterable of dicts, so a
+    long-lived process can classify many files or micro-batches with no
+    per-call setup. With ``workers`` > 1 the distinct keys are classified in
+    a process pool, started on first use and shut down by ``close()``.
+    Supplier matches are kept in a ``SupplierMatchCache``, persisted under the
+    cache directory by ``close()`` when ``use_cache`` is set.
+    """
+
+    def __init__(self, config: dict, use_cache: bool = True, workers: int = None, reference: dict = None):
+        paths = config['_resolved_paths']
+        self.config = config
+        self.cols = config['columns']
+        self.classif = config['classification']
+        if reference is None:
+            reference = load_reference_bundle(paths, paths['cache_dir'] if use_cache else None)
+        self.reference = reference
+        self.sc_mapping = reference['sc_mapping']
+        self.taxonomy_lookup = reference['taxonomy_lookup']
+        self.rules = reference['rules']
+        self.refinement = reference['refinement']
+        self.matchers = reference['matchers']
+        engine = self.classif.get('regex_engine', 're')
+        if engine == 're2':
+            _require_re2()
+            self.matchers = build_matchers(self.rules, self.refinement, 're2')
+        self.supplier_cache = None
+        cache_size = self.classif.get('supplier_cache_size', SUPPLIER_CACHE_SIZE)
+        if cache_size:
+            cache_path = paths['cache_dir'] / 'supplier_matches.pkl' if use_cache else None
+            self.supplier_cache = SupplierMatchCache(self.refinement, cache_path, cache_size, engine)
+        self.workers = workers if workers and workers > 1 else None
+        self._executor = None
+
+    def invalid_mappings(self) -> list[tuple[str, str]]:
+        """SC mappings whose taxonomy key is not in the taxonomy."""
+        taxonomy_keys = self.reference['taxonomy_keys']
+        return [(sc_code, info['taxonomy_key']) for sc_code, info in self.sc_mapping.items()
+                if info['taxonomy_key'] not in taxonomy_keys]
+
+    def classify_keys(self, keys: pd.DataFrame,
+                      profile: ClassificationProfile = None) -> tuple[pd.DataFrame, dict, int]:
+        """Classify each distinct key tuple once and broadcast the result back to its rows.
+
+        Returns the per-row classification (indexed like ``keys``), the tier
+        counts in rows and the number of distinct keys. A ``profile`` runs
+        in this process even when workers are configured.
+        """
+        row_codes, first_rows = factorize_rows(keys)
+        unique_keys = keys.iloc[first_rows].reset_index(drop=True)
+        weights = np.bincount(row_codes)
+        if self.workers and profile is None:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker,
+                    initargs=(self.sc_mapping, self.taxonomy_lookup, self.rules, self.refinement, self.classif),
+                )
+            unique_results, counts = classify_parallel(self._executor, self.workers, unique_keys, weights,
+                                                       self.supplier_cache)
+        else:
+            unique_results, counts = classify_rows(
+                unique_keys, self.sc_mapping, self.taxonomy_lookup, self.rules, self.refinement,
+                self.matchers, self.classif, weights=weights, profile=profile,
+                supplier_cache=self.supplier_cache,
+            )
+        classified = unique_results.take(row_codes)
+        classified.index = keys.index
+        return classified, counts, len(unique_keys)
+
+    def classify(self, df: pd.DataFrame) -> pd.DataFrame:
+        """The All Results rows (passthrough columns plus classification) for ``df``."""
+        check_input_columns(df, self.cols)
+        keys, spend_cat_str = extract_keys(df, self.cols, self.classif['sc_code_pattern'])
+        classified, _, _ = self.classify_keys(keys)
+        return build_results_frame(df, self.cols, keys, spend_cat_str, classified)
+
+    def classify_records(self, records) -> list[dict]:
+        """Classify an iterable of dicts keyed by input column name; one result dict per record.
+
+        Missing text columns are treated as blank and a missing amount as
+        NaN. Values come back as plain Python objects, with None for missing.
+        """
+        df = pd.DataFrame.from_records(list(records))
+        if df.empty:
+            return []
+        for key in ('spend_category', 'supplier', 'line_memo', 'line_of_service', 'cost_center'):
+            if self.cols[key] not in df.columns:
+                df[self.cols[key]] = ''
+        if self.cols['amount'] not in df.columns:
+            df[self.cols['amount']] = np.nan
+        results = self.classify(df).astype(object)
+        return results.where(results.notna(), None).to_dict('records')
+
+    def close(self):
+        """Shut the worker pool down and save the supplier match cache."""
+        if self.supplier_cache is not None:
+            self.supplier_cache.save()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+INCREMENTAL_KEY_COLUMNS = ['Invoice Number', 'Invoice Line']
+
+
+class IncrementalState:
+    """Classification results of the previous ``--incremental`` run, keyed by row identity.
+
+    A row is reused when its identity (``key_columns``, e.g. Invoice Number +
+    Invoice Line) was classified last run with the same classification inputs;
+    new and changed rows go through the waterfall again. The whole store is
+    ignored when ``fingerprint`` (reference files, classification settings,
+    column mapping) differs from the one it was saved with. ``save`` replaces
+    it with the results of the current run.
+    """
+
+    VERSION = 1
+    RESULT_COLUMNS = ['cat_l1', 'cat_l2', 'cat_l3', 'cat_l4', 'cat_l5',
+                      'taxonomy_key', 'method', 'confidence', 'review_tier']
+
+    def __init__(self, path: Path, key_columns: list[str], fingerprint: str):
+        self.path = path
+        self.key_columns = key_columns
+        self.fingerprint = fingerprint
+        self.previous = None
+        self.stale = False
+        self.reused_rows = 0
+        self._parts = []
+        if path.exists():
+            try:
+                saved = pd.read_pickle(path)
+            except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+                saved = {}
+            if saved.get('fingerprint') == fingerprint:
+                self.previous = saved['rows']
+            else:
+                self.stale = True
+
+    def row_hashes(self, df: pd.DataFrame, keys: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """Per-row identity hash and classification-input hash."""
+        missing = [c for c in self.key_columns if c not in df.columns]
+        if missing:
+            raise ConfigError(f"Incremental key columns not found in input CSV: {', '.join(missing)}")
+        identity = pd.util.hash_pandas_object(df[self.key_columns].astype(str), index=False).to_numpy()
+        input_hash = pd.util.hash_pandas_object(keys[CLASSIFICATION_KEYS], index=False).to_numpy()
+        return identity, input_hash
+
+    def reusable(self, identity: np.ndarray, input_hash: np.ndarray) -> tuple[np.ndarray, pd.DataFrame]:
+        """Mask of rows whose previous result still applies, and those results in row order."""
+        if self.previous is None:
+            return np.zeros(len(identity), dtype=bool), None
+        pos = self.previous.index.get_indexer(identity)
+        reuse = pos >= 0
+        reuse[reuse] = self.previous['input_hash'].to_numpy()[pos[reuse]] == input_hash[reuse]
+        self.reused_rows += int(reuse.sum())
+        results = self.previous.iloc[pos[reuse]][self.RESULT_COLUMNS]
+        return reuse, results.astype({c: object for c in self.RESULT_COLUMNS if c != 'confidence'})
+
+    def record(self, identity: np.ndarray, input_hash: np.ndarray, classified: pd.DataFrame):
+        part = classified[self.RESULT_COLUMNS].reset_index(drop=True)
+        part.insert(0, 'input_hash', input_hash)
+        part.index = pd.Index(identity, name='identity')
+        self._parts.append(part)
+
+    def save(self):
+        rows = pd.concat(self._parts) if self._parts else pd.DataFrame(columns=['input_hash'] + self.RESULT_COLUMNS)
+        rows = rows[~rows.index.duplicated(keep='last')]
+        for col in self.RESULT_COLUMNS:
+            if col != 'confidence':
+                rows[col] = rows[col].astype('category')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        pd.to_pickle({'version': self.VERSION, 'fingerprint': self.fingerprint, 'rows': rows}, tmp_path)
+        os.replace(tmp_path, self.path)
+
+
+def incremental_fingerprint(config: dict) -> str:
+    """Fingerprint of everything besides the row itself that decides its classification."""
+    settings = {
+        'state_version': IncrementalState.VERSION,
+        'reference': reference_fingerprint(config['_resolved_paths']),
+        'classification': config['classification'],
+        'columns': {k: v for k, v in config['columns'].items() if k != 'passthrough'},
+        'pandas': pd.__version__,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+
+EXACT_SUM_SHIFT = 1126
+_EXACT_SHIFTS = 4096
+_EXACT_BLOCK = 2 ** 26
+
+
+def split_floats(values) -> tuple:
+    """``values`` split for ``exact_sums``: once per column, however many groupings sum it.
+
+    Every finite double is an integer multiple of ``2**-EXACT_SUM_SHIFT``,
+    ``(high * 2**27 + low) << shift`` in those units; infinities are kept
+    as floats and NaNs are dropped.
+    """
+    values = np.asarray(values, dtype='float64')
+    finite = np.isfinite(values)
+    infinite = ~finite & ~np.isnan(values)
+    mantissa, exponent = np.frexp(values[finite])
+    high, low = np.divmod((mantissa * 2.0 ** 53).astype(np.int64), 2 ** 27)
+    return finite, exponent + (EXACT_SUM_SHIFT - 53), high, low, infinite, values[infinite]
+
+
+def exact_sums(codes: np.ndarray, parts: tuple, size: int) -> tuple[list[int], np.ndarray]:
+    """Exact per-group sums of ``split_floats`` parts, for group ``codes`` in ``range(size)``.
+
+    Each group's finite values add up to an exact integer in units of
+    ``2**-EXACT_SUM_SHIFT``, and its infinities to a float. Sums from any
+    split of the data add up to the same totals, and ``exact_float`` rounds
+    them like ``math.fsum`` over all the values would. The mantissa halves
+    are summed per (group, exponent) cell with ``np.bincount``, which is
+    exact for up to ``2**26`` values at a time.
+    """
+    finite, shift, high, low, infinite, infinities = parts
+    codes = np.asarray(codes, dtype=np.int64)
+    special = np.bincount(codes[infinite], weights=infinities, minlength=size).astype('float64')
+    totals = [0] * size
+    cell_keys = codes[finite] * _EXACT_SHIFTS + shift
+    for start in range(0, len(cell_keys), _EXACT_BLOCK):
+        block = slice(start, start + _EXACT_BLOCK)
+        cell_codes, cells = pd.factorize(cell_keys[block])
+        high_sums = np.bincount(cell_codes, weights=high[block], minlength=len(cells))
+        low_sums = np.bincount(cell_codes, weights=low[block], minlength=len(cells))
+        for cell, h, l in zip(cells.tolist(), high_sums.tolist(), low_sums.tolist()):
+            group, cell_shift = divmod(cell, _EXACT_SHIFTS)
+            totals[group] += ((int(h) << 27) + int(l)) << cell_shift
+    return totals, special
+
+
+def exact_float(total: int, special: float = 0.0) -> float:
+    """The correctly rounded float of an ``exact_sums`` total."""
+    try:
+        return total / 2 ** EXACT_SUM_SHIFT + special
+    except OverflowError:
+        return (math.inf if total > 0 else -math.inf) + special
+
+
+def group_codes(frame: pd.DataFrame, columns: list[str]) -> tuple[np.ndarray, list]:
+    """Group code per row (-1 where any column is missing) and the key of each code.
+
+    Keys are scalars for one column and tuples for several, as ``groupby`` names them.
+    """
+    codes, uniques = pd.factorize(frame[columns[0]])
+    keys = [(k,) for k in uniques]
+    for col in columns[1:]:
+        col_codes, col_uniques = pd.factorize(frame[col])
+        present = (codes >= 0) & (col_codes >= 0)
+        pair_codes, pairs = pd.factorize(codes[present] * len(col_uniques) + col_codes[present])
+        codes = np.full(len(codes), -1, dtype=np.int64)
+        codes[present] = pair_codes
+        parents, children = np.divmod(pairs, len(col_uniques))
+        keys = [(*keys[p], col_uniques[c]) for p, c in zip(parents.tolist(), children.tolist())]
+    return codes, [k[0] for k in keys] if len(columns) == 1 else keys
+
+
+class SpendGroups:
+    """Row counts, exact spend, distinct suppliers and confidence per group of one summary table.
+
+    Groups get a stable id in order of first appearance; ``update`` adds one
+    frame's rows by group code and ``merge`` adds another ``SpendGroups``
+    built from other rows, matching groups (and suppliers) by key.
+    """
+
+    def __init__(self, suppliers: bool = False, confidence: bool = False):
+        self.ids = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.amount = []
+        self.amount_special = np.zeros(0)
+        self.supplier_pairs = set() if suppliers else None
+        self.conf = [] if confidence else None
+        self.conf_special = np.zeros(0)
+        self.conf_count = np.zeros(0, dtype=np.int64)
+
+    def _group_ids(self, keys) -> np.ndarray:
+        ids = np.array([self.ids.setdefault(k, len(self.ids)) for k in keys], dtype=np.int64)
+        grow = len(self.ids) - len(self.count)
+        if grow:
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int64)])
+            self.amount += [0] * grow
+            self.amount_special = np.concatenate([self.amount_special, np.zeros(grow)])
+            if self.conf is not None:
+                self.conf += [0] * grow
+                self.conf_special = np.concatenate([self.conf_special, np.zeros(grow)])
+                self.conf_count = np.concatenate([self.conf_count, np.zeros(grow, dtype=np.int64)])
+        return ids
+
+    def update(self, codes: np.ndarray, keys: list, supplier_ids: np.ndarray, amount: tuple,
+               conf: tuple = None, conf_present: np.ndarray = None):
+        """Add rows by group code (-1: no group).
+
+        ``supplier_ids`` are -1 where the supplier is missing; ``amount`` and
+        ``conf`` are ``split_floats`` parts and ``conf_present`` marks the
+        rows with a confidence.
+        """
+        group_ids = np.append(self._group_ids(keys), len(self.ids))
+        size = len(self.ids)
+        groups = group_ids[codes]
+        has_supplier = supplier_ids >= 0
+        self.count += np.bincount(groups[has_supplier], minlength=size + 1)[:size]
+        totals, special = exact_sums(groups, amount, size + 1)
+        self.amount = [a + b for a, b in zip(self.amount, totals)]
+        self.amount_special += special[:size]
+        if self.supplier_pairs is not None:
+            grouped = has_supplier & (codes >= 0)
+            self.supplier_pairs.update(pd.unique((groups[grouped] << 32) | supplier_ids[grouped]).tolist())
+        if self.conf is not None:
+            totals, special = exact_sums(groups, conf, size + 1)
+            self.conf = [a + b for a, b in zip(self.conf, totals)]
+            self.conf_special += special[:size]
+            self.conf_count += np.bincount(groups[conf_present], minlength=size + 1)[:size]
+
+    def merge(self, other: SpendGroups, supplier_ids: np.ndarray = None):
+        """Add ``other``'s groups; ``supplier_ids`` maps its supplier ids to this table's."""
+        other_keys = list(other.ids)
+        group_ids = self._group_ids(other_keys)
+        self.count[group_ids] += other.count
+        for i, total in zip(group_ids.tolist(), other.amount):
+            self.amount[i] += total
+        self.amount_special[group_ids] += other.amount_special
+        if self.supplier_pairs is not None and other.supplier_pairs:
+            pairs = np.fromiter(other.supplier_pairs, dtype=np.int64, count=len(other.supplier_pairs))
+            self.supplier_pairs.update(((group_ids[pairs >> 32] << 32) | supplier_ids[pairs & 0xFFFFFFFF]).tolist())
+        if self.conf is not None:
+            for i, total in zip(group_ids.tolist(), other.conf):
+                self.conf[i] += total
+            self.conf_special[group_ids] += other.conf_special
+            self.conf_count[group_ids] += other.conf_count
+
+    def table(self, names: list[str]) -> tuple[np.ndarray, pd.Index]:
+        """Group ids in key order and the matching index."""
+        keys = sorted(self.ids)
+        if len(names) == 1:
+            index = pd.Index(keys, name=names[0])
+        else:
+            index = pd.MultiIndex.from_tuples(keys, names=names)
+        return np.array([self.ids[k] for k in keys], dtype=np.int64), index
+
+    def spend(self, ids: np.ndarray) -> list[float]:
+        return [exact_float(self.amount[i], self.amount_special[i]) for i in ids.tolist()]
+
+    def unique_suppliers(self, ids: np.ndarray) -> np.ndarray:
+        pairs = np.fromiter(self.supplier_pairs, dtype=np.int64, count=len(self.supplier_pairs))
+        return np.bincount(pairs >> 32, minlength=len(self.ids))[ids]
+
+    def avg_confidence(self, ids: np.ndarray) -> list[float]:
+        return [exact_float(self.conf[i], self.conf_special[i]) / self.conf_count[i] if self.conf_count[i]
+                else float('nan') for i in ids.tolist()]
+
+
+class SummaryAccumulator:
+    """Summary and spend tables built from partial results.
+
+    ``update`` takes one results frame (a chunk or the whole input) and
+    codes it once: suppliers get ids and every summary table's grouping
+    columns become group codes, from which counts, exact spend sums and
+    distinct suppliers are gathered with numpy. Each table is a
+    ``SpendGroups``, and ``merge`` adds an accumulator built from other rows,
+    so the final tables equal a single group-by over all rows no matter how
+    the input was split.
+    """
+
+    def __init__(self, cols: dict, aggregations: list[dict]):
+        self.supplier_col = cols['supplier']
+        self.amount_col = cols['amount']
+        self.aggregations = aggregations
+        self.total_rows = 0
+        self.method_counts = Counter()
+        self.tier_counts = Counter()
+        self.unmapped_sc = Counter()
+        self.suppliers = {}
+        self.sc_codes = set()
+        self.columns = None
+        self._amount = 0
+        self._amount_special = 0.0
+        self._amount_count = 0
+        self._groups = {'l1': SpendGroups(suppliers=True, confidence=True), 'l2': SpendGroups(suppliers=True),
+                        **{agg['column']: SpendGroups() for agg in aggregations}}
+        self._group_columns = {'l1': ['CategoryLevel1'], 'l2': ['CategoryLevel1', 'CategoryLevel2'],
+                               **{agg['column']: [agg['column']] for agg in aggregations}}
+
+    def _supplier_ids(self, values) -> np.ndarray:
+        """Ids of ``values`` in ``self.suppliers``, added on first sight."""
+        suppliers = self.suppliers
+        return np.array([suppliers.setdefault(s, len(suppliers)) for s in values], dtype=np.int64)
+
+    def update(self, results_df: pd.DataFrame):
+        if self.columns is None:
+            self.columns = list(results_df.columns)
+        self.total_rows += len(results_df)
+        self.method_counts.update(results_df['ClassificationMethod'].value_counts().to_dict())
+        self.tier_counts.update(results_df['ReviewTier'].value_counts().to_dict())
+        unmapped = (results_df['ClassificationMethod'] == 'unmapped').to_numpy()
+        sc_codes, sc_values = pd.factorize(results_df['Spend Category (Source)'][unmapped].to_numpy())
+        counts = np.bincount(sc_codes + 1, minlength=len(sc_values) + 1).tolist()
+        self.unmapped_sc.update(dict(zip(sc_values, counts[1:])))
+        if counts[0]:
+            # Blank spend categories all count under the one np.nan object, as in a single-shot Counter
+            self.unmapped_sc[np.nan] += counts[0]
+        self.sc_codes.update(results_df['SC Code'].dropna().unique())
+
+        supplier_codes, supplier_values = pd.factorize(results_df[self.supplier_col])
+        supplier_ids = np.append(self._supplier_ids(supplier_values), -1)[supplier_codes]
+        amount = results_df[self.amount_col].to_numpy(dtype='float64', na_value=np.nan)
+        amount_parts = split_floats(amount)
+        (total,), special = exact_sums(np.zeros(len(amount), dtype=np.int64), amount_parts, 1)
+        self._amount += total
+        self._amount_special += special[0]
+        self._amount_count += int((~np.isnan(amount)).sum())
+
+        conf = results_df['Confidence'].to_numpy(dtype='float64', na_value=np.nan)
+        conf_parts = split_floats(conf)
+        for name, columns in self._group_columns.items():
+            if columns[-1] in results_df.columns:
+                codes, keys = group_codes(results_df, columns)
+                self._groups[name].update(codes, keys, supplier_ids, amount_parts, conf_parts, ~np.isnan(conf))
+
+    def merge(self, other: SummaryAccumulator):
+        """Add the rows ``other`` accumulated, as if they had been passed to ``update``."""
+        if self.columns is None:
+            self.columns = other.columns
+        self.total_rows += other.total_rows
+        self.method_counts.update(other.method_counts)
+        self.tier_counts.update(other.tier_counts)
+        for sc, count in other.unmapped_sc.items():
+            self.unmapped_sc[np.nan if pd.isna(sc) else sc] += count
+        self.sc_codes.update(other.sc_codes)
+        supplier_ids = self._supplier_ids(other.suppliers)
+        self._amount += other._amount
+        self._amount_special += other._amount_special
+        self._amount_count += other._amount_count
+        for name, groups in self._groups.items():
+            groups.merge(other._groups[name], supplier_ids)
+
+    @property
+    def amount_total(self) -> float:
+        return exact_float(self._amount, self._amount_special)
+
+    @property
+    def amount_mean(self) -> float:
+        return self.amount_total / self._amount_count if self._amount_count else float('nan')
+
+    def summary_frame(self) -> pd.DataFrame:
+        total_rows = self.total_rows
         method_rows = []
         method_values = []
-        for m in all_methods:
-            c = method_counts.get(m, 0)
+        for m in ALL_METHODS:
+            c = self.method_counts.get(m, 0)
             if c > 0:
-                method_rows.append(method_labels[m])
+                method_rows.append(METHOD_LABELS[m])
                 method_values.append(f"{c:,} ({c/total_rows*100:.1f}%)")
 
-        summary_data = {
+        tier_counts = self.tier_counts
+        return pd.DataFrame({
             'Metric': [
                 'Total Transactions',
-                f'Unique {cols["supplier"]}s',
+                f'Unique {self.supplier_col}s',
                 'Unique SC Codes',
                 '--- Classification Methods ---',
                 *method_rows,
@@ -517,13 +2232,13 @@ def main(config: dict):
                 'Quick Review',
                 'Manual Review',
                 '--- Financial ---',
-                f'Total {amount_col}',
-                f'Average {amount_col}',
+                f'Total {self.amount_col}',
+                f'Average {self.amount_col}',
             ],
             'Value': [
                 f"{total_rows:,}",
-                f"{results_df[cols['supplier']].nunique():,}",
-                f"{results_df['SC Code'].nunique():,}",
+                f"{len(self.suppliers):,}",
+                f"{len(self.sc_codes):,}",
                 '',
                 *method_values,
                 '',
@@ -531,83 +2246,1755 @@ def main(config: dict):
                 f"{tier_counts.get('Quick Review', 0):,} ({tier_counts.get('Quick Review', 0)/total_rows*100:.1f}%)",
                 f"{tier_counts.get('Manual Review', 0):,} ({tier_counts.get('Manual Review', 0)/total_rows*100:.1f}%)",
                 '',
-                f"${results_df[amount_col].sum():,.2f}",
-                f"${results_df[amount_col].mean():,.2f}",
+                f"${self.amount_total:,.2f}",
+                f"${self.amount_mean:,.2f}",
             ]
-        }
-        pd.DataFrame(summary_data).to_excel(writer, sheet_name='Summary', index=False)
-
-        spend_l1 = results_df.groupby('CategoryLevel1').agg(
-            TransactionCount=(cols['supplier'], 'count'),
-            TotalSpend=(amount_col, 'sum'),
-            UniqueSuppliers=(cols['supplier'], 'nunique'),
-            AvgConfidence=('Confidence', 'mean'),
-        ).sort_values('TotalSpend', ascending=False)
+        })
+
+    def spend_by_l1(self) -> pd.DataFrame:
+        groups = self._groups['l1']
+        ids, index = groups.table(['CategoryLevel1'])
+        spend_l1 = pd.DataFrame({
+            'TransactionCount': groups.count[ids],
+            'TotalSpend': groups.spend(ids),
+            'UniqueSuppliers': groups.unique_suppliers(ids),
+            'AvgConfidence': groups.avg_confidence(ids),
+        }, index=index).sort_values('TotalSpend', ascending=False)
         spend_l1['AvgConfidence'] = spend_l1['AvgConfidence'].round(3)
-        spend_l1.to_excel(writer, sheet_name='Spend by Category L1')
-
-        spend_l2 = results_df.groupby(['CategoryLevel1', 'CategoryLevel2']).agg(
-            TransactionCount=(cols['supplier'], 'count'),
-            TotalSpend=(amount_col, 'sum'),
-            UniqueSuppliers=(cols['supplier'], 'nunique'),
-        ).sort_values('TotalSpend', ascending=False)
-        spend_l2.to_excel(writer, sheet_name='Spend by Category L2')
-
-        for agg in config.get('aggregations', []):
-            agg_col = agg['column']
-            if agg_col not in results_df.columns:
-                print(f"  WARNING: Aggregation column '{agg_col}' not found, skipping sheet '{agg['name']}'")
+        return spend_l1
+
+    def spend_by_l2(self) -> pd.DataFrame:
+        groups = self._groups['l2']
+        ids, index = groups.table(['CategoryLevel1', 'CategoryLevel2'])
+        return pd.DataFrame({
+            'TransactionCount': groups.count[ids],
+            'TotalSpend': groups.spend(ids),
+            'UniqueSuppliers': groups.unique_suppliers(ids),
+        }, index=index).sort_values('TotalSpend', ascending=False)
+
+    def aggregation(self, agg_col: str, top_n: int = None) -> pd.DataFrame:
+        groups = self._groups[agg_col]
+        ids, index = groups.table([agg_col])
+        agg_df = pd.DataFrame({
+            'TransactionCount': groups.count[ids],
+            'TotalSpend': groups.spend(ids),
+        }, index=index).sort_values('TotalSpend', ascending=False)
+        if top_n:
+            agg_df = agg_df.head(top_n)
+        return agg_df
+
+
+def write_summary_sheets(output, summary: SummaryAccumulator, aggregations: list[dict]):
+    output.write_table('Summary', summary.summary_frame())
+    output.write_table('Spend by Category L1', summary.spend_by_l1(), index=True)
+    output.write_table('Spend by Category L2', summary.spend_by_l2(), index=True)
+
+    for agg in aggregations:
+        agg_col = agg['column']
+        if agg_col not in summary.columns:
+            print(f"  WARNING: Aggregation column '{agg_col}' not found, skipping sheet '{agg['name']}'")
+            continue
+        output.write_table(agg['name'], summary.aggregation(agg_col, agg.get('top_n')), index=True)
+
+    if summary.unmapped_sc:
+        unmapped_data = [
+            {'SC Code': sc, 'Count': count}
+            for sc, count in summary.unmapped_sc.most_common()
+        ]
+        output.write_table('Unmapped SC Codes', pd.DataFrame(unmapped_data))
+
+
+class ResultsOutput:
+    """Destination for result rows and summary tables.
+
+    ``append`` adds rows to a table that may grow chunk by chunk;
+    ``write_table`` writes a finished summary table in one go.
+    """
+
+    label = None
+    closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self.closed:
+            self.close()
+        return False
+
+
+def _excel_rows(sheet, frame: pd.DataFrame, index: bool = False, header: bool = True) -> list[list]:
+    """Cells laid out and styled as ``DataFrame.to_excel`` would; merged ranges are added to ``sheet``."""
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.worksheet.cell_range import CellRange
+    from pandas.io.excel._openpyxl import OpenpyxlWriter
+    from pandas.io.formats.excel import ExcelFormatter
+    grid = {}
+    for cell in ExcelFormatter(frame, index=index, header=header, merge_cells=True).get_formatted_cells():
+        value = cell.val.item() if isinstance(cell.val, np.generic) else cell.val
+        out = grid.setdefault(cell.row, {})[cell.col] = WriteOnlyCell(sheet, value=value)
+        for attr, style in OpenpyxlWriter._convert_to_style_kwargs(cell.style or {}).items():
+            setattr(out, attr, style)
+        if cell.mergestart is not None and cell.mergeend is not None:
+            sheet.merged_cells.add(CellRange(min_row=cell.row + 1, min_col=cell.col + 1,
+                                             max_row=cell.mergestart + 1, max_col=cell.mergeend + 1))
+    return [
+        [grid[r].get(c) for c in range(max(grid[r]) + 1)] if r in grid else []
+        for r in range(max(grid) + 1 if grid else 0)
+    ]
+
+
+class ExcelOutput(ResultsOutput):
+    """Every table as a sheet of one workbook, streamed in openpyxl write-only mode.
+
+    Rows are serialized as they are appended instead of being kept as cell
+    objects until the workbook is saved. A table longer than one sheet
+    continues on the next: All Results becomes All Results 1, All Results 2, ...
+    """
+
+    label = 'Excel'
+    max_rows = 1_048_576
+
+    def __init__(self, path: Path):
+        from openpyxl import Workbook
+        self.path = path
+        self._book = Workbook(write_only=True)
+        self._parts = {}
+        self._order = []
+
+    def _new_part(self, name: str, columns):
+        parts = self._parts[name]
+        if len(parts) == 1:
+            parts[0][0].title = f"{name} 1"
+        sheet = self._book.create_sheet(f"{name} {len(parts) + 1}" if parts else name)
+        sheet.append(_excel_rows(sheet, pd.DataFrame(columns=columns))[0])
+        parts.append([sheet, 1])
+
+    def append(self, name: str, frame: pd.DataFrame):
+        """Append ``frame`` below whatever earlier chunks wrote to table ``name``."""
+        if name not in self._order:
+            self._order.append(name)
+        if frame.empty:
+            return
+        rows = frame.astype(object).where(frame.notna(), None).to_numpy().tolist()
+        parts = self._parts.setdefault(name, [])
+        pos = 0
+        while pos < len(rows):
+            if not parts or parts[-1][1] >= self.max_rows:
+                self._new_part(name, frame.columns)
+            part = parts[-1]
+            sheet, used = part
+            batch = rows[pos:pos + self.max_rows - used]
+            for row in batch:
+                sheet.append(row)
+            part[1] += len(batch)
+            pos += len(batch)
+
+    def write_table(self, name: str, frame: pd.DataFrame, index: bool = False):
+        """Write a summary table with the same layout as ``DataFrame.to_excel``."""
+        self._order.append(name)
+        sheet = self._book.create_sheet(name)
+        rows = _excel_rows(sheet, frame, index=index)
+        for row in rows:
+            sheet.append(row)
+        self._parts[name] = [[sheet, len(rows)]]
+
+    def close(self):
+        # Sheets are created lazily; put them back in first-use order
+        for position, (sheet, _) in enumerate(part for name in self._order for part in self._parts.get(name, [])):
+            self._book.move_sheet(sheet.title, position - self._book.worksheets.index(sheet))
+        self._book.save(self.path)
+        self.closed = True
+
+
+def _require_pyarrow(output_format: str = None, feature: str = None):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        feature = feature or f"Output format '{output_format}'"
+        raise ConfigError(f"{feature} requires pyarrow (pip install pyarrow)")
+
+
+class ColumnarOutput(ResultsOutput):
+    """One parquet, feather or csv file per table, in a directory per run.
+
+    Category columns are dictionary-encoded against a per-column vocabulary
+    that only grows, so every chunk appends to the same Arrow schema and a
+    feather file only ever needs dictionary deltas. When ``summary_xlsx`` is
+    given, the summary tables are also written to that (small) workbook.
+    """
+
+    def __init__(self, directory: Path, output_format: str, summary_xlsx: Path = None):
+        if output_format != 'csv':
+            _require_pyarrow(output_format)
+        self.path = directory
+        self.format = output_format
+        self.label = OUTPUT_LABELS[output_format]
+        directory.mkdir(parents=True, exist_ok=True)
+        self._writers = {}
+        self._schemas = {}
+        self._vocab = {}
+        self._summary = ExcelOutput(summary_xlsx) if summary_xlsx else None
+
+    def table_path(self, name: str) -> Path:
+        slug = re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+        return self.path / f"{slug}.{self.format}"
+
+    def append(self, name: str, frame: pd.DataFrame):
+        if frame.empty:
+            return
+        if self.format == 'csv':
+            frame.to_csv(self.table_path(name), mode='a' if name in self._writers else 'w',
+                         header=name not in self._writers, index=False)
+            self._writers[name] = None
+            return
+
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+        table = self._arrow_table(name, frame)
+        writer = self._writers.get(name)
+        if writer is None:
+            if self.format == 'parquet':
+                writer = pq.ParquetWriter(self.table_path(name), table.schema)
+            else:
+                writer = ipc.new_file(str(self.table_path(name)), table.schema,
+                                      options=ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            self._writers[name] = writer
+        writer.write_table(table)
+
+    def _arrow_table(self, name: str, frame: pd.DataFrame):
+        import pyarrow as pa
+        vocab = self._vocab.setdefault(name, {})
+        columns = {}
+        for col in frame.columns:
+            values = frame[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.cat.remove_unused_categories()
+            if col in DICTIONARY_COLUMNS:
+                known = vocab.get(col, pd.Index([], dtype=object))
+                fresh = values[~values.isin(known)].dropna().unique()
+                if len(fresh):
+                    known = known.append(pd.Index(fresh, dtype=object))
+                vocab[col] = known
+                values = pd.Categorical(values, categories=known)
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                # Passthrough columns read as category; their dictionary could start empty
+                values = values.astype(object)
+            columns[col] = values
+        table = pa.Table.from_pandas(pd.DataFrame(columns), preserve_index=False)
+
+        schema = self._schemas.get(name)
+        if schema is None:
+            # All-null columns have no type yet; later chunks may fill them with text
+            schema = self._schemas[name] = pa.schema([
+                pa.field(f.name, pa.dictionary(pa.int32(), pa.string()) if pa.types.is_dictionary(f.type)
+                         else pa.string() if pa.types.is_null(f.type) else f.type)
+                for f in table.schema
+            ])
+        try:
+            return table.cast(schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ConfigError(f"Column types of '{name}' changed between chunks ({e}); "
+                              f"rerun without --chunk-size or use --format csv")
+
+    def write_table(self, name: str, frame: pd.DataFrame, index: bool = False):
+        if self._summary is not None:
+            self._summary.write_table(name, frame, index=index)
+        self.append(name, frame.reset_index() if index else frame)
+
+    def close(self):
+        for writer in self._writers.values():
+            if writer is not None:
+                writer.close()
+        if self._summary is not None:
+            self._summary.close()
+        self.closed = True
+
+
+def open_output(config: dict, timestamp: str, output_format: str = None, suffix: str = '') -> ResultsOutput:
+    """Open the configured output: one workbook, or a directory of columnar files."""
+    paths = config['_resolved_paths']
+    output_format = output_format or config.get('output', {}).get('format', 'xlsx')
+    stem = f"{paths['output_prefix']}_{timestamp}{suffix}"
+    if output_format == 'xlsx':
+        return ExcelOutput(paths['output_dir'] / f"{stem}.xlsx")
+    directory = paths['output_dir'] / stem
+    summary_xlsx = directory / 'summary.xlsx' if config.get('output', {}).get('summary_workbook') else None
+    return ColumnarOutput(directory, output_format, summary_xlsx)
+
+
+_XLSX_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+_XLSX_REL_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+
+def _xlsx_column(ref: str) -> int:
+    index = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        index = index * 26 + ord(ch.upper()) - 64
+    return index - 1
+
+
+def xlsx_rows(path: Path):
+    """Yield the first sheet's rows as lists of cell values, straight from the workbook XML.
+
+    A stdlib reader for plain tabular sheets like the taxonomy: openpyxl
+    imports numpy and costs more to start than reading the sheet does.
+    Formulas yield their cached values; dates stay serial numbers.
+    """
+    import zipfile
+    import xml.etree.ElementTree as ET
+
+    ns = _XLSX_NS
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        shared = []
+        if 'xl/sharedStrings.xml' in names:
+            root = ET.fromstring(archive.read('xl/sharedStrings.xml'))
+            shared = [''.join(t.text or '' for t in si.iter(f"{{{ns['main']}}}t"))
+                      for si in root.findall('main:si', ns)]
+        workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+        rel_id = workbook.find('main:sheets/main:sheet', ns).get(_XLSX_REL_ID)
+        rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        target = next((r.get('Target') for r in rels.findall('rel:Relationship', ns) if r.get('Id') == rel_id), None)
+        if target is None:
+            raise ValueError(f"no worksheet for relationship {rel_id}")
+        sheet = target.lstrip('/') if target.startswith('/') else f"xl/{target}"
+
+        with archive.open(sheet) as f:
+            n_rows = 0
+            for _, row in ET.iterparse(f):
+                if row.tag != f"{{{ns['main']}}}row":
+                    continue
+                number = int(row.get('r', n_rows + 1))
+                while n_rows < number - 1:
+                    n_rows += 1
+                    yield []
+                n_rows += 1
+                values = []
+                for cell in row.findall('main:c', ns):
+                    col = _xlsx_column(cell.get('r', '')) if cell.get('r') else len(values)
+                    values.extend([None] * (col - len(values) + 1))
+                    kind = cell.get('t', 'n')
+                    if kind == 'inlineStr':
+                        value = ''.join(t.text or '' for t in cell.iter(f"{{{ns['main']}}}t"))
+                    else:
+                        text = cell.findtext('main:v', None, ns)
+                        if not text:
+                            value = None
+                        elif kind == 's':
+                            value = shared[int(text)]
+                        elif kind in ('str', 'e'):
+                            value = text
+                        elif kind == 'b':
+                            value = text == '1'
+                        else:
+                            value = float(text)
+                            value = int(value) if value.is_integer() else value
+                    values[col] = value
+                row.clear()
+                yield values
+
+
+def read_taxonomy_keys(path: Path) -> dict[str, str]:
+    """Taxonomy key -> CategoryLevel1, read without pandas or openpyxl."""
+    import zipfile
+    from xml.etree.ElementTree import ParseError
+
+    try:
+        rows = xlsx_rows(path)
+        header = next(rows, [])
+        if 'Key' not in header:
+            raise ConfigError(f"Taxonomy has no 'Key' column: {path}")
+        key_col = header.index('Key')
+        l1_col = header.index('CategoryLevel1') if 'CategoryLevel1' in header else None
+        keys = {}
+        for row in rows:
+            key = row[key_col] if key_col < len(row) else None
+            if key is None or key == '':
                 continue
-            agg_df = results_df.groupby(agg_col).agg(
-                TransactionCount=(cols['supplier'], 'count'),
-                TotalSpend=(amount_col, 'sum'),
-            ).sort_values('TotalSpend', ascending=False)
-            if agg.get('top_n'):
-                agg_df = agg_df.head(agg['top_n'])
-            agg_df.to_excel(writer, sheet_name=agg['name'])
-
-        if unmapped_sc:
-            unmapped_data = [
-                {'SC Code': sc, 'Count': count}
-                for sc, count in unmapped_sc.most_common()
-            ]
-            pd.DataFrame(unmapped_data).to_excel(writer, sheet_name='Unmapped SC Codes', index=False)
+            level1 = row[l1_col] if l1_col is not None and l1_col < len(row) else None
+            keys[key] = '' if level1 is None else level1
+        return keys
+    except (zipfile.BadZipFile, ParseError, KeyError, AttributeError, ValueError, IndexError, OSError) as e:
+        raise ConfigError(f"Could not read taxonomy {path}: {e}")
+
+
+def _read_yaml(path: Path, problems: list[str]) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return _safe_load_yaml(f) or {}
+    except yaml.YAMLError as e:
+        problems.append(f"{path.name}: not valid YAML: {e}")
+        return {}
+
+
+def _valid_confidence(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and 0.0 < value <= 1.0
+
+
+def validate_config(config: dict) -> list[str]:
+    """Check a loaded config's reference files and input header without reading the input data.
+
+    Reports every problem rather than stopping at the first: rule entries
+    missing required keys or with regexes that do not compile or backtrack
+    exponentially, confidences outside (0, 1], taxonomy keys and override
+    L1s absent from the taxonomy, refinement rules scoped to SC codes the
+    mapping does not define, and mapped columns missing from the input
+    CSV's header. Patterns that backtrack polynomially (see
+    ``regex_hazard``) are printed as warnings; that lint stops after
+    ``LINT_DEADLINE_SECONDS``. Neither pandas nor numpy is
+    imported. Returns the problems, one line each.
+    """
+    paths = config['_resolved_paths']
+    cols = config['columns']
+    classif = config['classification']
+    problems = []
+
+    try:
+        re.compile(classif['sc_code_pattern'])
+    except (re.error, TypeError) as e:
+        problems.append(f"classification.sc_code_pattern invalid regex '{classif['sc_code_pattern']}': {e}")
+    high, medium = classif['confidence_high'], classif['confidence_medium']
+    if not (_valid_confidence(high) and _valid_confidence(medium) and medium <= high):
+        problems.append(f"classification confidence thresholds must satisfy 0 < confidence_medium "
+                        f"<= confidence_high <= 1 (got {medium} and {high})")
+
+    if not paths['input'].exists():
+        problems.append(f"File not found: {paths['input']} (from paths.input)")
+    else:
+        import csv
+        with open(paths['input'], 'r', encoding='utf-8-sig', newline='') as f:
+            header = next(csv.reader(f), [])
+        required = ['spend_category', 'supplier', 'line_memo', 'line_of_service', 'cost_center', 'amount']
+        missing = [f"'{cols[k]}' (from columns.{k})" for k in required if cols[k] not in header]
+        if missing:
+            problems.append(f"Columns not found in input CSV: {', '.join(missing)}")
+        print(f"  Input header: {len(header)} columns")
+
+    try:
+        taxonomy = read_taxonomy_keys(paths['taxonomy'])
+    except ConfigError as e:
+        problems.append(str(e))
+        taxonomy = None
+    if taxonomy is not None:
+        print(f"  Taxonomy categories: {len(taxonomy)}")
+
+    def check_key(where: str, key):
+        if taxonomy is not None and key not in taxonomy:
+            problems.append(f"{where} invalid taxonomy key: '{key}'")
+
+    mappings = _read_yaml(paths['sc_mapping'], problems).get('mappings', {})
+    sc_codes = {str(sc).strip() for sc in mappings}
+    for sc, info in mappings.items():
+        where = f"SC mapping '{sc}'"
+        if not isinstance(info, dict):
+            problems.append(f"{where} is not a mapping")
+            continue
+        for key in ('name', 'taxonomy_key'):
+            if key not in info:
+                problems.append(f"{where} missing required key '{key}'")
+        if 'taxonomy_key' in info:
+            check_key(where, info['taxonomy_key'])
+        if 'confidence' in info and not _valid_confidence(info['confidence']):
+            problems.append(f"{where} confidence {info['confidence']} out of range")
+    print(f"  SC code mappings: {len(mappings)}")
+
+    sections = [('keyword_rules', _read_yaml(paths['keyword_rules'], problems).get('rules', []),
+                 ('pattern', 'category'), 'pattern', 'category')]
+    refinement = _read_yaml(paths['refinement_rules'], problems)
+    sections += [(section, refinement.get(section, []), required_keys, pattern_key, 'taxonomy_key')
+                 for section, required_keys, pattern_key in REFINEMENT_SECTIONS]
+    levels1 = set(taxonomy.values()) if taxonomy is not None else None
+    use_re2 = classif.get('regex_engine', 're') == 're2'
+    if use_re2:
+        try:
+            _require_re2()
+        except ConfigError as e:
+            problems.append(str(e))
+            use_re2 = False
+    hazards, slow = {}, []
+    lint_deadline, unlinted = time.perf_counter() + LINT_DEADLINE_SECONDS, 0
+    for section, rules, required_keys, pattern_key, key_field in sections:
+        for i, rule in enumerate(rules):
+            where = f"{section}[{i}]"
+            if not isinstance(rule, dict):
+                problems.append(f"{where} is not a mapping")
+                continue
+            for key in required_keys:
+                if key not in rule:
+                    problems.append(f"{where} missing required key '{key}'")
+            if pattern_key in rule:
+                pattern = rule[pattern_key]
+                try:
+                    re.compile(pattern, re.IGNORECASE)
+                except (re.error, TypeError) as e:
+                    problems.append(f"{where} invalid regex '{pattern}': {e}")
+                else:
+                    if pattern not in hazards and time.perf_counter() > lint_deadline:
+                        hazards[pattern] = None
+                        unlinted += 1
+                    elif pattern not in hazards:
+                        hazards[pattern] = regex_hazard(pattern, lint_deadline)
+                    hazard = hazards[pattern]
+                    if hazard and hazard['kind'] == 'exponential':
+                        problems.append(f"{where} regex '{pattern}' backtracks catastrophically: "
+                                        f"{_describe_hazard(hazard)}")
+                    elif hazard:
+                        linear = ' (linear under regex_engine re2)' if use_re2 and re2_compatible(pattern) else ''
+                        slow.append(f"{where} '{pattern}': {_describe_hazard(hazard)}{linear}")
+            if key_field in rule:
+                check_key(where, rule[key_field])
+            if 'confidence' in rule and not _valid_confidence(rule['confidence']):
+                problems.append(f"{where} confidence {rule['confidence']} out of range")
+            unknown = [str(sc) for sc in rule.get('sc_codes', []) if str(sc) not in sc_codes]
+            if unknown:
+                problems.append(f"{where} unknown SC codes: {', '.join(unknown)}")
+            if levels1 is not None:
+                missing_l1 = [l1 for l1 in rule.get('override_from_l1', []) if l1 not in levels1]
+                if missing_l1:
+                    problems.append(f"{where} override_from_l1 not in taxonomy: {', '.join(missing_l1)}")
+        print(f"  {section}: {len(rules)}")
+    if slow:
+        print(f"\n  {len(slow)} patterns backtrack super-linearly on long text (bound the repeats, e.g. .{{0,40}}):")
+        for line in slow:
+            print(f"    {line}")
+    if unlinted:
+        print(f"\n  Backtracking lint stopped after {LINT_DEADLINE_SECONDS:.0f}s; "
+              f"{unlinted} patterns were not timed")
+    return problems
+
+
+PIPELINE_DEPTH = 2
+
+
+class ChunkPrefetcher:
+    """Iterate ``chunks`` on a reader thread, parsing at most ``depth`` chunks ahead (``--pipeline``).
+
+    The bounded queue is the backpressure: the reader blocks once ``depth``
+    parsed chunks are waiting. ``busy_seconds`` is the reader's time spent
+    producing chunks and ``wait_seconds`` the consumer's time blocked on an
+    empty queue. An exception in the reader is raised by ``next``.
+    """
+
+    _DONE = object()
+
+    def __init__(self, chunks, depth: int = PIPELINE_DEPTH):
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._chunks = chunks
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='categorize-reader', daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                chunk = next(self._chunks, self._DONE)
+                self.busy_seconds += time.perf_counter() - start
+                self._put(chunk)
+                if chunk is self._DONE:
+                    return
+        except BaseException as e:
+            self._put(e)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        item = self._queue.get()
+        self.wait_seconds += time.perf_counter() - start
+        if item is self._DONE:
+            self._queue.put(item)
+            raise StopIteration
+        if isinstance(item, BaseException):
+            self._queue.put(self._DONE)
+            raise item
+        return item
+
+    def close(self):
+        """Stop the reader and wait for it (it finishes the chunk it is parsing)."""
+        self._stop.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+
+class BackgroundWriter:
+    """Run ``output.append`` on a writer thread, with at most ``depth`` chunks queued (``--pipeline``).
+
+    ``append`` queues a chunk's tables and blocks while ``depth`` chunks are
+    already waiting. ``busy_seconds`` is the writer's time spent appending and
+    ``wait_seconds`` the producer's time blocked on a full queue. ``flush``
+    waits until everything is written; a failed append is raised by the next
+    ``append`` or ``flush``.
+    """
+
+    def __init__(self, output: ResultsOutput, depth: int = PIPELINE_DEPTH):
+        self.output = output
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._error = None
+        self._discard = False
+        self._queue = queue.Queue(maxsize=depth)
+        self._thread = threading.Thread(target=self._run, name='categorize-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            tables = self._queue.get()
+            if tables is None:
+                return
+            if self._error is not None or self._discard:
+                continue
+            start = time.perf_counter()
+            try:
+                for name, frame in tables:
+                    self.output.append(name, frame)
+            except BaseException as e:
+                self._error = e
+            self.busy_seconds += time.perf_counter() - start
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def append(self, tables: list[tuple[str, pd.DataFrame]]):
+        self._raise()
+        start = time.perf_counter()
+        self._queue.put(tables)
+        self.wait_seconds += time.perf_counter() - start
+
+    def flush(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise()
+
+    def close(self):
+        """Drop whatever is still queued and stop the writer."""
+        self._discard = True
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def _memory_note() -> str:
+    rss = resident_memory()
+    return f" (resident memory {rss / 2**20:,.0f} MiB)" if rss else ''
+
+
+def _print_tier_counts(counts: dict):
+    print(f"  Tier 1 (SC code mapping): {counts['tier1']:,} rows")
+    print(f"  Tier 2 (supplier refinement): {counts['tier2']:,} rows")
+    print(f"  Tier 3 (keyword rules): {counts['tier3']:,} rows")
+    print(f"  Tier 4 (context refinement): {counts['tier4']:,} rows")
+    print(f"  Tier 5 (cost center refinement): {counts['tier5']:,} rows")
+    print(f"  Tier 6 (ambiguous fallback): {counts['tier6']:,} rows")
+    if counts['unmapped']:
+        print(f"  Unmapped: {counts['unmapped']:,} rows")
+    print(f"  Tier 7 (supplier override): {counts['tier7']:,} rows")
+
+
+def write_profile_report(path: Path, profile: ClassificationProfile, **run_info):
+    report = {'generated': datetime.now().isoformat(timespec='seconds'), **run_info, **profile.report()}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, default=str)
+
+
+def _print_profile(profile: ClassificationProfile, top_n: int):
+    print(f"\nProfile by tier:")
+    print(f"  {'Tier':30s} {'Time':>8s} {'Candidates':>12s} {'Hits':>10s}")
+    for tier in TIER_LABELS:
+        entry = profile.tiers.get(tier)
+        if entry:
+            print(f"  {entry['label']:30s} {entry['seconds']:>7.2f}s {entry['candidates']:>12,} {entry['hits']:>10,}")
+    print(f"\nSlowest {top_n} rules:")
+    print(f"  {'Tier':6s} {'Rule':>5s} {'Time':>8s} {'Scanned':>10s} {'Hits':>8s}  Pattern")
+    for rule in profile.slowest_rules(top_n):
+        pattern = rule['pattern'] if len(rule['pattern']) <= 60 else rule['pattern'][:57] + '...'
+        print(f"  {rule['tier']:6s} {rule['index']:>5d} {rule['seconds']:>7.3f}s "
+              f"{rule['evaluations']:>10,} {rule['hits']:>8,}  {pattern}")
+    dead = profile.dead_rules()
+    if dead:
+        print(f"  {len(dead)} rules never classified a row ({sum(r['seconds'] for r in dead):.2f}s "
+              f"spent scanning); see the JSON report")
+
+
+METRICS_VERSION = 1
+
+
+def _prometheus_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_metrics(record: dict) -> str:
+    """A run's metrics record in the Prometheus text exposition format, labelled by client."""
+    tiers = record['tiers'] or {}
+    gauges = [
+        ('categorize_last_run_timestamp_seconds', 'Unix time the run finished', None, record['timestamp']),
+        ('categorize_rows', 'Input rows classified or reused', None, record['rows']),
+        ('categorize_unique_keys', 'Distinct classification keys', None, record['unique_keys']),
+        ('categorize_dedup_ratio', 'Classified rows per distinct classification key', None, record['dedup_ratio']),
+        ('categorize_input_bytes', 'Size of the input CSV', None, record['input_bytes']),
+        ('categorize_peak_memory_bytes', 'Peak resident memory of the run', None, record['peak_memory_bytes']),
+        ('categorize_rows_per_second', 'Input rows per second of total runtime', None, record['rows_per_second']),
+        ('categorize_phase_seconds', 'Wall time per phase', 'phase', record['seconds']),
+        ('categorize_tier_hits', 'Rows classified per tier', 'tier', record['tier_hits']),
+        ('categorize_tier_seconds', 'Wall time per tier', 'tier',
+         {tier: entry['seconds'] for tier, entry in tiers.items()}),
+        ('categorize_tier_rows_per_second', 'Candidate rows per second per tier', 'tier',
+         {tier: entry['rows_per_second'] for tier, entry in tiers.items()}),
+        ('categorize_rules', 'Reference entries per kind', 'kind', record['rules']),
+    ]
+    client = f'client="{_prometheus_label(record["client"])}"'
+    lines = []
+    for name, help_text, label, values in gauges:
+        samples = {None: values} if label is None else values
+        samples = [(key, value) for key, value in samples.items() if value is not None]
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in samples:
+            labels = client if key is None else f'{client},{label}="{_prometheus_label(key)}"'
+            lines.append(f"{name}{{{labels}}} {float(value)!r}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_run_metrics(record: dict, paths: dict, timestamp: str) -> Path:
+    """Write a run's metrics record and append it to the history file.
+
+    The record goes to ``<output_prefix>_<timestamp>_metrics.jsonl`` and, for
+    a Prometheus textfile collector, to ``<output_prefix>_metrics.prom``
+    (replaced atomically, so a scrape never sees half a file). Returns the
+    JSON lines path.
+    """
+    line = json.dumps(record, default=str)
+    jsonl_path = paths['output_dir'] / f"{paths['output_prefix']}_{timestamp}_metrics.jsonl"
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        f.write(line + '\n')
+
+    prom_path = paths['output_dir'] / f"{paths['output_prefix']}_metrics.prom"
+    tmp_path = prom_path.with_name(f"{prom_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_metrics(record))
+    os.replace(tmp_path, prom_path)
+
+    history = paths['metrics_history']
+    history.parent.mkdir(parents=True, exist_ok=True)
+    with open(history, 'a', encoding='utf-8') as f:
+        f.write(line + '\n')
+    return jsonl_path
+
+
+def main(config: dict, chunk_size: int = None, workers: int = None, output_format: str = None,
+         use_cache: bool = True, profile_top: int = None, incremental: bool = False, csv_engine: str = None,
+         tier_timings: bool = False, pipeline: bool = False) -> dict:
+    """Classify the configured input and write every output table.
+
+    Returns the run's row counts, phase timings and output path. With
+    ``tier_timings`` (implied by ``profile_top``) the result also carries
+    per-tier timings in ``tiers``. With ``pipeline`` the next chunk is parsed
+    and the previous one written on background threads while the current
+    one is classified; per-stage busy time is returned in ``pipeline``.
+    """
+    paths = config['_resolved_paths']
+    cols = config['columns']
+    classif = config['classification']
+    client_name = config['client']['name']
+
+    paths['output_dir'].mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_format = output_format or config.get('output', {}).get('format', 'xlsx')
+    metrics = config.get('output', {}).get('metrics', True)
+    if output_format in ('parquet', 'feather'):
+        _require_pyarrow(output_format)
+
+    t_start = time.perf_counter()
+
+    print("=" * 70)
+    print(f"{client_name} TRANSACTION CATEGORIZATION")
+    print("=" * 70)
+
+    print("\nLoading resources...")
+    categorizer = Categorizer(config, use_cache)
+    reference = categorizer.reference
+    sc_mapping = reference['sc_mapping']
+    taxonomy_keys_set = reference['taxonomy_keys']
+    rules = reference['rules']
+    refinement = reference['refinement']
+    if reference['cached']:
+        print(f"  Reference bundle: cached ({paths['cache_dir']})")
+    supplier_cache = categorizer.supplier_cache
+    if supplier_cache is not None and supplier_cache.loaded:
+        print(f"  Supplier match cache: {supplier_cache.loaded:,} suppliers from previous runs")
+    elif supplier_cache is not None and supplier_cache.stale:
+        print("  Supplier match cache: supplier patterns changed; rematching all suppliers")
+    print(f"  SC code mappings: {len(sc_mapping)}")
+    print(f"  Taxonomy categories: {len(taxonomy_keys_set)}")
+    print(f"  Keyword rules: {len(rules)}")
+    print(f"  Supplier refinement rules: {len(refinement['supplier_rules'])}")
+    print(f"  Context refinement rules: {len(refinement['context_rules'])}")
+    print(f"  Cost center rules: {len(refinement['cost_center_rules'])}")
+    print(f"  Supplier override rules: {len(refinement['supplier_override_rules'])}")
+    ambiguous_codes = {sc for sc, info in sc_mapping.items() if info.get('ambiguous')}
+    print(f"  Ambiguous SC codes: {len(ambiguous_codes)}")
+
+    invalid_mappings = categorizer.invalid_mappings()
+    if invalid_mappings:
+        print(f"\n  WARNING: {len(invalid_mappings)} SC mappings point to invalid taxonomy keys:")
+        for sc, key in invalid_mappings[:10]:
+            print(f"    {sc} -> {key}")
+        print("  These will still be used but won't resolve to L1-L5 breakdown.")
+
+    if chunk_size:
+        print(f"\nStreaming {client_name} dataset in chunks of {chunk_size:,} rows...")
+    else:
+        print(f"\nLoading {client_name} dataset...")
+    writer = None
+    reader = None
+    try:
+        reader = open_input(config, chunk_size, incremental, csv_engine, use_cache)
+        if pipeline:
+            if not chunk_size:
+                print("  Note: --pipeline overlaps chunks; without --chunk-size there is nothing to overlap")
+            reader = ChunkPrefetcher(reader)
+            t_pipeline = time.perf_counter()
+
+        t_load = time.perf_counter()
+        df = next(reader, None)
+        load_seconds = time.perf_counter() - t_load
+        if df is None or df.empty:
+            raise ConfigError(f"Input CSV has 0 data rows: {paths['input']}")
+        check_input_columns(df, cols)
+        n_columns = len(df.columns)
+        if not chunk_size:
+            print(f"  Loaded {len(df):,} rows, {n_columns} columns in {load_seconds:.1f}s{_memory_note()}")
+
+        state = None
+        if incremental:
+            key_columns = config.get('incremental', {}).get('key_columns', INCREMENTAL_KEY_COLUMNS)
+            state = IncrementalState(paths['cache_dir'] / 'incremental_state.pkl', key_columns,
+                                     incremental_fingerprint(config))
+            if state.previous is not None:
+                print(f"  Incremental state: {len(state.previous):,} rows from the previous run")
+            elif state.stale:
+                print("  Incremental state: reference data or settings changed; reclassifying all rows")
+            else:
+                print("  Incremental state: none yet; classifying all rows")
+        profile = None
+        if profile_top is not None:
+            profile = ClassificationProfile()
+        elif tier_timings:
+            profile = ClassificationProfile(rules=False)
+        if profile is not None and workers and workers > 1:
+            print("  Profiling times each tier in this process; ignoring --workers")
+            workers = None
+        elif metrics and profile is None and not (workers and workers > 1):
+            # Whole-tier timings are nearly free and give the metrics record its per-tier throughput
+            profile = ClassificationProfile(rules=False)
+        if workers and workers > 1:
+            print(f"  Classifying with {workers} worker processes")
+            categorizer.workers = workers
+        summary = SummaryAccumulator(cols, config.get('aggregations', []))
+        tier_totals = Counter()
+        unique_total = 0
+        pending_total = 0
+        classify_seconds = 0.0
+        export_seconds = 0.0
+
+        with open_output(config, timestamp, output_format) as output:
+            if pipeline:
+                writer = BackgroundWriter(output)
+            chunk_no = 0
+            while df is not None:
+                chunk_no += 1
+
+                # ── Vectorized classification ───────────────────────────────
+                if not chunk_size:
+                    print("\nClassifying transactions (vectorized)...")
+                t_classify = time.perf_counter()
+
+                keys, spend_cat_str = extract_keys(df, cols, classif['sc_code_pattern'])
+                pending_keys = keys
+                if state is not None:
+                    identity, input_hash = state.row_hashes(df, keys)
+                    reuse, reused_results = state.reusable(identity, input_hash)
+                    pending_keys = keys[~reuse]
+                    if not chunk_size:
+                        print(f"  Reused from previous run: {int(reuse.sum()):,} rows; "
+                              f"classifying {len(pending_keys):,} new or changed rows")
+
+                # Classify each distinct input tuple once, then broadcast back to rows
+                classified, counts, n_unique = categorizer.classify_keys(pending_keys, profile)
+                unique_total += n_unique
+                pending_total += len(pending_keys)
+                if not chunk_size:
+                    print(f"  Unique classification keys: {n_unique:,} "
+                          f"(dedup ratio {len(pending_keys) / max(n_unique, 1):.1f}x)")
+                tier_totals.update(counts)
+                if state is not None:
+                    if reuse.any():
+                        reused_results.index = df.index[reuse]
+                        classified = pd.concat([reused_results, classified]).reindex(df.index)
+                    state.record(identity, input_hash, classified)
+
+                chunk_seconds = time.perf_counter() - t_classify
+                classify_seconds += chunk_seconds
+                if chunk_size:
+                    print(f"  Chunk {chunk_no}: {len(df):,} rows, {n_unique:,} unique keys, "
+                          f"classified in {chunk_seconds:.1f}s")
+                else:
+                    _print_tier_counts(counts)
+                    print(f"  Classification completed in {classify_seconds:.1f}s")
+
+                # ── Build output DataFrame ──────────────────────────────────
+                if not chunk_size:
+                    print(f"\nBuilding output {output.label} ({len(df):,} rows)...")
+                results_df = build_results_frame(df, cols, keys, spend_cat_str, classified)
+                summary.update(results_df)
+
+                tables = [('All Results', results_df),
+                          ('Manual Review', results_df[results_df['ReviewTier'] == 'Manual Review']),
+                          ('Quick Review', results_df[results_df['ReviewTier'] == 'Quick Review'])]
+                t_export = time.perf_counter()
+                if writer is not None:
+                    writer.append(tables)
+                else:
+                    for name, frame in tables:
+                        output.append(name, frame)
+                export_seconds += time.perf_counter() - t_export
+
+                t_load = time.perf_counter()
+                df = next(reader, None)
+                load_seconds += time.perf_counter() - t_load
+
+            stages = None
+            if writer is not None:
+                writer.flush()
+                wall = time.perf_counter() - t_pipeline
+                # Main-thread time not spent waiting on the other two stages
+                classify_busy = wall - reader.wait_seconds - writer.wait_seconds
+                load_seconds = reader.busy_seconds
+                export_seconds = writer.busy_seconds
+                stages = {'wall_seconds': wall, 'read_seconds': reader.busy_seconds,
+                          'classify_seconds': classify_busy, 'write_seconds': writer.busy_seconds}
+
+            total_rows = summary.total_rows
+            if chunk_size:
+                print(f"  Loaded {total_rows:,} rows, {n_columns} columns in {chunk_no} chunks "
+                      f"({load_seconds:.1f}s reading){_memory_note()}")
+                print("\nClassification totals:")
+                if state is not None:
+                    print(f"  Reused from previous run: {state.reused_rows:,} rows; "
+                          f"classified {pending_total:,} new or changed rows")
+                print(f"  Unique classification keys: {unique_total:,} "
+                      f"(dedup ratio {pending_total / max(unique_total, 1):.1f}x)")
+                _print_tier_counts(tier_totals)
+                print(f"  Classification completed in {classify_seconds:.1f}s")
+            if stages is not None:
+                print(f"\nPipeline stages ({stages['wall_seconds']:.1f}s overlapped):")
+                for stage in ('read', 'classify', 'write'):
+                    busy = stages[f'{stage}_seconds']
+                    print(f"  {stage:10s} {busy:>7.1f}s busy ({busy / max(stages['wall_seconds'], 1e-9):.0%})")
+            if chunk_size:
+                print("\nBuilding summary sheets...")
+
+            t_export = time.perf_counter()
+            write_summary_sheets(output, summary, config.get('aggregations', []))
+            output.close()
+            export_seconds += time.perf_counter() - t_export
+        if state is not None:
+            state.save()
+    finally:
+        if writer is not None:
+            writer.close()
+        if pipeline and reader is not None:
+            reader.close()
+        categorizer.close()
 
     t_end = time.perf_counter()
 
+    method_counts = summary.method_counts
+    tier_counts = summary.tier_counts
+    unmapped_sc = summary.unmapped_sc
+
     print(f"\n{'='*70}")
     print("CLASSIFICATION COMPLETE")
     print(f"{'='*70}")
     print(f"Total transactions:   {total_rows:,}")
+    if state is not None:
+        print(f"Reused rows:          {state.reused_rows:,} (incremental, {total_rows - state.reused_rows:,} classified)")
+    print(f"Unique keys:          {unique_total:,} (dedup ratio {pending_total / max(unique_total, 1):.1f}x)")
+    if supplier_cache is not None and supplier_cache.hits + supplier_cache.misses:
+        print(f"Supplier matches:     {supplier_cache.hits:,} cached, {supplier_cache.misses:,} new")
     print(f"\nClassification Methods:")
-    for m in all_methods:
+    for m in ALL_METHODS:
         count = method_counts.get(m, 0)
         if count > 0:
             print(f"  {m:30s} {count:>8,} ({count/total_rows*100:.1f}%)")
     print(f"\nReview Tiers:")
-    for tier in ['Auto-Accept', 'Quick Review', 'Manual Review']:
+    for tier in REVIEW_TIERS:
         count = tier_counts.get(tier, 0)
         print(f"  {tier:30s} {count:>8,} ({count/total_rows*100:.1f}%)")
     if unmapped_sc:
         print(f"\nUnmapped SC Codes: {len(unmapped_sc)} unique codes, {sum(unmapped_sc.values()):,} total rows")
         for sc, count in unmapped_sc.most_common(10):
-            print(f"  {sc:40s} {count:>6,}")
-    print(f"\nTiming: classification {t_classify_end - t_classify:.1f}s, total {t_end - t_start:.1f}s")
-    print(f"Output saved to: {output_xlsx}")
+            print(f"  {sc if isinstance(sc, str) else '(blank)':40s} {count:>6,}")
+    print(f"\nTiming: load {load_seconds:.1f}s, classification {classify_seconds:.1f}s, "
+          f"export {export_seconds:.1f}s, total {t_end - t_start:.1f}s")
+    print(f"Output saved to: {output.path}")
+
+    metrics_path = None
+    if metrics:
+        total_seconds = t_end - t_start
+        tiers = None
+        if profile is not None:
+            tiers = {entry['tier']: {key: entry[key] for key in ('seconds', 'candidates', 'hits')}
+                     for entry in profile.report()['tiers']}
+            for entry in tiers.values():
+                entry['rows_per_second'] = entry['candidates'] / entry['seconds'] if entry['seconds'] else None
+        record = {
+            'version': METRICS_VERSION,
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'timestamp': time.time(),
+            'client': client_name,
+            'input': paths['input'],
+            'input_bytes': paths['input'].stat().st_size,
+            'output': output.path,
+            'settings': {'format': output_format, 'chunk_size': chunk_size, 'workers': workers,
+                         'incremental': incremental, 'pipeline': pipeline,
+                         'csv_engine': csv_engine or config.get('input', {}).get('engine', 'c'),
+                         'regex_engine': classif.get('regex_engine', 're')},
+            'rows': total_rows,
+            'columns': n_columns,
+            'classified_rows': pending_total,
+            'reused_rows': state.reused_rows if state is not None else 0,
+            'unique_keys': unique_total,
+            'dedup_ratio': pending_total / max(unique_total, 1),
+            'seconds': {'load': load_seconds, 'classification': classify_seconds,
+                        'export': export_seconds, 'total': total_seconds},
+            'rows_per_second': total_rows / total_seconds if total_seconds else None,
+            'peak_memory_bytes': peak_memory(),
+            'rules': {'sc_mappings': len(sc_mapping), 'taxonomy_keys': len(taxonomy_keys_set),
+                      'keyword_rules': len(rules),
+                      **{kind: len(refinement[kind]) for kind in ('supplier_rules', 'context_rules',
+                                                                  'cost_center_rules', 'supplier_override_rules')}},
+            'reference_hashes': reference_hashes(paths),
+            'tier_hits': dict(tier_totals),
+            'tiers': tiers,
+            'methods': {m: method_counts.get(m, 0) for m in ALL_METHODS},
+            'review_tiers': {tier: tier_counts.get(tier, 0) for tier in REVIEW_TIERS},
+            'supplier_cache': ({'hits': supplier_cache.hits, 'misses': supplier_cache.misses}
+                               if supplier_cache is not None else None),
+            'pipeline': stages,
+        }
+        try:
+            metrics_path = write_run_metrics(record, paths, timestamp)
+            print(f"Metrics saved to: {metrics_path}")
+        except OSError as e:
+            print(f"WARNING: could not write run metrics: {e}")
+
+    if profile_top is not None:
+        report_path = paths['output_dir'] / f"{paths['output_prefix']}_{timestamp}_profile.json"
+        write_profile_report(report_path, profile, client=client_name, input_path=paths['input'],
+                             total_rows=total_rows, unique_keys=unique_total,
+                             classification_seconds=classify_seconds)
+        _print_profile(profile, profile_top)
+        print(f"Profile report saved to: {report_path}")
+
+    return {
+        'rows': total_rows,
+        'unique_keys': unique_total,
+        'load_seconds': load_seconds,
+        'classification_seconds': classify_seconds,
+        'export_seconds': export_seconds,
+        'total_seconds': t_end - t_start,
+        'tiers': profile.report()['tiers'] if profile is not None else None,
+        'pipeline': stages,
+        'output': output.path,
+        'metrics': metrics_path,
+    }
+
+
+def read_results(path: Path, cols: dict) -> pd.DataFrame:
+    """All Results rows of a previous run: its .xlsx, an all_results file, or a columnar run directory."""
+    path = Path(path)
+    if path.is_dir():
+        candidates = sorted(path.glob('all_results.*'))
+        if not candidates:
+            raise ConfigError(f"No all_results file found in {path}")
+        path = candidates[0]
+    if not path.exists():
+        raise ConfigError(f"Previous results not found: {path}")
+
+    text_cols = [cols[k] for k in ('supplier', 'line_memo', 'line_of_service', 'cost_center')]
+    text_cols += ['SC Code', 'TaxonomyKey', 'ClassificationMethod']
+    suffix = path.suffix.lower()
+    if suffix == '.xlsx':
+        sheets = [s for s in pd.ExcelFile(path).sheet_names if re.fullmatch(r'All Results( \d+)?', s)]
+        if not sheets:
+            raise ConfigError(f"No 'All Results' sheet in {path}")
+        frames = pd.read_excel(path, sheet_name=sheets, dtype={c: str for c in text_cols})
+        results = pd.concat([frames[s] for s in sheets], ignore_index=True)
+    elif suffix == '.csv':
+        results = pd.read_csv(path, dtype={c: str for c in text_cols}, keep_default_na=False, na_values=[''])
+    elif suffix in ('.parquet', '.feather'):
+        _require_pyarrow(suffix[1:])
+        results = pd.read_parquet(path) if suffix == '.parquet' else pd.read_feather(path)
+    else:
+        raise ConfigError(f"Unsupported results file: {path}")
+
+    missing = [c for c in text_cols + [cols['amount']] if c not in results.columns]
+    if missing:
+        raise ConfigError(f"Columns not found in previous results: {', '.join(missing)}")
+    for col in text_cols:
+        results[col] = results[col].astype(object).fillna('').astype(str)
+    return results
+
+
+def _rule_signature(rule: dict) -> tuple:
+    """Everything in a rule except its scope and the compiled pattern."""
+    return tuple(sorted((k, str(v)) for k, v in rule.items() if k != 'sc_codes' and not k.startswith('_')))
+
+
+def _scoped_rule_lists(refinement: dict, section: str) -> dict[str, list[tuple]]:
+    """Per SC code, the signatures of the rules that apply to it, in priority order."""
+    rules = refinement[section]
+    return {sc: [_rule_signature(rules[i]) for i in positions]
+            for sc, positions in refinement['sc_index'][section].items()}
+
+
+def rule_impact(old_refinement: dict, new_refinement: dict, old_keywords: list[dict], new_keywords: list[dict],
+                sc_mapping: dict, sc_codes) -> dict:
+    """Which SC codes, tiers and override patterns a rule edit can affect.
+
+    A scoped tier (2, 4, 5) affects an SC code when the ordered list of rules
+    that apply to that code changed. Keyword rules (tier 3) can only change
+    rows whose SC code has no direct mapping, i.e. ambiguous and unmapped
+    codes among ``sc_codes``. Override rules (tier 7) are not scoped by SC
+    code, so the patterns of every changed position are returned instead.
+    """
+    affected_sc = set()
+    tiers = {}
+    for tier, section in (('tier2', 'supplier_rules'), ('tier4', 'context_rules'), ('tier5', 'cost_center_rules')):
+        old_lists = _scoped_rule_lists(old_refinement, section)
+        new_lists = _scoped_rule_lists(new_refinement, section)
+        changed = {sc for sc in set(old_lists) | set(new_lists) if old_lists.get(sc) != new_lists.get(sc)}
+        if changed:
+            tiers[tier] = sorted(changed)
+            affected_sc |= changed
+
+    if [_rule_signature(r) for r in old_keywords] != [_rule_signature(r) for r in new_keywords]:
+        direct = {sc for sc, info in sc_mapping.items() if not info.get('ambiguous')}
+        reaching = sorted(sc for sc in set(sc_codes) if sc not in direct)
+        tiers['tier3'] = reaching
+        affected_sc |= set(reaching)
+
+    old_overrides = old_refinement['supplier_override_rules']
+    new_overrides = new_refinement['supplier_override_rules']
+    override_patterns = []
+    for i in range(max(len(old_overrides), len(new_overrides))):
+        old_rule = old_overrides[i] if i < len(old_overrides) else None
+        new_rule = new_overrides[i] if i < len(new_overrides) else None
+        if (old_rule and _rule_signature(old_rule)) != (new_rule and _rule_signature(new_rule)):
+            override_patterns += [r['supplier_pattern'] for r in (old_rule, new_rule) if r]
+    if override_patterns:
+        tiers['tier7'] = sorted(set(override_patterns))
+
+    return {'sc_codes': affected_sc, 'tiers': tiers, 'override_patterns': sorted(set(override_patterns))}
+
+
+def run_diff(config: dict, previous_path: str, old_rules_path: str, new_rules_path: str = None,
+             old_keyword_path: str = None, new_keyword_path: str = None, output_format: str = None,
+             use_cache: bool = True, top_n: int = 20) -> pd.DataFrame:
+    """Reclassify only the rows a rule edit can affect and report old -> new taxonomy keys.
+
+    ``previous_path`` must have been produced with the old rules and the
+    current SC mapping, taxonomy and classification settings. Returns the
+    change matrix.
+    """
+    paths = config['_resolved_paths']
+    cols = config['columns']
+    amount_col = cols['amount']
+    t_start = time.perf_counter()
+
+    new_paths = dict(paths)
+    if new_rules_path:
+        new_paths['refinement_rules'] = Path(new_rules_path).resolve()
+    if new_keyword_path:
+        new_paths['keyword_rules'] = Path(new_keyword_path).resolve()
+    old_keyword_path = Path(old_keyword_path).resolve() if old_keyword_path else paths['keyword_rules']
+    for label, path in (('old rules', Path(old_rules_path)), ('new rules', new_paths['refinement_rules']),
+                        ('old keyword rules', old_keyword_path), ('new keyword rules', new_paths['keyword_rules'])):
+        if not path.exists():
+            raise ConfigError(f"File not found: {path} ({label})")
+
+    print("=" * 70)
+    print(f"{config['client']['name']} RULE IMPACT DIFF")
+    print("=" * 70)
+
+    print("\nLoading rules...")
+    reference = load_reference_bundle(new_paths, paths['cache_dir'] if use_cache else None)
+    old_refinement = load_refinement_rules(Path(old_rules_path))
+    old_keywords = load_keyword_rules(old_keyword_path)
+    print(f"  Old rules: {old_rules_path}")
+    print(f"  New rules: {new_paths['refinement_rules']}")
+
+    print("\nLoading previous results...")
+    previous = read_results(previous_path, cols)
+    print(f"  Loaded {len(previous):,} rows from {previous_path}")
+
+    impact = rule_impact(old_refinement, reference['refinement'], old_keywords, reference['rules'],
+                         reference['sc_mapping'], previous['SC Code'].unique())
+    print("\nRule changes:")
+    if not impact['tiers']:
+        print("  No rule changes that affect classification")
+    for tier, items in impact['tiers'].items():
+        noun = 'patterns' if tier == 'tier7' else 'SC codes'
+        print(f"  Tier {tier[4:]} ({TIER_LABELS[tier].lower()}): {len(items):,} {noun}")
+
+    affected = previous['SC Code'].isin(impact['sc_codes'])
+    supplier = previous[cols['supplier']]
+    for pattern in impact['override_patterns']:
+        affected |= supplier.str.contains(pattern, case=False, na=False, regex=True)
+    print(f"  Rows to reclassify: {int(affected.sum()):,} of {len(previous):,}")
+
+    rows = previous[affected]
+    keys = pd.DataFrame({
+        'sc_code': rows['SC Code'],
+        'supplier': rows[cols['supplier']],
+        'line_memo': rows[cols['line_memo']],
+        'line_of_service': rows[cols['line_of_service']],
+        'cost_center': rows[cols['cost_center']],
+    }).reset_index(drop=True)
+    t_classify = time.perf_counter()
+    # The edited rules are hypothetical: match suppliers in memory, never over the run's cache file
+    with Categorizer(config, use_cache=False, reference=reference) as categorizer:
+        classified, _, _ = categorizer.classify_keys(keys)
+    classify_seconds = time.perf_counter() - t_classify
+
+    changes = pd.DataFrame({
+        **{col: rows[col].to_numpy() for col in (cols['supplier'], cols['line_memo'], 'SC Code',
+                                                  cols['line_of_service'], cols['cost_center'], amount_col)},
+        'Old TaxonomyKey': rows['TaxonomyKey'].to_numpy(),
+        'New TaxonomyKey': classified['taxonomy_key'].to_numpy(),
+        'Old ClassificationMethod': rows['ClassificationMethod'].to_numpy(),
+        'New ClassificationMethod': classified['method'].to_numpy(),
+        'New Confidence': classified['confidence'].round(3).to_numpy(),
+        'New ReviewTier': classified['review_tier'].to_numpy(),
+    })
+    changes = changes[changes['Old TaxonomyKey'] != changes['New TaxonomyKey']].reset_index(drop=True)
+    matrix = (
+        changes.groupby(['Old TaxonomyKey', 'New TaxonomyKey'])
+        .agg(Rows=(amount_col, 'size'), Spend=(amount_col, 'sum'))
+        .reset_index()
+        .sort_values(['Spend', 'Rows'], ascending=False, ignore_index=True)
+    )
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    paths['output_dir'].mkdir(parents=True, exist_ok=True)
+    output_format = output_format or config.get('output', {}).get('format', 'xlsx')
+    if output_format in ('parquet', 'feather'):
+        _require_pyarrow(output_format)
+    with open_output(config, timestamp, output_format, suffix='_rule_diff') as output:
+        output.write_table('Change Matrix', matrix)
+        output.write_table('Changed Rows', changes)
+
+    print(f"\n{'='*70}")
+    print("RULE IMPACT")
+    print(f"{'='*70}")
+    print(f"Rows reclassified:    {int(affected.sum()):,}")
+    print(f"Rows changed:         {len(changes):,}")
+    print(f"Spend moved:          ${changes[amount_col].sum():,.2f}")
+    if len(matrix):
+        print(f"\nTop changes (old -> new taxonomy key):")
+        for row in matrix.head(top_n).itertuples(index=False):
+            print(f"  {row[0]} -> {row[1]}")
+            print(f"    {row.Rows:>8,} rows  ${row.Spend:,.2f}")
+    print(f"\nTiming: classification {classify_seconds:.1f}s, total {time.perf_counter() - t_start:.1f}s")
+    print(f"Output saved to: {output.path}")
+    return matrix
+
+
+SERVICE_FIELDS = ['TaxonomyKey', *TAXONOMY_LEVELS, 'ClassificationMethod', 'Confidence', 'ReviewTier']
+
+
+class ServiceStats:
+    """Request, line and latency counters for ``serve`` (``GET /metrics``).
+
+    Latency percentiles cover the most recent ``window`` requests.
+    """
+
+    def __init__(self, window: int = 10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.lines = 0
+        self.errors = 0
+        self.batches = 0
+        self.batch_lines = 0
+        self.classify_seconds = 0.0
+
+    def record_request(self, lines: int, seconds: float, error: bool = False):
+        with self._lock:
+            self.requests += 1
+            self.lines += lines
+            self.errors += error
+            self._latencies.append(seconds)
+
+    def record_batch(self, lines: int, seconds: float):
+        with self._lock:
+            self.batches += 1
+            self.batch_lines += lines
+            self.classify_seconds += seconds
+
+    def snapshot(self, queue_depth: int = 0) -> dict:
+        with self._lock:
+            uptime = time.perf_counter() - self.started
+            latencies = np.array(self._latencies) * 1000
+            return {
+                'uptime_seconds': round(uptime, 3),
+                'requests': self.requests,
+                'errors': self.errors,
+                'lines': self.lines,
+                'batches': self.batches,
+                'mean_batch_lines': round(self.batch_lines / self.batches, 1) if self.batches else 0.0,
+                'queue_depth': queue_depth,
+                'lines_per_second': round(self.lines / uptime, 1) if uptime else 0.0,
+                'classify_lines_per_second': (round(self.batch_lines / self.classify_seconds, 1)
+                                              if self.classify_seconds else 0.0),
+                'latency_ms': {
+                    name: round(float(np.percentile(latencies, q)), 2) if len(latencies) else 0.0
+                    for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))
+                },
+            }
+
+
+class MicroBatcher:
+    """Coalesces concurrent classify requests into micro-batches for the vectorized waterfall.
+
+    A batch closes when it holds ``max_batch`` lines or ``max_wait`` seconds
+    after its first request arrived, whichever comes first. Each request
+    gets its own slice of the batch result, in order.
+    """
+
+    def __init__(self, categorizer: Categorizer, max_batch: int = 5000, max_wait: float = 0.01,
+                 stats: ServiceStats = None):
+        self.categorizer = categorizer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats or ServiceStats()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='classify-batcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, records: list[dict]) -> Future:
+        from concurrent.futures import Future
+        future = Future()
+        self._queue.put((records, future))
+        return future
+
+    def classify(self, records: list[dict]) -> list[dict]:
+        return self.submit(records).result()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            pending, lines = [item], len(item[0])
+            deadline = time.perf_counter() + self.max_wait
+            while lines < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                pending.append(item)
+                lines += len(item[0])
+            self._classify(pending)
+
+    def _classify(self, pending: list):
+        records = [record for batch, _ in pending for record in batch]
+        start = time.perf_counter()
+        try:
+            results = [{field: row[field] for field in SERVICE_FIELDS}
+                       for row in self.categorizer.classify_records(records)]
+        except Exception as e:
+            # Hand the failure to every waiting request instead of killing the batcher
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        self.stats.record_batch(len(records), time.perf_counter() - start)
+        offset = 0
+        for batch, future in pending:
+            future.set_result(results[offset:offset + len(batch)])
+            offset += len(batch)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+def csv_records(body: bytes, config: dict) -> list[dict]:
+    """The lines of a posted CSV, typed as ``open_input`` types the input file.
+
+    Mapped columns get ``input_dtypes``, so a numeric cost center column with
+    a blank stays ``'12345'`` instead of becoming ``'12345.0'``, and
+    classifies the same as in a file run.
+    """
+    header = pd.read_csv(io.BytesIO(body), nrows=0).columns
+    dtypes = {c: t for c, t in input_dtypes(config).items() if c in header}
+    df = pd.read_csv(io.BytesIO(body), dtype=dtypes)
+    return numeric_amounts(df, config['columns']['amount']).to_dict('records')
+
+
+class _ServiceHandler:
+    """``POST /classify`` (JSON or CSV lines), ``GET /metrics`` and ``GET /health``.
+
+    Mixed into ``BaseHTTPRequestHandler`` by ``make_server``, so http.server
+    is only imported when serving.
+    """
+
+    server_version = 'categorize'
+
+    def _send(self, status: int, body, content_type: str = 'application/json'):
+        data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        batcher = self.server.batcher
+        if self.path == '/health':
+            self._send(200, {'status': 'ok', 'client': batcher.categorizer.config['client']['name']})
+        elif self.path == '/metrics':
+            self._send(200, batcher.stats.snapshot(batcher.queue_depth))
+        else:
+            self._send(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/classify':
+            self._send(404, {'error': f"Unknown path {self.path}"})
+            return
+        start = time.perf_counter()
+        batcher = self.server.batcher
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        is_csv = self.headers.get('Content-Type', '').split(';')[0].strip() == 'text/csv'
+        try:
+            if is_csv:
+                records = csv_records(body, batcher.categorizer.config) if body.strip() else []
+            else:
+                payload = json.loads(body or b'[]')
+                records = payload.get('lines') if isinstance(payload, dict) else payload
+                if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+                    raise ValueError("expected a JSON list of line objects, or {\"lines\": [...]}")
+        except ValueError as e:
+            batcher.stats.record_request(0, time.perf_counter() - start, error=True)
+            self._send(400, {'error': f"Could not parse request body: {e}"})
+            return
+
+        try:
+            results = batcher.classify(records) if records else []
+        except Exception as e:
+            batcher.stats.record_request(len(records), time.perf_counter() - start, error=True)
+            self._send(500, {'error': f"Classification failed: {e}"})
+            return
+        batcher.stats.record_request(len(records), time.perf_counter() - start)
+        if is_csv:
+            self._send(200, pd.DataFrame(results, columns=SERVICE_FIELDS).to_csv(index=False), 'text/csv')
+        else:
+            self._send(200, {'results': results})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(config: dict, host: str = '127.0.0.1', port: int = 8765, max_batch: int = 5000,
+                max_wait_ms: float = 10, use_cache: bool = True) -> ThreadingHTTPServer:
+    """An HTTP classification server with warm reference data; ``server.batcher`` holds the counters."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    categorizer = Categorizer(config, use_cache)
+    handler = type('ServiceHandler', (_ServiceHandler, BaseHTTPRequestHandler), {})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.batcher = MicroBatcher(categorizer, max_batch, max_wait_ms / 1000)
+    return server
+
+
+def serve(config: dict, host: str = '127.0.0.1', port: int = 8765, max_batch: int = 5000,
+          max_wait_ms: float = 10, use_cache: bool = True):
+    """Classify invoice lines over HTTP until interrupted."""
+    print(f"Loading {config['client']['name']} reference data...")
+    server = make_server(config, host, port, max_batch, max_wait_ms, use_cache)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} (POST /classify, GET /metrics, GET /health); "
+          f"micro-batches of up to {max_batch:,} lines or {max_wait_ms:g} ms")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down")
+    finally:
+        server.server_close()
+        server.batcher.close()
+        server.batcher.categorizer.close()
+        stats = server.batcher.stats.snapshot()
+        print(f"Served {stats['requests']:,} requests, {stats['lines']:,} lines in {stats['batches']:,} batches")
+
+
+def expand_configs(patterns: list[str]) -> list[Path]:
+    """Config paths from paths and glob patterns (expanded here, so quoting works on every shell)."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise ConfigError(f"No config files match {pattern}")
+        paths.extend(Path(match).resolve() for match in matches)
+    return list(dict.fromkeys(paths))
+
+
+def _init_batch_worker(preloaded: dict):
+    _PARSED_REFERENCES.update(preloaded)
+
+
+def _run_client(config_path: Path, options: dict) -> dict:
+    """One client of a batch: its normal run, with console output in a log next to its outputs."""
+    entry = {'config': str(config_path), 'client': None, 'status': 'ok'}
+    start = time.perf_counter()
+    log_path = None
+    try:
+        config = load_config(str(config_path))
+        entry['client'] = config['client']['name']
+        paths = config['_resolved_paths']
+        paths['output_dir'].mkdir(parents=True, exist_ok=True)
+        log_path = paths['output_dir'] / f"{paths['output_prefix']}_{datetime.now():%Y%m%d_%H%M%S}.log"
+        with open(log_path, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            stats = main(config, **options)
+        entry.update({key: value for key, value in stats.items() if key != 'tiers'})
+    except Exception as e:
+        # One client's failure is recorded in the manifest; the others still run
+        entry.update(status='error', error=f"{type(e).__name__}: {e}")
+    entry['seconds'] = time.perf_counter() - start
+    entry['log'] = log_path
+    return entry
+
+
+def run_batch(config_paths: list[Path], workers: int = 1, manifest_path: Path = None,
+              output_format: str = None, chunk_size: int = None, use_cache: bool = True) -> dict:
+    """Run several client configs in one process (or a bounded pool of ``workers``).
+
+    Reference files that more than one config points at are parsed once up
+    front and shared with every client. Each client writes its normal
+    outputs plus a console log; the run manifest lists per-client status,
+    row counts and phase timings.
+    """
+    t_start = time.perf_counter()
+    started = datetime.now()
+    workers = max(1, min(workers or 1, len(config_paths)))
+    options = {'output_format': output_format, 'chunk_size': chunk_size, 'use_cache': use_cache}
+
+    print("=" * 70)
+    print(f"BATCH RUN: {len(config_paths)} clients, {workers} at a time")
+    print("=" * 70)
+
+    usage = Counter()
+    for config_path in config_paths:
+        try:
+            paths = load_config(str(config_path), require_input=False)['_resolved_paths']
+        except ConfigError:
+            continue
+        usage.update({(key, paths[key]) for key in REFERENCE_SOURCES})
+    loaders = {'sc_mapping': load_sc_mapping, 'taxonomy': load_taxonomy,
+               'keyword_rules': load_keyword_rules, 'refinement_rules': load_refinement_rules}
+    shared = [(key, path) for (key, path), count in usage.items() if count > 1 and path.exists()]
+    t_shared = time.perf_counter()
+    for key, path in shared:
+        parsed_reference(loaders[key], path)
+    if shared:
+        print(f"\nShared reference files ({time.perf_counter() - t_shared:.1f}s):")
+        for key, path in sorted(shared):
+            print(f"  {path} ({usage[(key, path)]} clients)")
+
+    print()
+    entries = []
+    if workers == 1:
+        for config_path in config_paths:
+            entries.append(_run_client(config_path, options))
+            _print_batch_entry(entries[-1])
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(dict(_PARSED_REFERENCES),)) as executor:
+            futures = [executor.submit(_run_client, config_path, options) for config_path in config_paths]
+            for future in futures:
+                entries.append(future.result())
+                _print_batch_entry(entries[-1])
+
+    total_seconds = time.perf_counter() - t_start
+    failed = sum(entry['status'] != 'ok' for entry in entries)
+    manifest = {
+        'started': started.isoformat(timespec='seconds'),
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'total_seconds': total_seconds,
+        'workers': workers,
+        'shared_references': [str(path) for _, path in sorted(shared)],
+        'clients': entries,
+    }
+    manifest_path = Path(manifest_path or f"batch_manifest_{started:%Y%m%d_%H%M%S}.json").resolve()
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    print(f"\n{len(entries) - failed} of {len(entries)} clients succeeded in {total_seconds:.1f}s")
+    print(f"Manifest saved to: {manifest_path}")
+    return manifest
+
+
+def _print_batch_entry(entry: dict):
+    name = entry['client'] or Path(entry['config']).parent.name
+    if entry['status'] == 'ok':
+        print(f"  {name:20s} {entry['rows']:>10,} rows  {entry['seconds']:>7.1f}s  -> {entry['output']}")
+    else:
+        print(f"  {name:20s} FAILED after {entry['seconds']:.1f}s: {entry['error']}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='Spend Categorization CLI — classify procurement transactions against Healthcare Taxonomy'
     )
-    parser.add_argument('--config', required=True, help='Path to client config YAML')
+    parser.add_argument('--config', help='Path to client config YAML')
     parser.add_argument('--input', default=None, help='Override input CSV path from config')
     parser.add_argument('--output-dir', default=None, help='Override output directory from config')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Stream the input CSV in chunks of this many rows to bound memory')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Classify in parallel across this many worker processes')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None,
+                        help='Override output.format from config (xlsx, parquet, feather or csv)')
+    parser.add_argument('--profile', type=int, nargs='?', const=20, default=None, metavar='TOP_N',
+                        help='Time every tier and rule, write a JSON profile report and print the '
+                             'TOP_N slowest rules (default 20)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse the previous run\'s results for rows whose identity and inputs are unchanged')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Parse reference files from source instead of the cached reference bundle, '
+                             'and the CSV instead of the input cache')
+    parser.add_argument('--csv-engine', choices=CSV_ENGINES, default=None,
+                        help='Override input.engine from config (pyarrow parses the CSV on all cores)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='With --chunk-size, read the next chunk and write the previous one on '
+                             'background threads while classifying')
+    parser.add_argument('--validate-only', action='store_true',
+                        help='Check the config, rule regexes and taxonomy keys without loading the input data')
+
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+    diff_parser = subparsers.add_parser(
+        'diff', help='Reclassify only the rows a rule edit can affect and report old -> new taxonomy keys')
+    diff_parser.add_argument('--config', required=True, help='Path to client config YAML')
+    diff_parser.add_argument('--previous', required=True,
+                             help='Previous results: .xlsx, all_results file or columnar output directory')
+    diff_parser.add_argument('--old-rules', required=True, help='Refinement rules the previous results were built with')
+    diff_parser.add_argument('--new-rules', default=None,
+                             help='Edited refinement rules (default: paths.refinement_rules from config)')
+    diff_parser.add_argument('--old-keyword-rules', default=None,
+                             help='Keyword rules the previous results were built with (default: from config)')
+    diff_parser.add_argument('--new-keyword-rules', default=None,
+                             help='Edited keyword rules (default: from config)')
+    diff_parser.add_argument('--output-dir', default=None, help='Override output directory from config')
+    diff_parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None,
+                             help='Override output.format from config (xlsx, parquet, feather or csv)')
+    diff_parser.add_argument('--no-cache', action='store_true',
+                             help='Parse reference files from source instead of the cached reference bundle')
+    serve_parser = subparsers.add_parser(
+        'serve', help='Classify invoice lines over HTTP with warm reference data and micro-batching')
+    serve_parser.add_argument('--config', required=True, help='Path to client config YAML')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default 8765)')
+    serve_parser.add_argument('--max-batch', type=int, default=5000,
+                              help='Most lines classified together in one micro-batch (default 5000)')
+    serve_parser.add_argument('--max-wait-ms', type=float, default=10,
+                              help='How long a micro-batch waits for more requests (default 10 ms)')
+    serve_parser.add_argument('--no-cache', action='store_true',
+                              help='Parse reference files from source instead of the cached reference bundle')
+    batch_parser = subparsers.add_parser(
+        'batch', help='Run several client configs in one process, sharing reference files')
+    batch_parser.add_argument('configs', nargs='+', metavar='CONFIG',
+                              help='Client config paths or glob patterns (e.g. "clients/*/config.yaml")')
+    batch_parser.add_argument('--workers', type=int, default=1,
+                              help='Clients run concurrently, each in its own process (default 1)')
+    batch_parser.add_argument('--manifest', default=None,
+                              help='Run manifest path (default: batch_manifest_<timestamp>.json)')
+    batch_parser.add_argument('--chunk-size', type=int, default=None,
+                              help='Stream each input CSV in chunks of this many rows')
+    batch_parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None,
+                              help="Override every client's output.format (xlsx, parquet, feather or csv)")
+    batch_parser.add_argument('--no-cache', action='store_true',
+                              help='Parse reference files from source instead of the cached reference bundles')
     args = parser.parse_args()
+    if args.command is None and not args.config:
+        parser.error('the following arguments are required: --config')
 
     try:
-        config = load_config(args.config, args.input, args.output_dir)
-        main(config)
+        if args.command == 'diff':
+            config = load_config(args.config, output_dir_override=args.output_dir)
+            run_diff(config, args.previous, args.old_rules, args.new_rules,
+                     old_keyword_path=args.old_keyword_rules, new_keyword_path=args.new_keyword_rules,
+                     output_format=args.format, use_cache=not args.no_cache)
+        elif args.command == 'serve':
+            config = load_config(args.config, require_input=False)
+            serve(config, args.host, args.port, args.max_batch, args.max_wait_ms, use_cache=not args.no_cache)
+        elif args.command == 'batch':
+            manifest = run_batch(expand_configs(args.configs), args.workers, args.manifest,
+                                 output_format=args.format, chunk_size=args.chunk_size,
+                                 use_cache=not args.no_cache)
+            if any(entry['status'] != 'ok' for entry in manifest['clients']):
+                sys.exit(1)
+        elif args.validate_only:
+            config = load_config(args.config, args.input, args.output_dir, require_input=False)
+            print(f"Validating {config['client']['name']} config...")
+            problems = validate_config(config)
+            if problems:
+                print(f"\n{len(problems)} problems found:")
+                for problem in problems:
+                    print(f"  {problem}")
+                sys.exit(1)
+            print("\nConfig is valid.")
+        else:
+            config = load_config(args.config, args.input, args.output_dir)
+            main(config, chunk_size=args.chunk_size, workers=args.workers, output_format=args.format,
+                 use_cache=not args.no_cache, profile_top=args.profile, incremental=args.incremental,
+                 csv_engine=args.csv_engine, pipeline=args.pipeline)
     except ConfigError as e:
         print(f"ERROR: {e}")
         sys.exit(1)
@@ -1,9 +1,11 @@
+import sys
 from pathlib import Path
 import pytest
 import yaml
 
 
 ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
 
 
 def pytest_addoption(parser):
@@ -58,3 +60,122 @@ def taxonomy_keys(client_dir, client_config):
 @pytest.fixture(scope="session")
 def valid_sc_codes(sc_mapping):
     return set(str(k).strip() for k in sc_mapping.get("mappings", {}).keys())
+
+
+def _taxonomy_keys_referenced(sc_mapping, keyword_rules, refinement):
+    keys = {info["taxonomy_key"] for info in sc_mapping.get("mappings", {}).values()}
+    keys |= {rule["category"] for rule in keyword_rules.get("rules", [])}
+    for section in ("supplier_rules", "context_rules", "cost_center_rules", "supplier_override_rules"):
+        keys |= {rule["taxonomy_key"] for rule in refinement.get(section, [])}
+    return sorted(keys)
+
+
+def _literal_alternatives(pattern):
+    import re
+    alts = []
+    for alt in pattern.split("|"):
+        literal = re.sub(r"[\\^$.*+?()\[\]{}]", " ", alt).strip()
+        if literal and not re.search(r"\bd\b|\bw\b|\bs\b", literal):
+            alts.append(literal)
+    return alts
+
+
+@pytest.fixture(scope="session")
+def synthetic_client(tmp_path_factory, client_dir, client_config, sc_mapping, keyword_rules, refinement):
+    """A throwaway client built from the real rule files plus a generated taxonomy and input CSV."""
+    import random
+    import shutil
+    import pandas as pd
+
+    root = tmp_path_factory.mktemp("synthetic_client")
+    ref_dir = root / "data" / "reference"
+    ref_dir.mkdir(parents=True)
+    (root / "data" / "input").mkdir(parents=True)
+    for key in ("sc_mapping", "keyword_rules", "refinement_rules"):
+        src = client_dir / client_config["paths"][key]
+        shutil.copy(src, ref_dir / src.name)
+
+    keys = _taxonomy_keys_referenced(sc_mapping, keyword_rules, refinement)
+    levels = [(k.split(" > ") + [""] * 5)[:5] for k in keys]
+    pd.DataFrame({
+        "Key": keys,
+        **{f"CategoryLevel{i + 1}": [lv[i] for lv in levels] for i in range(5)},
+    }).to_excel(ref_dir / "taxonomy.xlsx", index=False)
+
+    rng = random.Random(7)
+    codes = sorted(str(k) for k in sc_mapping["mappings"])
+    ambiguous = sorted(str(k) for k, v in sc_mapping["mappings"].items() if v.get("ambiguous"))
+    supplier_names = [a for r in refinement["supplier_rules"] for a in _literal_alternatives(r["supplier_pattern"])]
+    supplier_names += [a for r in refinement["supplier_override_rules"] for a in _literal_alternatives(r["supplier_pattern"])]
+    supplier_names += ["Acme Corp", "Globex LLC", "Initech", "access", ""]
+    memos = [a for r in keyword_rules["rules"] for a in _literal_alternatives(r["pattern"])][:150]
+    memos += ["", "monthly service", "misc"]
+    services = ["LS01 Research", "LS02 Cardiology", "LS03 Surgery", "", "Patient Care"]
+    centers = ["CC100 Facilities Mgmt", "CC200 Design and Construction", "CC300 Pharmacy", "", "CC400 Radiology"]
+
+    # Recurring invoices: a pool of distinct lines drawn with a skewed frequency
+    pool = []
+    for _ in range(900):
+        sc = rng.choice(ambiguous) if rng.random() < 0.6 else rng.choice(codes)
+        pool.append({
+            "Spend Category": rng.choice([f"{sc} Purchased Services", f"DNU {sc} Legacy", "Uncoded Spend", sc]),
+            "Supplier": rng.choice(supplier_names).title(),
+            "Line Memo": rng.choice(memos),
+            "Line of Service": rng.choice(services),
+            "Cost Center": rng.choice(centers),
+        })
+    weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+
+    rows = []
+    for i, line in enumerate(rng.choices(pool, weights=weights, k=4000)):
+        rows.append({
+            "Invoice Number": f"INV{i // 3:06d}",
+            "Invoice Line": i % 3 + 1,
+            **line,
+            "Fund": rng.choice(["FD10 Operating", "FD20 Grants", "FD30 Capital"]),
+            "Invoice Line Amount": round(rng.uniform(-500, 25000), 2),
+        })
+    pd.DataFrame(rows).to_csv(root / "data" / "input" / "transactions.csv", index=False)
+
+    config = {
+        "client": {"name": "SYNTH", "description": "Synthetic test client"},
+        "paths": {
+            "input": "data/input/transactions.csv",
+            "sc_mapping": f"data/reference/{Path(client_config['paths']['sc_mapping']).name}",
+            "taxonomy": "data/reference/taxonomy.xlsx",
+            "keyword_rules": f"data/reference/{Path(client_config['paths']['keyword_rules']).name}",
+            "refinement_rules": f"data/reference/{Path(client_config['paths']['refinement_rules']).name}",
+            "output_dir": "output",
+            "output_prefix": "synth_results",
+        },
+        "columns": {
+            **{k: v for k, v in client_config["columns"].items() if k != "passthrough"},
+            "passthrough": ["Invoice Number", "Invoice Line", "Fund", "Invoice Line Amount", "Grant"],
+        },
+        "classification": client_config["classification"],
+        "aggregations": client_config.get("aggregations", []),
+    }
+    with open(root / "config.yaml", "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return root
+
+
+@pytest.fixture
+def client_copy(synthetic_client, tmp_path):
+    """Factory for a writable copy of the synthetic client, without its caches and outputs.
+
+    ``edit`` is called with the parsed config.yaml, which is written back
+    after it returns.
+    """
+    import shutil
+
+    def copy(name="client", edit=None):
+        root = tmp_path / name
+        shutil.copytree(synthetic_client, root, ignore=shutil.ignore_patterns(".cache", "output"))
+        if edit is not None:
+            config = yaml.safe_load((root / "config.yaml").read_text())
+            edit(config)
+            (root / "config.yaml").write_text(yaml.safe_dump(config, sort_keys=False))
+        return root
+
+    return copy
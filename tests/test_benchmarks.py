@@ -0,0 +1,69 @@
+"""
+Tests for the benchmark harness in benchmarks/.
+
+The synthetic generator must give every tier of the waterfall work to do,
+and the NFR check must scale time budgets with the row count.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+
+import categorize
+import run_benchmarks
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def bench_client(tmp_path_factory, client_dir):
+    return synthetic.make_client(tmp_path_factory.mktemp("bench"), 5000, client_dir)
+
+
+class TestSyntheticClient:
+
+    def test_every_tier_classifies_rows(self, bench_client, tmp_path):
+        config = categorize.load_config(str(bench_client), output_dir_override=str(tmp_path))
+        stats = categorize.main(config, output_format="csv", tier_timings=True)
+
+        assert stats["rows"] == 5000
+        assert 1 < stats["unique_keys"] < 5000
+        hits = {tier["tier"]: tier["hits"] for tier in stats["tiers"]}
+        for tier in ("tier1", "tier2", "tier3", "tier4", "tier6", "tier7"):
+            assert hits[tier] > 0, tier
+
+    def test_input_is_reused_and_only_referenced_columns_are_read(self, bench_client, client_dir, capsys):
+        before = bench_client.with_name("data").joinpath("input", "transactions_5000_seed0.csv").stat().st_mtime
+        assert synthetic.make_client(bench_client.parent, 5000, client_dir) == bench_client
+        config = categorize.load_config(str(bench_client))
+        assert config["_resolved_paths"]["input"].stat().st_mtime == before
+
+        (df,) = categorize.open_input(config)
+        assert set(df.columns) == set(categorize.input_columns(config)) & set(df.columns)
+        assert f"of {len(df.columns) + len(synthetic.UNUSED_COLUMNS)} columns" in capsys.readouterr().out
+
+    def test_sample_strings_match_their_pattern(self):
+        import re
+        pattern = r"led.*\d+w|plumb.*supply|fire alarm|\bhvac\b"
+        samples = synthetic.sample_strings(pattern)
+        assert samples == ["plumb supply", "fire alarm", "hvac"]
+        assert all(re.search(pattern, s) for s in samples)
+
+
+class TestNfrChecks:
+
+    def test_time_budgets_scale_with_rows(self):
+        result = {"rows": 100_000, "classification_seconds": 3.0, "total_seconds": 40.0, "peak_memory": 2**30}
+        checks = {c["nfr"]: c for c in run_benchmarks.check_nfrs(result)}
+        assert checks["NFR-01"]["limit"] == pytest.approx(2.5)
+        assert not checks["NFR-01"]["passed"]
+        assert checks["NFR-02"]["passed"]
+        assert checks["NFR-03"]["limit"] == 4 * 2**30
+        assert checks["NFR-03"]["passed"]
+
+    def test_memory_budget_does_not_scale(self):
+        result = {"rows": 5_000_000, "classification_seconds": 1.0, "total_seconds": 1.0, "peak_memory": 5 * 2**30}
+        checks = {c["nfr"]: c for c in run_benchmarks.check_nfrs(result)}
+        assert not checks["NFR-03"]["passed"]
@@ -0,0 +1,1224 @@
+"""
+Engine tests for src/categorize.py.
+
+Rule matchers are checked for parity against the original rule-by-rule loop
+(first match wins, in file order) using the client's real rule files.
+Pipeline tests run against the synthetic client built in conftest.py.
+"""
+
+import io
+import json
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+import categorize
+from categorize import RuleMatcher
+
+
+@pytest.fixture(scope="module")
+def synthetic_config(synthetic_client):
+    return categorize.load_config(str(synthetic_client / "config.yaml"))
+
+
+@pytest.fixture(scope="module")
+def synthetic_refs(synthetic_config):
+    paths = synthetic_config["_resolved_paths"]
+    rules = categorize.load_keyword_rules(paths["keyword_rules"])
+    refinement = categorize.load_refinement_rules(paths["refinement_rules"])
+    return {
+        "sc_mapping": categorize.load_sc_mapping(paths["sc_mapping"]),
+        "taxonomy_lookup": categorize.build_taxonomy_lookup(categorize.load_taxonomy(paths["taxonomy"])),
+        "rules": rules,
+        "refinement": refinement,
+        "matchers": categorize.build_matchers(rules, refinement),
+    }
+
+
+@pytest.fixture(scope="module")
+def synthetic_keys(synthetic_config):
+    cols = synthetic_config["columns"]
+    df = pd.read_csv(synthetic_config["_resolved_paths"]["input"], low_memory=False)
+    spend_cat = df[cols["spend_category"]].astype(str).str.strip()
+    sc_pattern = synthetic_config["classification"]["sc_code_pattern"]
+    sc_code = spend_cat.str.extract(f"({sc_pattern})", expand=False)
+    if isinstance(sc_code, pd.DataFrame):
+        sc_code = sc_code.iloc[:, 0]
+    return pd.DataFrame({
+        "sc_code": sc_code.fillna(spend_cat),
+        "supplier": df[cols["supplier"]].fillna("").astype(str),
+        "line_memo": df[cols["line_memo"]].fillna("").astype(str),
+        "line_of_service": df[cols["line_of_service"]].fillna("").astype(str),
+        "cost_center": df[cols["cost_center"]].fillna("").astype(str),
+    })
+
+
+def _classify(keys, refs, classif, **kwargs):
+    return categorize.classify_rows(
+        keys, refs["sc_mapping"], refs["taxonomy_lookup"], refs["rules"],
+        refs["refinement"], refs["matchers"], classif, **kwargs,
+    )
+
+
+def _sample_texts(patterns):
+    texts = ["", "unknown vendor llc", "multi\nline access", "access", "ACCESS", "shp", "x shp",
+             "Café Épic Systems", "ſtaples ſupply", "KELVIN \u212a SUPPLY"]
+    for pattern in patterns:
+        for alt in pattern.split("|"):
+            literal = re.sub(r"[\\^$.*+?()\[\]{}]", "", alt).strip()
+            if literal:
+                texts.append(literal)
+                texts.append(f"Acme {literal.upper()} Inc")
+    return texts
+
+
+def _loop_first_match(patterns, scopes, text, sc):
+    for i, pattern in enumerate(patterns):
+        if scopes is not None and sc not in [str(s) for s in scopes[i]]:
+            continue
+        if re.search(pattern, text, re.IGNORECASE):
+            return i
+    return -1
+
+
+# -- RuleMatcher parity --------------------------------------------------------
+
+
+class TestRuleMatcherParity:
+
+    @pytest.mark.parametrize("section,pattern_key", [
+        ("supplier_rules", "supplier_pattern"),
+        ("context_rules", "line_of_service_pattern"),
+        ("cost_center_rules", "cost_center_pattern"),
+    ])
+    def test_scoped_tiers_match_rule_loop(self, refinement, section, pattern_key):
+        rules = refinement[section]
+        patterns = [r[pattern_key] for r in rules]
+        scopes = [r["sc_codes"] for r in rules]
+        matcher = RuleMatcher(patterns, scopes)
+
+        texts = _sample_texts(patterns)
+        sc_codes = sorted({str(sc) for s in scopes for sc in s}) + ["SC9999", "sc0250"]
+        pairs = [(t, sc) for sc in sc_codes for t in texts]
+        got = matcher.first_match([t for t, _ in pairs], [sc for _, sc in pairs])
+        expected = [_loop_first_match(patterns, scopes, t, sc) for t, sc in pairs]
+        assert got.tolist() == expected
+
+    def test_keyword_tier_matches_rule_loop(self, keyword_rules):
+        patterns = [r["pattern"] for r in keyword_rules.get("rules", [])]
+        matcher = RuleMatcher(patterns)
+
+        texts = _sample_texts(patterns)
+        got = matcher.first_match(texts)
+        expected = [_loop_first_match(patterns, None, t, None) for t in texts]
+        assert got.tolist() == expected
+
+    def test_uncombinable_patterns_keep_their_position(self):
+        patterns = ["foo", "^bar$", r"(a)\1", "bar"]
+        matcher = RuleMatcher(patterns)
+        assert matcher.first_match(["bar", "xbar", "aa", "foo bar", "zzz"]).tolist() == [1, 3, 2, 0, -1]
+
+    def test_sc_index_keeps_rule_priority(self):
+        scopes = [["SC1", "SC2"], [], ["SC2", "SC2"], ["SC1", 3]]
+        assert categorize.index_by_sc_code(scopes) == {"SC1": [0, 3], "SC2": [0, 2], "3": [3]}
+
+        matcher = RuleMatcher(["^acme", "acme", "acme corp", "corp"], scopes)
+        texts = ["acme corp", "acme corp", "acme corp", "big corp", "x"]
+        sc_codes = ["SC1", "SC2", "3", "SC2", "SC9"]
+        assert matcher.first_match(texts, sc_codes).tolist() == [0, 0, 3, -1, -1]
+
+    def test_refinement_index_matches_rule_scopes(self, client_dir, client_config):
+        loaded = categorize.load_refinement_rules(client_dir / client_config["paths"]["refinement_rules"])
+        for section in ("supplier_rules", "context_rules", "cost_center_rules"):
+            for sc, positions in loaded["sc_index"][section].items():
+                assert positions == sorted(positions)
+                assert all(sc in [str(s) for s in loaded[section][i]["sc_codes"]] for i in positions)
+
+
+# -- Deduplicated classification -----------------------------------------------
+
+
+class TestDeduplication:
+
+    def test_factorize_rows_round_trips(self, synthetic_keys):
+        codes, first_rows = categorize.factorize_rows(synthetic_keys)
+        assert len(first_rows) == codes.max() + 1
+        rebuilt = synthetic_keys.iloc[first_rows].reset_index(drop=True).take(codes)
+        pd.testing.assert_frame_equal(rebuilt.reset_index(drop=True), synthetic_keys)
+        assert len(first_rows) < len(synthetic_keys)
+
+    def test_broadcast_matches_row_by_row(self, synthetic_keys, synthetic_refs, synthetic_config):
+        classif = synthetic_config["classification"]
+        full, full_counts = _classify(synthetic_keys, synthetic_refs, classif)
+
+        codes, first_rows = categorize.factorize_rows(synthetic_keys)
+        uniques = synthetic_keys.iloc[first_rows].reset_index(drop=True)
+        deduped, deduped_counts = _classify(uniques, synthetic_refs, classif, weights=np.bincount(codes))
+        broadcast = deduped.take(codes).reset_index(drop=True)
+
+        pd.testing.assert_frame_equal(broadcast, full)
+        assert deduped_counts == full_counts
+
+    def test_text_columns_are_integer_coded(self, synthetic_keys, synthetic_refs, synthetic_config):
+        result, _ = _classify(synthetic_keys, synthetic_refs, synthetic_config["classification"])
+        for col in ("cat_l1", "cat_l2", "cat_l3", "cat_l4", "cat_l5", "taxonomy_key", "method", "review_tier"):
+            assert isinstance(result[col].dtype, pd.CategoricalDtype), col
+            assert (result[col].cat.codes >= 0).all(), col
+        assert list(result["method"].cat.categories) == categorize.ALL_METHODS
+        assert list(result["review_tier"].cat.categories) == categorize.REVIEW_TIERS
+
+
+# -- Supplier overrides ---------------------------------------------------------
+
+
+class TestSupplierOverride:
+
+    def _classify_overrides(self, override_rules, suppliers, profile=None):
+        refinement = {
+            "supplier_rules": [], "context_rules": [], "cost_center_rules": [],
+            "supplier_override_rules": override_rules,
+            "sc_index": {"supplier_rules": {}, "context_rules": {}, "cost_center_rules": {}},
+        }
+        taxonomy_lookup = {
+            key: dict(zip(categorize.TAXONOMY_LEVELS, (key.split(" > ") + [""] * 5)[:5]))
+            for key in ("Facilities > Repairs", "Services > Consulting", "Medical > Devices")
+        }
+        keys = pd.DataFrame({
+            "sc_code": "SC1", "supplier": suppliers, "line_memo": "", "line_of_service": "", "cost_center": "",
+        })
+        sc_mapping = {"SC1": {"name": "Repairs", "taxonomy_key": "Facilities > Repairs",
+                              "confidence": 0.85, "ambiguous": False}}
+        return categorize.classify_rows(
+            keys, sc_mapping, taxonomy_lookup, [], refinement, categorize.build_matchers([], refinement),
+            {"confidence_high": 0.9, "confidence_medium": 0.7}, profile=profile,
+        )
+
+    def test_later_rules_see_earlier_overrides(self):
+        rules = [
+            {"supplier_pattern": "acme", "override_from_l1": ["Facilities"],
+             "taxonomy_key": "Services > Consulting", "confidence": 0.8},
+            {"supplier_pattern": "acme|globex", "override_from_l1": ["Services"],
+             "taxonomy_key": "Medical > Devices", "confidence": 0.9},
+            {"supplier_pattern": "GLOBEX", "override_from_l1": ["Facilities"],
+             "taxonomy_key": "Services > Consulting", "confidence": 0.7},
+        ]
+        profile = categorize.ClassificationProfile()
+        result, counts = self._classify_overrides(rules, ["Acme Inc", "Globex", "Initech"], profile)
+
+        assert result["taxonomy_key"].tolist() == ["Medical > Devices", "Services > Consulting",
+                                                   "Facilities > Repairs"]
+        assert result["cat_l1"].tolist() == ["Medical", "Services", "Facilities"]
+        assert result["confidence"].tolist() == [0.9, 0.7, 0.85]
+        assert result["method"].tolist() == ["supplier_override", "supplier_override", "sc_code_mapping"]
+        assert counts["tier7"] == 3
+        assert [r["hits"] for r in sorted(profile.report()["rules"], key=lambda r: r["index"])] == [1, 1, 1]
+
+    def test_matching_rules_reports_every_match(self):
+        matcher = RuleMatcher(["acme", "^acme", r"(a)\1", "corp", "ÉPIC"])
+        got = matcher.matching_rules(["Acme Corp", "big acme", "aa", "Épic", ""])
+        assert got.tolist() == [
+            [True, True, False, True, False],
+            [True, False, False, False, False],
+            [False, False, True, False, False],
+            [False, False, False, False, True],
+            [False, False, False, False, False],
+        ]
+
+
+# -- Chunked streaming ----------------------------------------------------------
+
+
+def _run(synthetic_client, out_dir, **kwargs):
+    config = categorize.load_config(str(synthetic_client / "config.yaml"), output_dir_override=str(out_dir))
+    categorize.main(config, **kwargs)
+    (xlsx,) = out_dir.glob("*.xlsx")
+    return pd.read_excel(xlsx, sheet_name=None)
+
+
+class TestChunkedStreaming:
+
+    def test_chunked_run_matches_single_shot(self, synthetic_client, tmp_path):
+        single = _run(synthetic_client, tmp_path / "single")
+        chunked = _run(synthetic_client, tmp_path / "chunked", chunk_size=450)
+
+        assert list(chunked) == list(single)
+        for sheet in single:
+            pd.testing.assert_frame_equal(chunked[sheet], single[sheet], check_exact=True)
+
+    def test_spend_totals_are_correctly_rounded_sums(self, synthetic_client, tmp_path):
+        # Spend is summed exactly and rounded once, so a total can differ from
+        # pandas' pairwise sum in the last bits but never from math.fsum.
+        # CSV keeps every bit (openpyxl writes 15 significant digits).
+        files = _run_files(synthetic_client, tmp_path, output_format="csv")
+        results = pd.read_csv(files["all_results.csv"], float_precision="round_trip")
+        for name, levels in [("spend_by_category_l1.csv", ["CategoryLevel1"]),
+                             ("spend_by_category_l2.csv", ["CategoryLevel1", "CategoryLevel2"])]:
+            grouped = results.fillna({level: "" for level in levels}).groupby(levels)["Invoice Line Amount"]
+            expected = grouped.agg(lambda s: categorize.math.fsum(s.dropna()))
+            table = pd.read_csv(files[name], float_precision="round_trip").fillna({level: "" for level in levels})
+            got = table.set_index(levels)["TotalSpend"]
+            assert got.to_dict() == expected.to_dict()
+
+    def test_pipelined_run_matches_single_shot(self, synthetic_client, tmp_path):
+        single = _run(synthetic_client, tmp_path / "single")
+        pipelined = _run(synthetic_client, tmp_path / "pipelined", chunk_size=450, pipeline=True)
+
+        assert list(pipelined) == list(single)
+        for sheet in single:
+            pd.testing.assert_frame_equal(pipelined[sheet], single[sheet], check_exact=True)
+
+    def test_blank_spend_categories_merge_across_chunks(self, client_copy, tmp_path):
+        client = client_copy()
+        input_path = client / "data" / "input" / "transactions.csv"
+        df = pd.read_csv(input_path)
+        df.loc[::9, "Spend Category"] = None
+        df.to_csv(input_path, index=False)
+
+        single = _run(client, tmp_path / "single")
+        unmapped = single["Unmapped SC Codes"]
+        assert unmapped.iloc[:, 0].isna().sum() == 1
+        for out_dir, kwargs in [("chunked", {"chunk_size": 333}), ("pipelined", {"chunk_size": 500, "pipeline": True})]:
+            split = _run(client, tmp_path / out_dir, **kwargs)
+            assert list(split) == list(single)
+            for sheet in single:
+                pd.testing.assert_frame_equal(split[sheet], single[sheet], check_exact=True)
+
+    def test_failed_input_checks_stop_the_reader_thread(self, client_copy, tmp_path):
+        import threading
+        client = client_copy()
+        config = categorize.load_config(str(client / "config.yaml"), output_dir_override=str(tmp_path))
+        input_path = client / "data" / "input" / "transactions.csv"
+        pd.read_csv(input_path).drop(columns=config["columns"]["supplier"]).to_csv(input_path, index=False)
+
+        with pytest.raises(categorize.ConfigError, match="supplier"):
+            categorize.main(config, chunk_size=100, pipeline=True)
+        assert not [t for t in threading.enumerate() if t.name == "categorize-reader"]
+
+    def test_prefetcher_raises_reader_errors_in_order(self):
+        def chunks():
+            yield 1
+            yield 2
+            raise ValueError("bad chunk")
+
+        prefetcher = categorize.ChunkPrefetcher(chunks())
+        assert next(prefetcher) == 1
+        assert next(prefetcher) == 2
+        with pytest.raises(ValueError, match="bad chunk"):
+            next(prefetcher)
+        assert next(prefetcher, None) is None
+        prefetcher.close()
+
+    def test_exact_sums_match_fsum_per_group(self):
+        values = np.array([0.1] * 10 + [1e16, -1e16, 3.3, float("nan"), 2.675, 5e-324, 1e308, 1e308])
+        codes = np.array([0, 1] * 9)
+        totals, special = categorize.exact_sums(codes, categorize.split_floats(values), 3)
+        for group in range(3):
+            expected = categorize.math.fsum(v for v in values[codes == group] if v == v)
+            assert categorize.exact_float(totals[group], special[group]) == expected
+        head, _ = categorize.exact_sums(codes[:5], categorize.split_floats(values[:5]), 3)
+        tail, _ = categorize.exact_sums(codes[5:], categorize.split_floats(values[5:]), 3)
+        assert [a + b for a, b in zip(head, tail)] == totals
+
+    def test_merged_summaries_match_one_pass(self, categorizer, transactions, synthetic_config):
+        results = categorizer.classify(transactions)
+        cols, aggregations = synthetic_config["columns"], synthetic_config["aggregations"]
+        whole = categorize.SummaryAccumulator(cols, aggregations)
+        whole.update(results)
+        merged = categorize.SummaryAccumulator(cols, aggregations)
+        for part in (results.iloc[2500:], results.iloc[:2500]):
+            partial = categorize.SummaryAccumulator(cols, aggregations)
+            partial.update(part)
+            merged.merge(partial)
+
+        pd.testing.assert_frame_equal(merged.summary_frame(), whole.summary_frame())
+        pd.testing.assert_frame_equal(merged.spend_by_l1(), whole.spend_by_l1(), check_exact=True)
+        pd.testing.assert_frame_equal(merged.spend_by_l2(), whole.spend_by_l2(), check_exact=True)
+        for agg in aggregations:
+            pd.testing.assert_frame_equal(merged.aggregation(agg["column"]), whole.aggregation(agg["column"]),
+                                          check_exact=True)
+        assert dict(merged.unmapped_sc) == dict(whole.unmapped_sc)
+
+
+# -- Parallel classification ----------------------------------------------------
+
+
+class TestParallelWorkers:
+
+    def test_worker_pool_matches_serial_run(self, synthetic_client, tmp_path):
+        serial = _run(synthetic_client, tmp_path / "serial")
+        parallel = _run(synthetic_client, tmp_path / "parallel", workers=2, chunk_size=1500)
+
+        assert list(parallel) == list(serial)
+        for sheet in serial:
+            pd.testing.assert_frame_equal(parallel[sheet], serial[sheet], check_exact=True)
+
+
+# -- Excel export -----------------------------------------------------------------
+
+
+class TestExcelExport:
+
+    def test_long_tables_split_across_sheets(self, synthetic_client, tmp_path, monkeypatch):
+        whole = _run(synthetic_client, tmp_path / "whole")
+        monkeypatch.setattr(categorize.ExcelOutput, "max_rows", 1500)
+        split = _run(synthetic_client, tmp_path / "split", chunk_size=1000)
+
+        assert list(split)[:4] == ["All Results 1", "All Results 2", "All Results 3", "Manual Review"]
+        assert [len(split[f"All Results {i}"]) for i in (1, 2, 3)] == [1499, 1499, 1002]
+        rejoined = pd.concat([split[f"All Results {i}"] for i in (1, 2, 3)], ignore_index=True)
+        pd.testing.assert_frame_equal(rejoined, whole["All Results"], check_exact=True)
+        for sheet in list(whole)[1:]:
+            pd.testing.assert_frame_equal(split[sheet], whole[sheet], check_exact=True)
+
+
+# -- Reference bundle cache -------------------------------------------------------
+
+
+class TestReferenceBundle:
+
+    @pytest.fixture
+    def ref_paths(self, synthetic_config, tmp_path):
+        paths = {}
+        for key in categorize.REFERENCE_SOURCES:
+            source = synthetic_config["_resolved_paths"][key]
+            paths[key] = tmp_path / source.name
+            shutil.copy(source, paths[key])
+        return paths
+
+    def test_bundle_is_reused_until_a_source_changes(self, ref_paths, tmp_path):
+        cache_dir = tmp_path / ".cache"
+        built = categorize.load_reference_bundle(ref_paths, cache_dir)
+        cached = categorize.load_reference_bundle(ref_paths, cache_dir)
+        assert not built["cached"] and cached["cached"]
+        assert cached["sc_mapping"] == built["sc_mapping"]
+        assert cached["taxonomy_lookup"] == built["taxonomy_lookup"]
+        texts = ["acme medical supply", "oracle america", ""]
+        assert (cached["matchers"]["keyword"].first_match(texts).tolist()
+                == built["matchers"]["keyword"].first_match(texts).tolist())
+
+        with open(ref_paths["keyword_rules"], "a", encoding="utf-8") as f:
+            f.write("\n# edited\n")
+        rebuilt = categorize.load_reference_bundle(ref_paths, cache_dir)
+        assert not rebuilt["cached"]
+        assert len(list(cache_dir.glob("reference_*.pkl"))) == 1
+        assert categorize.load_reference_bundle(ref_paths, cache_dir)["cached"]
+
+    def test_unreadable_bundle_is_rebuilt(self, ref_paths, tmp_path):
+        cache_dir = tmp_path / ".cache"
+        categorize.load_reference_bundle(ref_paths, cache_dir)
+        (bundle_path,) = cache_dir.glob("reference_*.pkl")
+        bundle_path.write_bytes(b"truncated")
+        assert not categorize.load_reference_bundle(ref_paths, cache_dir)["cached"]
+        assert categorize.load_reference_bundle(ref_paths, cache_dir)["cached"]
+
+
+# -- Supplier match cache ---------------------------------------------------------
+
+
+class TestSupplierMatchCache:
+
+    def test_cached_tiers_match_the_matchers(self, synthetic_keys, synthetic_refs, synthetic_config):
+        classif = synthetic_config["classification"]
+        expected, expected_counts = _classify(synthetic_keys, synthetic_refs, classif)
+        cache = categorize.SupplierMatchCache(synthetic_refs["refinement"])
+        for _ in range(2):
+            result, counts = _classify(synthetic_keys, synthetic_refs, classif, supplier_cache=cache)
+            pd.testing.assert_frame_equal(result, expected)
+            assert counts == expected_counts
+        assert cache.misses == len(cache.entries) > 0
+
+    def test_matches_persist_until_a_supplier_pattern_changes(self, synthetic_refs, tmp_path):
+        refinement = synthetic_refs["refinement"]
+        path = tmp_path / ".cache" / "supplier_matches.pkl"
+        suppliers = ["acme medical supply", "oracle america", ""]
+        cache = categorize.SupplierMatchCache(refinement, path)
+        first = cache.matches(suppliers, "supplier_override_rules")
+        cache.save()
+
+        reloaded = categorize.SupplierMatchCache(refinement, path)
+        assert reloaded.loaded == 3
+        assert (reloaded.matches(suppliers, "supplier_override_rules") == first).all()
+        assert reloaded.misses == 0
+        assert (first == synthetic_refs["matchers"]["override"].matching_rules(suppliers)).all()
+
+        edited = {**refinement, "supplier_rules": refinement["supplier_rules"][1:]}
+        stale = categorize.SupplierMatchCache(edited, path)
+        assert stale.stale and not stale.entries
+
+    def test_least_recently_used_suppliers_are_evicted(self, synthetic_refs):
+        cache = categorize.SupplierMatchCache(synthetic_refs["refinement"], max_entries=2)
+        cache.matches(["a", "b"], "supplier_rules")
+        cache.matches(["a"], "supplier_rules")
+        cache.matches(["c"], "supplier_rules")
+        assert list(cache.entries) == ["a", "c"]
+
+    def test_case_and_whitespace_variants_share_an_entry(self, synthetic_refs):
+        cache = categorize.SupplierMatchCache(synthetic_refs["refinement"])
+        variants = ["Salesforce Inc", "SALESFORCE INC ", "  salesforce inc"]
+        rows = cache.matches(variants, "supplier_override_rules")
+        assert list(cache.entries) == ["salesforce inc"] and cache.misses == 1
+        assert (rows == synthetic_refs["matchers"]["override"].matching_rules(["salesforce inc"])).all()
+        assert rows.any()
+
+    def test_worker_pool_uses_the_cache(self, synthetic_config, transactions):
+        with categorize.Categorizer(synthetic_config, use_cache=False) as serial:
+            expected = serial.classify(transactions)
+        with categorize.Categorizer(synthetic_config, use_cache=False, workers=2) as pooled:
+            results = pooled.classify(transactions)
+            assert pooled.supplier_cache.misses > 0
+        pd.testing.assert_frame_equal(results, expected)
+
+    def test_invalid_size_is_rejected(self, synthetic_client, tmp_path):
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text((synthetic_client / "config.yaml").read_text().replace(
+            "classification:\n", "classification:\n  supplier_cache_size: -1\n"))
+        with pytest.raises(categorize.ConfigError, match="supplier_cache_size"):
+            categorize.load_config(str(config_path))
+
+
+# -- Profiling --------------------------------------------------------------------
+
+
+class TestProfile:
+
+    def test_profiled_run_classifies_identically(self, synthetic_keys, synthetic_refs, synthetic_config):
+        classif = synthetic_config["classification"]
+        plain, plain_counts = _classify(synthetic_keys, synthetic_refs, classif)
+        profile = categorize.ClassificationProfile()
+        profiled, profiled_counts = _classify(synthetic_keys, synthetic_refs, classif, profile=profile)
+
+        pd.testing.assert_frame_equal(profiled, plain)
+        assert profiled_counts == plain_counts
+        for tier in ("tier2", "tier3", "tier4", "tier5"):
+            assert profile.tiers[tier]["hits"] == plain_counts[tier]
+            rule_hits = sum(r["hits"] for (t, _), r in profile.rules.items() if t == tier)
+            assert rule_hits == plain_counts[tier]
+        keyword_rules = [r for (t, _), r in profile.rules.items() if t == "tier3"]
+        assert len(keyword_rules) == len(synthetic_refs["rules"])
+        assert keyword_rules[0]["candidates"] == profile.tiers["tier3"]["candidates"]
+
+    def test_tier_only_profile_skips_rules(self, synthetic_keys, synthetic_refs, synthetic_config):
+        classif = synthetic_config["classification"]
+        plain, plain_counts = _classify(synthetic_keys, synthetic_refs, classif)
+        profile = categorize.ClassificationProfile(rules=False)
+        profiled, profiled_counts = _classify(synthetic_keys, synthetic_refs, classif, profile=profile)
+
+        pd.testing.assert_frame_equal(profiled, plain)
+        assert profiled_counts == plain_counts
+        assert profile.rules == {}
+        assert all(profile.tiers[tier]["hits"] == plain_counts[tier] for tier in ("tier2", "tier3", "tier7"))
+
+    def test_profile_report_is_written(self, synthetic_client, tmp_path):
+        _run(synthetic_client, tmp_path, profile_top=5)
+        (report_path,) = tmp_path.glob("*_profile.json")
+        report = json.loads(report_path.read_text(encoding="utf-8"))
+        assert report["total_rows"] == 4000
+        assert [t["tier"] for t in report["tiers"]][:3] == ["tier1", "tier2", "tier3"]
+        seconds = [r["seconds"] for r in report["rules"]]
+        assert seconds == sorted(seconds, reverse=True)
+        assert {"tier", "index", "pattern", "target", "evaluations", "candidates", "hits"} <= set(report["rules"][0])
+
+
+# -- Run metrics ------------------------------------------------------------------
+
+
+class TestRunMetrics:
+
+    def test_metrics_are_written_and_appended_to_history(self, client_copy, tmp_path):
+        client = client_copy()
+        _run(client, tmp_path / "first")
+        assert len((tmp_path / "first" / "metrics_history.jsonl").read_text(encoding="utf-8").splitlines()) == 1
+        history_client = client_copy("history", edit=lambda config: config.update(
+            output={"metrics_history": "history/runs.jsonl"}))
+        _run(history_client, tmp_path / "second")
+        _run(history_client, tmp_path / "third", chunk_size=1500)
+
+        (jsonl_path,) = (tmp_path / "third").glob("*_metrics.jsonl")
+        (record,) = [json.loads(line) for line in jsonl_path.read_text(encoding="utf-8").splitlines()]
+        assert record["rows"] == 4000
+        assert record["settings"]["chunk_size"] == 1500
+        assert sum(record["tier_hits"].values()) - record["tier_hits"]["tier7"] == 4000
+        assert record["tiers"]["tier3"]["rows_per_second"] > 0
+        assert record["rules"]["keyword_rules"] > 0
+        assert record["peak_memory_bytes"] > 0
+
+        history = (history_client / "history" / "runs.jsonl").read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line)["settings"]["chunk_size"] for line in history] == [None, 1500]
+        assert not (tmp_path / "third" / "metrics_history.jsonl").exists()
+        prom = next((tmp_path / "third").glob("*.prom")).read_text(encoding="utf-8")
+        assert 'categorize_rows{client="SYNTH"} 4000.0' in prom
+        assert 'categorize_tier_hits{client="SYNTH",tier="tier3"}' in prom
+
+    def test_prometheus_labels_are_escaped(self):
+        record = {"client": 'A "B"\\C', "timestamp": 1.0, "rows": 2, "unique_keys": 1, "dedup_ratio": 2.0,
+                  "input_bytes": 10, "peak_memory_bytes": None, "rows_per_second": 4.0,
+                  "seconds": {"total": 0.5}, "tier_hits": {"tier1": 2}, "tiers": None, "rules": {}}
+        prom = categorize.prometheus_metrics(record)
+        assert 'categorize_rows{client="A \\"B\\"\\\\C"} 2.0' in prom
+        assert "categorize_peak_memory_bytes" not in prom
+        assert "categorize_tier_seconds" not in prom
+
+
+# -- Incremental runs ---------------------------------------------------------------
+
+
+class TestIncremental:
+
+    @pytest.fixture
+    def client(self, client_copy):
+        return client_copy()
+
+    def _state(self, client):
+        return pd.read_pickle(client / ".cache" / "incremental_state.pkl")
+
+    def test_unchanged_rows_are_reused(self, client, tmp_path, capsys):
+        full = _run(client, tmp_path / "full")
+        _run(client, tmp_path / "first", incremental=True, chunk_size=1500)
+        capsys.readouterr()
+        second = _run(client, tmp_path / "second", incremental=True)
+        assert "Reused from previous run: 4,000 rows; classifying 0 new" in capsys.readouterr().out
+        for sheet in full:
+            pd.testing.assert_frame_equal(second[sheet], full[sheet], check_exact=True)
+
+    def test_new_and_changed_rows_are_reclassified(self, client, tmp_path, capsys):
+        _run(client, tmp_path / "first", incremental=True)
+        input_path = client / "data" / "input" / "transactions.csv"
+        df = pd.read_csv(input_path)
+        df.loc[:9, "Supplier"] = "Epic Systems"
+        df.loc[10:19, "Invoice Line Amount"] += 1.0
+        extra = df.tail(5).assign(**{"Invoice Number": "INV999999", "Invoice Line": [1, 2, 3, 4, 5]})
+        pd.concat([df, extra]).to_csv(input_path, index=False)
+
+        capsys.readouterr()
+        incremental = _run(client, tmp_path / "second", incremental=True)
+        assert "Reused from previous run: 3,990 rows; classifying 15 new" in capsys.readouterr().out
+        full = _run(client, tmp_path / "full")
+        for sheet in full:
+            pd.testing.assert_frame_equal(incremental[sheet], full[sheet], check_exact=True)
+        assert len(self._state(client)["rows"]) == 4005
+
+    def test_rule_change_reclassifies_everything(self, client, tmp_path, capsys):
+        _run(client, tmp_path / "first", incremental=True)
+        config = categorize.load_config(str(client / "config.yaml"))
+        with open(config["_resolved_paths"]["keyword_rules"], "a", encoding="utf-8") as f:
+            f.write("\n# edited\n")
+        capsys.readouterr()
+        _run(client, tmp_path / "second", incremental=True)
+        out = capsys.readouterr().out
+        assert "reference data or settings changed" in out
+        assert "Reused from previous run: 0 rows; classifying 4,000 new" in out
+
+
+# -- Columnar output -------------------------------------------------------------
+
+
+def _run_files(synthetic_client, out_dir, **kwargs):
+    config = categorize.load_config(str(synthetic_client / "config.yaml"), output_dir_override=str(out_dir))
+    categorize.main(config, **kwargs)
+    (run_dir,) = [path for path in out_dir.iterdir() if path.is_dir()]
+    return {path.name: path for path in run_dir.iterdir()}
+
+
+class TestColumnarOutput:
+
+    def test_csv_is_byte_identical_across_chunks_and_workers(self, synthetic_client, tmp_path):
+        serial = _run_files(synthetic_client, tmp_path / "serial", output_format="csv")
+        parallel = _run_files(synthetic_client, tmp_path / "parallel", output_format="csv",
+                              workers=2, chunk_size=700)
+
+        assert sorted(parallel) == sorted(serial)
+        assert "all_results.csv" in serial and "spend_by_category_l1.csv" in serial
+        for name in serial:
+            assert parallel[name].read_bytes() == serial[name].read_bytes(), name
+
+    @pytest.mark.parametrize("output_format", ["parquet", "feather"])
+    def test_arrow_formats_match_csv(self, synthetic_client, tmp_path, output_format):
+        pytest.importorskip("pyarrow")
+        reader = pd.read_parquet if output_format == "parquet" else pd.read_feather
+        csv = _run_files(synthetic_client, tmp_path / "csv", output_format="csv")
+        arrow = _run_files(synthetic_client, tmp_path / output_format, output_format=output_format, chunk_size=700)
+
+        results = reader(arrow[f"all_results.{output_format}"])
+        assert results["TaxonomyKey"].dtype == "category"
+        assert results["ReviewTier"].dtype == "category"
+
+        expected = pd.read_csv(csv["all_results.csv"], dtype=str, keep_default_na=False)
+        got = results.astype(str).replace({"nan": "", "None": ""})
+        for col in ["Supplier", "SC Code", "CategoryLevel1", "CategoryLevel5", "TaxonomyKey",
+                    "ClassificationMethod", "ReviewTier"]:
+            assert got[col].tolist() == expected[col].tolist(), col
+
+    def test_invalid_format_is_rejected(self, synthetic_client, tmp_path):
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(
+            (synthetic_client / "config.yaml").read_text() + "\noutput:\n  format: xls\n"
+        )
+        with pytest.raises(categorize.ConfigError, match="output.format"):
+            categorize.load_config(str(config_path))
+
+
+# -- Categorizer API --------------------------------------------------------------
+
+
+@pytest.fixture(scope="module")
+def categorizer(synthetic_config):
+    with categorize.Categorizer(synthetic_config) as categorizer:
+        yield categorizer
+
+
+@pytest.fixture(scope="module")
+def transactions(synthetic_config):
+    (df,) = categorize.open_input(synthetic_config)
+    return df
+
+
+class TestCategorizer:
+
+    def test_classify_matches_cli_output(self, categorizer, synthetic_client, transactions, tmp_path):
+        files = _run_files(synthetic_client, tmp_path, output_format="csv")
+        expected = pd.read_csv(files["all_results.csv"], dtype=str, keep_default_na=False)
+        results = categorizer.classify(transactions)
+
+        assert list(results.columns) == list(expected.columns)
+        got = results.astype(str).replace({"nan": ""})
+        for col in ["SC Code", "TaxonomyKey", "CategoryLevel2", "ClassificationMethod", "Confidence", "ReviewTier"]:
+            assert got[col].tolist() == expected[col].tolist(), col
+
+    def test_batches_are_independent(self, categorizer, transactions):
+        whole = categorizer.classify(transactions)
+        parts = pd.concat([categorizer.classify(transactions.iloc[:1000]),
+                           categorizer.classify(transactions.iloc[1000:])])
+        pd.testing.assert_frame_equal(parts.astype(str), whole.astype(str))
+
+    def test_classify_records(self, categorizer, synthetic_config, transactions):
+        cols = synthetic_config["columns"]
+        batch = transactions.head(25).astype(object).drop(columns=[cols["cost_center"]])
+        records = categorizer.classify_records(batch.to_dict("records"))
+
+        expected = categorizer.classify(batch.assign(**{cols["cost_center"]: ""}))
+        assert [r["TaxonomyKey"] for r in records] == expected["TaxonomyKey"].tolist()
+        assert [r["ReviewTier"] for r in records] == expected["ReviewTier"].tolist()
+        json.dumps(records)
+        assert categorizer.classify_records([]) == []
+
+    def test_worker_pool_matches_serial(self, categorizer, synthetic_config, transactions):
+        with categorize.Categorizer(synthetic_config, workers=2) as pooled:
+            results = pooled.classify(transactions)
+            assert pooled._executor is not None
+        assert pooled._executor is None
+        pd.testing.assert_frame_equal(results, categorizer.classify(transactions))
+
+
+# -- HTTP service -----------------------------------------------------------------
+
+
+def _post(server, body, content_type="application/json"):
+    import urllib.request
+    host, port = server.server_address[:2]
+    request = urllib.request.Request(f"http://{host}:{port}/classify", data=body,
+                                     headers={"Content-Type": content_type})
+    with urllib.request.urlopen(request) as response:
+        return response.read().decode("utf-8")
+
+
+@pytest.fixture(scope="module")
+def server(synthetic_config):
+    import threading
+    server = categorize.make_server(synthetic_config, port=0, max_wait_ms=200)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.batcher.close()
+
+
+@pytest.fixture(scope="module")
+def lines(transactions):
+    head = transactions.head(40).astype(object)
+    return head.where(head.notna(), None).to_dict("records")
+
+
+class TestService:
+
+    def test_json_lines_match_categorizer(self, server, categorizer, lines):
+        results = json.loads(_post(server, json.dumps({"lines": lines}).encode()))["results"]
+        expected = categorizer.classify_records(lines)
+        assert len(results) == len(lines)
+        assert set(results[0]) == set(categorize.SERVICE_FIELDS)
+        for got, want in zip(results, expected):
+            assert {k: got[k] for k in categorize.SERVICE_FIELDS} == {k: want[k] for k in categorize.SERVICE_FIELDS}
+
+    def test_concurrent_requests_are_coalesced(self, server, categorizer, lines):
+        from concurrent.futures import ThreadPoolExecutor
+        batches_before = server.batcher.stats.batches
+        chunks = [lines[i:i + 5] for i in range(0, len(lines), 5)]
+        with ThreadPoolExecutor(len(chunks)) as pool:
+            replies = list(pool.map(lambda chunk: json.loads(_post(server, json.dumps(chunk).encode())), chunks))
+
+        assert server.batcher.stats.batches - batches_before < len(chunks)
+        expected = [r["TaxonomyKey"] for r in categorizer.classify_records(lines)]
+        assert [r["TaxonomyKey"] for reply in replies for r in reply["results"]] == expected
+
+    def test_csv_lines(self, server, transactions):
+        body = transactions.head(10).to_csv(index=False).encode()
+        results = pd.read_csv(io.StringIO(_post(server, body, "text/csv")))
+        assert list(results.columns) == categorize.SERVICE_FIELDS
+        assert len(results) == 10
+
+    def test_csv_numeric_cost_centers_classify_like_a_file_run(self, server, synthetic_client, synthetic_config,
+                                                              categorizer, transactions, tmp_path):
+        cost_center = synthetic_config["columns"]["cost_center"]
+        head = transactions.head(10).copy()
+        head[cost_center] = ["12345"] * 9 + [None]
+        body = head.to_csv(index=False).encode()
+        records = categorize.csv_records(body, synthetic_config)
+        assert [r[cost_center] for r in records[:9]] == ["12345"] * 9 and pd.isna(records[9][cost_center])
+
+        (tmp_path / "lines.csv").write_bytes(body)
+        config = categorize.load_config(str(synthetic_client / "config.yaml"),
+                                        input_override=str(tmp_path / "lines.csv"))
+        (df,) = categorize.open_input(config)
+        expected = categorizer.classify(df)["TaxonomyKey"].fillna("").tolist()
+        results = pd.read_csv(io.StringIO(_post(server, body, "text/csv")))
+        assert results["TaxonomyKey"].fillna("").tolist() == expected
+
+    def test_bad_request_and_metrics(self, server):
+        import urllib.error
+        import urllib.request
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            _post(server, b'{"lines": 3}')
+        assert excinfo.value.code == 400
+
+        host, port = server.server_address[:2]
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            metrics = json.loads(response.read())
+        assert metrics["errors"] >= 1
+        assert metrics["lines"] >= 40
+        assert {"p50", "p95", "p99", "max"} <= set(metrics["latency_ms"])
+
+
+# -- Batch runner -----------------------------------------------------------------
+
+
+class TestBatch:
+
+    @pytest.fixture
+    def clients(self, synthetic_client, client_copy):
+        """Two clients sharing one taxonomy workbook, and one whose input is missing."""
+        taxonomy = synthetic_client / "data" / "reference" / "taxonomy.xlsx"
+
+        def edit(config, broken=False):
+            config["paths"]["taxonomy"] = str(taxonomy)
+            if broken:
+                config["paths"]["input"] = "data/input/missing.csv"
+
+        return [client_copy("alpha", edit) / "config.yaml", client_copy("beta", edit) / "config.yaml",
+                client_copy("broken", lambda config: edit(config, broken=True)) / "config.yaml"]
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_clients_run_with_shared_references(self, clients, synthetic_client, tmp_path, workers):
+        manifest = categorize.run_batch(clients, workers=workers, manifest_path=tmp_path / "manifest.json",
+                                        output_format="csv")
+
+        assert json.loads((tmp_path / "manifest.json").read_text())["workers"] == workers
+        assert manifest["shared_references"] == [str(synthetic_client / "data" / "reference" / "taxonomy.xlsx")]
+        ok, broken = manifest["clients"][:2], manifest["clients"][2]
+        assert broken["status"] == "error" and "missing.csv" in broken["error"]
+
+        expected = _run_files(synthetic_client, tmp_path / "single", output_format="csv")
+        for entry in ok:
+            assert entry["status"] == "ok" and entry["rows"] == 4000
+            assert {"load_seconds", "classification_seconds", "export_seconds", "total_seconds"} <= set(entry)
+            assert "CLASSIFICATION COMPLETE" in entry["log"].read_text(encoding="utf-8")
+            got = entry["output"] / "all_results.csv"
+            assert got.read_bytes() == expected["all_results.csv"].read_bytes()
+
+    def test_parsed_references_follow_mtime(self, synthetic_client, tmp_path):
+        import os
+        path = tmp_path / "taxonomy.xlsx"
+        shutil.copy(synthetic_client / "data" / "reference" / "taxonomy.xlsx", path)
+        first = categorize.parsed_reference(categorize.load_taxonomy, path)
+        assert categorize.parsed_reference(categorize.load_taxonomy, path) is first
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert categorize.parsed_reference(categorize.load_taxonomy, path) is not first
+
+    def test_config_globs(self, clients, tmp_path):
+        assert categorize.expand_configs([str(tmp_path / "*" / "config.yaml")]) == sorted(clients)
+        with pytest.raises(categorize.ConfigError, match="No config files match"):
+            categorize.expand_configs([str(tmp_path / "nope" / "*.yaml")])
+
+
+# -- Typed input -----------------------------------------------------------------
+
+
+class TestTypedInput:
+
+    @pytest.fixture
+    def client(self, client_copy):
+        return client_copy()
+
+    def test_unused_columns_are_not_read(self, client, tmp_path, capsys):
+        expected = _run(client, tmp_path / "before")
+        input_path = client / "data" / "input" / "transactions.csv"
+        df = pd.read_csv(input_path)
+        df.insert(2, "Approver Comments", "free text nobody classifies on")
+        df.to_csv(input_path, index=False)
+
+        capsys.readouterr()
+        got = _run(client, tmp_path / "after")
+        assert "Reading 9 of 10 columns" in capsys.readouterr().out
+        for sheet in expected:
+            pd.testing.assert_frame_equal(got[sheet], expected[sheet], check_exact=True)
+
+    def test_key_columns_are_categorical(self, synthetic_config):
+        (df,) = categorize.open_input(synthetic_config)
+        cols = synthetic_config["columns"]
+        assert df[cols["supplier"]].dtype == "category"
+        assert df[cols["spend_category"]].dtype == "category"
+        assert df[cols["amount"]].dtype == "float64"
+
+    def test_non_numeric_amounts_are_blank_with_a_warning(self, client, tmp_path, capsys):
+        input_path = client / "data" / "input" / "transactions.csv"
+        df = pd.read_csv(input_path)
+        amount_col = "Invoice Line Amount"
+        df[amount_col] = df[amount_col].astype(object)
+        df.loc[:2, amount_col] = ["$1,234.00", "N/A", "Total"]
+        df.to_csv(input_path, index=False)
+
+        capsys.readouterr()
+        got = _run(client, tmp_path / "out", chunk_size=1500)
+        assert "WARNING: 2 non-numeric values in 'Invoice Line Amount' read as blank" in capsys.readouterr().out
+        amounts = got["All Results"][amount_col]
+        assert amounts.iloc[:3].isna().all()
+        assert amounts.iloc[3:].tolist() == pd.to_numeric(df[amount_col].iloc[3:]).tolist()
+
+    def test_pyarrow_engine_matches_default(self, synthetic_client, tmp_path):
+        pytest.importorskip("pyarrow")
+        default = _run(synthetic_client, tmp_path / "c")
+        arrow = _run(synthetic_client, tmp_path / "pyarrow", csv_engine="pyarrow")
+        for sheet in default:
+            pd.testing.assert_frame_equal(arrow[sheet], default[sheet], check_exact=True)
+
+    def test_invalid_engine_is_rejected(self, synthetic_client, tmp_path):
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(
+            (synthetic_client / "config.yaml").read_text() + "\ninput:\n  engine: python\n"
+        )
+        with pytest.raises(categorize.ConfigError, match="input.engine"):
+            categorize.load_config(str(config_path))
+
+
+# -- Input cache ------------------------------------------------------------------
+
+
+class TestInputCache:
+
+    @pytest.fixture
+    def client(self, client_copy):
+        pytest.importorskip("pyarrow")
+        return client_copy(edit=lambda config: config.update(input={"cache": True}))
+
+    def _read(self, client, **kwargs):
+        config = categorize.load_config(str(client / "config.yaml"), input_override=kwargs.pop("input", None))
+        return list(categorize.open_input(config, **kwargs))
+
+    def test_cached_reads_match_the_csv(self, client, capsys):
+        (expected,) = self._read(client, use_cache=False)
+        (built,) = self._read(client)
+        assert "parsing 9 of 9 columns" in capsys.readouterr().out
+        (cached,) = self._read(client)
+        assert "memory-mapping" in capsys.readouterr().out
+        pd.testing.assert_frame_equal(built, expected)
+        pd.testing.assert_frame_equal(cached, expected)
+
+        chunks = self._read(client, chunk_size=1500)
+        expected_chunks = self._read(client, chunk_size=1500, use_cache=False)
+        assert len(chunks) == len(expected_chunks) > 1
+        for got, want in zip(chunks, expected_chunks):
+            pd.testing.assert_frame_equal(got, want)
+
+    def test_entries_follow_the_file_contents(self, client, tmp_path, capsys):
+        self._read(client)
+        copy = tmp_path / "renamed.csv"
+        shutil.copy(client / "data" / "input" / "transactions.csv", copy)
+        capsys.readouterr()
+        self._read(client, input=str(copy))
+        assert "memory-mapping" in capsys.readouterr().out
+
+        with open(copy, "a", encoding="utf-8") as f:
+            f.write(copy.read_text().splitlines()[1] + "\n")
+        (edited,) = self._read(client, input=str(copy))
+        assert "parsing" in capsys.readouterr().out
+        assert len(edited) == len(pd.read_csv(copy))
+        assert len(list((client / ".cache" / "input").glob("input_*.arrow"))) == 2
+
+    def test_least_recently_used_entries_are_evicted(self, client, tmp_path):
+        self._read(client)
+        cache_dir = client / ".cache" / "input"
+        (first,) = cache_dir.glob("input_*.arrow")
+        config = yaml.safe_load((client / "config.yaml").read_text())
+        config["input"]["cache_max_mb"] = first.stat().st_size * 1.5 / 2**20
+        config["input"]["dtypes"] = {"Invoice Number": "category"}
+        (client / "config.yaml").write_text(yaml.safe_dump(config, sort_keys=False))
+
+        self._read(client)
+        (second,) = cache_dir.glob("input_*.arrow")
+        assert second != first
+        manifest = json.loads((cache_dir / "manifest.json").read_text())
+        assert [e["file"] for e in manifest["entries"].values()] == [second.name]
+
+    def test_invalid_size_cap_is_rejected(self, synthetic_client, tmp_path):
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(
+            (synthetic_client / "config.yaml").read_text() + "\ninput:\n  cache: true\n  cache_max_mb: 0\n"
+        )
+        with pytest.raises(categorize.ConfigError, match="input.cache_max_mb"):
+            categorize.load_config(str(config_path))
+
+
+# -- Rule impact diff -----------------------------------------------------------
+
+
+class TestRuleDiff:
+
+    @pytest.fixture
+    def client(self, client_copy):
+        return client_copy()
+
+    def _edit_rules(self, client, tmp_path, edit):
+        config = categorize.load_config(str(client / "config.yaml"))
+        rules_path = config["_resolved_paths"]["refinement_rules"]
+        old_rules = tmp_path / "old_rules.yaml"
+        shutil.copy(rules_path, old_rules)
+        data = yaml.safe_load(rules_path.read_text(encoding="utf-8"))
+        edit(data)
+        rules_path.write_text(yaml.safe_dump(data, sort_keys=False), encoding="utf-8")
+        return old_rules
+
+    def _expected_matrix(self, before, after, amount_col):
+        moved = pd.DataFrame({
+            "Old TaxonomyKey": before["TaxonomyKey"],
+            "New TaxonomyKey": after["TaxonomyKey"],
+            "Amount": before[amount_col],
+        })
+        moved = moved[moved["Old TaxonomyKey"] != moved["New TaxonomyKey"]]
+        return moved.groupby(["Old TaxonomyKey", "New TaxonomyKey"])["Amount"].agg(["size", "sum"])
+
+    def _diff(self, client, tmp_path, old_rules, previous):
+        config = categorize.load_config(str(client / "config.yaml"), output_dir_override=str(tmp_path / "diff"))
+        matrix = categorize.run_diff(config, str(previous), str(old_rules))
+        (diff_xlsx,) = (tmp_path / "diff").glob("*_rule_diff.xlsx")
+        return config, matrix, diff_xlsx
+
+    def _edit_supplier_and_override(self, data):
+        data["supplier_rules"][0]["taxonomy_key"] = data["supplier_rules"][1]["taxonomy_key"]
+        data["supplier_override_rules"][0]["taxonomy_key"] = data["supplier_rules"][2]["taxonomy_key"]
+
+    def test_change_matrix_matches_full_rerun(self, client, tmp_path):
+        before = _run(client, tmp_path / "before")["All Results"]
+        (previous,) = (tmp_path / "before").glob("*.xlsx")
+        old_rules = self._edit_rules(client, tmp_path, self._edit_supplier_and_override)
+        after = _run(client, tmp_path / "after")["All Results"]
+        supplier_cache = client / ".cache" / "supplier_matches.pkl"
+        cache_mtime = supplier_cache.stat().st_mtime_ns
+
+        config, matrix, diff_xlsx = self._diff(client, tmp_path, old_rules, previous)
+        assert supplier_cache.stat().st_mtime_ns == cache_mtime
+        expected = self._expected_matrix(before, after, config["columns"]["amount"])
+        assert len(expected) > 0
+        got = matrix.set_index(["Old TaxonomyKey", "New TaxonomyKey"]).sort_index()
+        assert got["Rows"].tolist() == expected["size"].tolist()
+        np.testing.assert_allclose(got["Spend"], expected["sum"])
+        assert set(pd.ExcelFile(diff_xlsx).sheet_names) == {"Change Matrix", "Changed Rows"}
+
+    def test_only_touched_sc_codes_are_reclassified(self, client, tmp_path, capsys):
+        _run(client, tmp_path / "before")
+        (previous,) = (tmp_path / "before").glob("*.xlsx")
+        touched = {}
+
+        def edit(data):
+            rule = data["supplier_rules"][0]
+            touched["sc_codes"] = {str(sc) for sc in rule["sc_codes"]}
+            rule["confidence"] = 0.5
+
+        old_rules = self._edit_rules(client, tmp_path, edit)
+        capsys.readouterr()
+        _, matrix, _ = self._diff(client, tmp_path, old_rules, previous)
+        out = capsys.readouterr().out
+
+        results = pd.read_excel(previous, sheet_name="All Results", dtype={"SC Code": str})
+        expected_rows = int(results["SC Code"].isin(touched["sc_codes"]).sum())
+        assert f"Tier 2 (supplier refinement): {len(touched['sc_codes'])} SC codes" in out
+        assert f"Rows to reclassify: {expected_rows:,} of {len(results):,}" in out
+        assert matrix.empty
+
+    def test_identical_rules_reclassify_nothing(self, client, tmp_path, capsys):
+        _run(client, tmp_path / "before")
+        (previous,) = (tmp_path / "before").glob("*.xlsx")
+        old_rules = self._edit_rules(client, tmp_path, lambda data: None)
+        capsys.readouterr()
+        _, matrix, _ = self._diff(client, tmp_path, old_rules, previous)
+        out = capsys.readouterr().out
+        assert "No rule changes that affect classification" in out
+        assert "Rows to reclassify: 0 of" in out
+        assert matrix.empty
+
+
+# -- Validation ------------------------------------------------------------------
+
+
+class TestValidateOnly:
+
+    @pytest.fixture
+    def broken_client(self, client_copy):
+        root = client_copy()
+        config = yaml.safe_load((root / "config.yaml").read_text())
+
+        keyword_path = root / config["paths"]["keyword_rules"]
+        keywords = yaml.safe_load(keyword_path.read_text(encoding="utf-8"))
+        keywords["rules"][0]["pattern"] = "unbalanced("
+        keyword_path.write_text(yaml.safe_dump(keywords, sort_keys=False), encoding="utf-8")
+
+        refinement_path = root / config["paths"]["refinement_rules"]
+        refinement = yaml.safe_load(refinement_path.read_text(encoding="utf-8"))
+        refinement["supplier_rules"][0]["taxonomy_key"] = "Nowhere > Nothing"
+        del refinement["context_rules"][1]["confidence"]
+        refinement["cost_center_rules"][0]["sc_codes"] = ["SC9999"]
+        refinement["supplier_override_rules"][0]["override_from_l1"] = ["Not A Level 1"]
+        refinement_path.write_text(yaml.safe_dump(refinement, sort_keys=False), encoding="utf-8")
+
+        config["columns"]["supplier"] = "Vendor"
+        (root / "config.yaml").write_text(yaml.safe_dump(config, sort_keys=False))
+        return root / "config.yaml"
+
+    def test_valid_client_has_no_problems(self, synthetic_config):
+        assert categorize.validate_config(synthetic_config) == []
+
+    def test_reports_every_problem(self, broken_client):
+        config = categorize.load_config(str(broken_client), require_input=False)
+        problems = categorize.validate_config(config)
+        expected = [
+            "Columns not found in input CSV: 'Vendor' (from columns.supplier)",
+            "keyword_rules[0] invalid regex 'unbalanced('",
+            "supplier_rules[0] invalid taxonomy key: 'Nowhere > Nothing'",
+            "context_rules[1] missing required key 'confidence'",
+            "cost_center_rules[0] unknown SC codes: SC9999",
+            "supplier_override_rules[0] override_from_l1 not in taxonomy: Not A Level 1",
+        ]
+        for message in expected:
+            assert any(p.startswith(message) for p in problems), message
+        assert len(problems) == len(expected)
+
+    def test_taxonomy_keys_match_pandas(self, synthetic_config):
+        path = synthetic_config["_resolved_paths"]["taxonomy"]
+        lookup = categorize.build_taxonomy_lookup(categorize.load_taxonomy(path))
+        assert categorize.read_taxonomy_keys(path) == {k: v["CategoryLevel1"] for k, v in lookup.items()}
+
+    def test_cli_skips_heavy_imports(self, synthetic_client, broken_client):
+        import subprocess
+        import sys
+        script = categorize.__file__
+        probe = (
+            "import runpy, sys\n"
+            f"sys.argv = [{script!r}, '--config', sys.argv[1], '--validate-only']\n"
+            "try:\n"
+            f"    runpy.run_path({script!r}, run_name='__main__')\n"
+            "finally:\n"
+            "    print('HEAVY', sorted(m for m in ('pandas', 'numpy', 'openpyxl') if m in sys.modules))\n"
+        )
+        ok = subprocess.run([sys.executable, "-c", probe, str(synthetic_client / "config.yaml")],
+                            capture_output=True, text=True)
+        assert ok.returncode == 0, ok.stdout + ok.stderr
+        assert "Config is valid." in ok.stdout and "HEAVY []" in ok.stdout
+
+        broken = subprocess.run([sys.executable, script, "--config", str(broken_client), "--validate-only"],
+                                capture_output=True, text=True)
+        assert broken.returncode == 1
+        assert "6 problems found:" in broken.stdout
+
+
+# -- Regex hazards and the RE2 engine ----------------------------------------------
+
+
+class TestRegexHazards:
+
+    def test_exponential_pattern_is_rejected_at_load(self, tmp_path):
+        path = tmp_path / "keyword_rules.yaml"
+        path.write_text(yaml.safe_dump({"rules": [
+            {"pattern": "fire alarm", "category": "Facilities"},
+            {"pattern": r"(\w+\s?)+$", "category": "Facilities"},
+        ]}))
+        with pytest.raises(categorize.ConfigError, match=r"keyword_rules\[1\] .* backtracks catastrophically"):
+            categorize.load_keyword_rules(path)
+
+    def test_hazard_kinds(self):
+        assert categorize.regex_hazard(r"(a+)+b")["kind"] == "exponential"
+        cubic = categorize.regex_hazard("children.*hospital.*los angeles")
+        assert cubic["kind"] == "polynomial" and cubic["degree"] >= 2.5
+        for safe in ("epic systems|kpmg", "^acme.*", r"foo(?:\s+\w+)*bar", r"\bcdw\b"):
+            assert categorize.regex_hazard(safe) is None, safe
+
+    def test_steep_patterns_stop_at_the_time_budget(self):
+        start = categorize.time.perf_counter()
+        for pattern in ("a.*b.*c.*d", r"led.*\d+.*w.*x", ".*.*.*=.*"):
+            hazard = categorize.regex_hazard(pattern)
+            assert hazard["kind"] == "polynomial" and hazard["degree"] >= 2, pattern
+        assert categorize.time.perf_counter() - start < 5
+        assert categorize.regex_hazard("a.*b.*c.*d", deadline=categorize.time.perf_counter()) is None
+
+    def test_validate_lists_slow_patterns(self, synthetic_config, capsys):
+        assert categorize.validate_config(synthetic_config) == []
+        out = capsys.readouterr().out
+        assert "backtrack super-linearly" in out
+        assert "'children.*hospital.*los angeles': cubic backtracking" in out
+
+
+class TestRE2Engine:
+
+    def test_compatibility(self):
+        pytest.importorskip("re2")
+        assert categorize.re2_compatible(r"led.*\d+w|bulb.*led")
+        for pattern in (r"(?<=a)b", r"(a)\1", "a{,3}", "[[:alpha:]]", "café"):
+            assert not categorize.re2_compatible(pattern), pattern
+
+    def test_keyword_matcher_matches_re(self, keyword_rules):
+        pytest.importorskip("re2")
+        patterns = [r["pattern"] for r in keyword_rules.get("rules", [])] + [r"(a)\1", "tab\there"]
+        texts = _sample_texts(patterns) + ["aa", "tab\there", "x" * 2000 + " led 40w"]
+        expected, got = RuleMatcher(patterns), RuleMatcher(patterns, engine="re2")
+        assert got.first_match(texts).tolist() == expected.first_match(texts).tolist()
+        assert (got.matching_rules(texts) == expected.matching_rules(texts)).all()
+
+    def test_scoped_matcher_matches_re(self, refinement):
+        pytest.importorskip("re2")
+        rules = refinement["supplier_rules"]
+        patterns = [r["supplier_pattern"] for r in rules]
+        scopes = [r["sc_codes"] for r in rules]
+        texts = _sample_texts(patterns)
+        sc_codes = sorted({str(sc) for s in scopes for sc in s})
+        pairs = [(t, sc) for sc in sc_codes[:20] for t in texts]
+        args = [t for t, _ in pairs], [sc for _, sc in pairs]
+        expected = RuleMatcher(patterns, scopes).first_match(*args)
+        assert RuleMatcher(patterns, scopes, engine="re2").first_match(*args).tolist() == expected.tolist()
+
+    def test_pipeline_output_is_identical(self, client_copy, tmp_path):
+        pytest.importorskip("re2")
+        root = client_copy()
+        expected = _run_files(root, tmp_path / "re", output_format="csv")
+        config = yaml.safe_load((root / "config.yaml").read_text())
+        config["classification"]["regex_engine"] = "re2"
+        (root / "config.yaml").write_text(yaml.safe_dump(config, sort_keys=False))
+        for workers in (None, 2):
+            got = _run_files(root, tmp_path / f"re2_{workers}", output_format="csv", workers=workers)
+            for name, path in expected.items():
+                assert got[name].read_bytes() == path.read_bytes(), name
+
+    def test_unknown_engine_is_rejected(self, client_copy):
+        root = client_copy(edit=lambda config: config["classification"].update(regex_engine="pcre"))
+        with pytest.raises(categorize.ConfigError, match="regex_engine 'pcre'"):
+            categorize.load_config(str(root / "config.yaml"))